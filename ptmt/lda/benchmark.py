@@ -0,0 +1,108 @@
+# Copyright 2024 Felix Engl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import typing
+
+import numpy as np
+
+from ptmt.lda.topic_model import SimpleTopicModel
+
+"""
+Benchmarks for the batch word probability and per word topic APIs of SimpleTopicModel.
+The legacy implementations are the per word loops the batch APIs replaced.
+Run with: python -m ptmt.lda.benchmark
+"""
+
+
+def _legacy_word_probability(model: SimpleTopicModel, word: str | int,
+                             min_probability: float = 1E-10) -> list[tuple[int, float]]:
+    if isinstance(word, str):
+        word = model.word2id[word]
+    values: list[tuple[int, float]] = []
+    for topic_id in range(model.k):
+        prob = float(model.topics[topic_id][word])
+        if prob >= min_probability:
+            values.append((topic_id, prob))
+    return values
+
+
+def _legacy_per_word_topics(model: SimpleTopicModel, bow: list[tuple[int, int]], phis: np.ndarray,
+                            minimum_phi_value: float = 1E-10):
+    word_topic: list[tuple[int, list[int]]] = []
+    word_phi: list[tuple[int, list[tuple[int, float]]]] = []
+    for word_type, weight in bow:
+        phi_values: list[tuple[float, int]] = []
+        phi_topic: list[tuple[int, float]] = []
+        for topic_id in range(model.k):
+            _v = float(phis[topic_id][word_type])
+            if _v >= minimum_phi_value:
+                phi_values.append((_v, topic_id))
+                phi_topic.append((topic_id, _v))
+        word_phi.append((word_type, phi_topic))
+        word_topic.append((word_type, [x[1] for x in sorted(phi_values, reverse=True)]))
+    return word_topic, word_phi
+
+
+def _measure(func: typing.Callable[[], typing.Any], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def create_model(k: int = 50, vocabulary_size: int = 50000, seed: int = 1234) -> SimpleTopicModel:
+    rng = np.random.default_rng(seed)
+    topics = rng.dirichlet(np.full(vocabulary_size, 0.05), size=k).astype(np.float32)
+    model = SimpleTopicModel(
+        vocabulary=tuple(f"word{i}" for i in range(vocabulary_size)),
+        topics=topics,
+        term_frequency=rng.integers(1, 100, vocabulary_size),
+        doc_lengths=np.array([1]),
+    )
+    model.prepare_inference(alpha=1.0 / k)
+    model.random_state = np.random.RandomState(seed)
+    return model
+
+
+def benchmark(doc_length: int = 10000, k: int = 50, vocabulary_size: int = 50000,
+              repeat: int = 3, seed: int = 1234) -> dict[str, tuple[float, float]]:
+    """
+    Returns (legacy seconds, batch seconds) for every benchmarked API with a document of doc_length tokens.
+    """
+    model = create_model(k, vocabulary_size, seed)
+    rng = np.random.default_rng(seed)
+    doc = [f"word{i}" for i in rng.integers(0, vocabulary_size, doc_length)]
+    results: dict[str, tuple[float, float]] = {}
+
+    results['word probabilities'] = (
+        _measure(lambda: [_legacy_word_probability(model, word) for word in doc], repeat),
+        _measure(lambda: model.get_word_probabilities(doc), repeat),
+    )
+
+    bow, _ = model.doc2bow(doc)
+    _, phis = model.inference([bow], collect_sstats=True)
+    word_ids = np.array([word_type for word_type, _ in bow], dtype=np.int64)
+    results['per word topics'] = (
+        _measure(lambda: _legacy_per_word_topics(model, bow, phis), repeat),
+        _measure(lambda: model._word_topics(phis, word_ids, 1E-10), repeat),
+    )
+    return results
+
+
+if __name__ == '__main__':
+    for name, (legacy, batch) in benchmark().items():
+        print(f'{name:>20}: legacy {legacy:.4f}s, batch {batch:.4f}s, speedup {legacy / batch:.1f}x')
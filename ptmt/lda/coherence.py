@@ -0,0 +1,565 @@
+# Copyright 2024 Felix Engl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import dataclasses
+import itertools
+import typing
+
+import gensim
+import numpy as np
+import numpy.typing as npt
+import scipy.sparse as sps
+
+from ptmt.lda.topic_model import CoherenceModelData
+
+"""
+A coherence engine that scores the topics of many models against the same reference corpus.
+
+The union of the top-N words of all models is collected first, then a single pass over the corpus counts the
+document-level and the sliding-window (co-)occurrences of these words into sparse matrices. Every supported
+measure of every model is computed from these counts. The values are the same as the ones of
+gensim.models.CoherenceModel, this includes the way gensim slides its windows: a word that leaves a window is
+marked as absent even if it occurs again in the window, until it enters the window again.
+"""
+
+CoherenceMeasure = typing.Literal['u_mass', 'c_v', 'c_uci', 'c_npmi']
+
+SUPPORTED_MEASURES: tuple[CoherenceMeasure, ...] = typing.get_args(CoherenceMeasure)
+
+SLIDING_WINDOW_SIZES: dict[CoherenceMeasure, int] = {'c_v': 110, 'c_uci': 10, 'c_npmi': 10}
+"""The default window sizes of gensim."""
+
+_EPSILON = 1e-12
+
+_DOCUMENT = 0
+"""The key of the document-level counts, a document is a single window."""
+
+
+_RawCounts = tuple[int, npt.NDArray[np.int64], npt.NDArray[np.int64]]
+"""(number of documents or windows, occurrences, counts of the pair keys)"""
+
+
+@dataclasses.dataclass(slots=True)
+class CoOccurrenceCounts:
+    num_docs: int
+    """The number of documents or windows."""
+    co_occurrences: sps.csr_matrix
+    """Symmetric counts over the relevant words, the diagonal contains the occurrences."""
+
+    @property
+    def occurrences(self) -> npt.NDArray[np.int64]:
+        return self.co_occurrences.diagonal()
+
+
+def _pair_keys(topics: typing.Iterable[npt.NDArray[np.int64]], size: int) -> npt.NDArray[np.int64]:
+    """The sorted keys a * size + b with a < b of all word pairs in the topics."""
+    keys = []
+    for topic in topics:
+        a, b = np.meshgrid(topic, topic, indexing='ij')
+        a, b = a.reshape(-1), b.reshape(-1)
+        mask = a < b
+        keys.append(a[mask] * size + b[mask])
+    if not keys:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(np.concatenate(keys))
+
+
+def _window_intervals(
+        doc: npt.NDArray[np.int64],
+        pos: npt.NDArray[np.int64],
+        word: npt.NDArray[np.int64],
+        doc_lengths: npt.NDArray[np.int64],
+        window_size: int | None
+) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64], npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """
+    Converts the occurrences, sorted by (doc, word, pos), to the intervals [start, end) of the windows
+    where gensim marks the word as present. The windows are numbered over all documents.
+    Returns (word, start, end, number of windows per document). window_size None counts documents.
+    """
+    if window_size is None:
+        windows = np.ones(len(doc_lengths), dtype=np.int64)
+        first = np.ones(len(doc), dtype=bool)
+        first[1:] = (doc[1:] != doc[:-1]) | (word[1:] != word[:-1])
+        start = np.zeros(int(first.sum()), dtype=np.int64)
+        end = np.ones_like(start)
+        doc, word = doc[first], word[first]
+    else:
+        windows = np.maximum(doc_lengths - window_size + 1, 1)
+        same = np.zeros(len(doc), dtype=bool)
+        same[1:] = (doc[1:] == doc[:-1]) & (word[1:] == word[:-1])
+        enter = np.maximum(pos - window_size + 1, 0)
+        leave = pos + 1
+        no_limit = np.iinfo(np.int64).max
+        next_enter = np.full(len(doc), no_limit, dtype=np.int64)
+        next_enter[:-1][same[1:]] = enter[1:][same[1:]]
+        # The first leave of an earlier occurrence of the same word after the enter marks the word as absent.
+        group = np.cumsum(~same)
+        scale = int(doc_lengths.max(initial=0)) + 2
+        first_leave = np.searchsorted(group * scale + leave, group * scale + enter, side='right')
+        earlier_leave = np.full(len(doc), no_limit, dtype=np.int64)
+        earlier = first_leave < np.arange(len(doc))
+        earlier_leave[earlier] = leave[first_leave[earlier]]
+        start = enter
+        end = np.minimum(np.minimum(next_enter, leave), np.minimum(earlier_leave, windows[doc]))
+    offsets = np.zeros(len(windows), dtype=np.int64)
+    np.cumsum(windows[:-1], out=offsets[1:])
+    mask = end > start
+    return word[mask], (start + offsets[doc])[mask], (end + offsets[doc])[mask], windows
+
+
+class ApproximateCoherence(float):
+    """
+    A coherence estimated from a sample of the reference corpus, with the bootstrap confidence interval [low, high].
+    """
+
+    def __new__(cls, value: float, low: float, high: float, confidence: float, sample_size: int, num_docs: int):
+        self = super().__new__(cls, value)
+        self.low = low
+        self.high = high
+        self.confidence = confidence
+        self.sample_size = sample_size
+        """The number of sampled documents."""
+        self.num_docs = num_docs
+        """The number of documents of the reference corpus."""
+        return self
+
+    @property
+    def width(self) -> float:
+        return self.high - self.low
+
+    def __reduce__(self):
+        return ApproximateCoherence, (float(self), self.low, self.high, self.confidence, self.sample_size, self.num_docs)
+
+    def __repr__(self) -> str:
+        return (f'ApproximateCoherence({float(self)!r}, low={self.low!r}, high={self.high!r}, '
+                f'confidence={self.confidence!r}, sample_size={self.sample_size}, num_docs={self.num_docs})')
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class Approximation:
+    """
+    Estimates the coherences from a reproducible random sample of sample_size documents.
+    The sample is split into blocks of block_size documents, the confidence interval is a basic bootstrap over
+    these blocks with a finite population correction, replicates that are not finite are ignored.
+    If target_width is set, the sample is doubled until the intervals of all coherences are
+    narrower than target_width or max_sample_size (by default the whole corpus) is reached.
+    """
+    sample_size: int = 10000
+    target_width: float | None = None
+    max_sample_size: int | None = None
+    block_size: int = 100
+    max_blocks: int = 256
+    bootstraps: int = 200
+    confidence: float = 0.95
+    seed: int = 1234
+
+    def __post_init__(self):
+        if self.sample_size <= 0 or self.block_size <= 0 or self.bootstraps <= 0:
+            raise ValueError("The sample size, block size and number of bootstraps have to be positive!")
+        if not 0 < self.confidence < 1:
+            raise ValueError(f"The confidence {self.confidence} is not in (0, 1)!")
+
+
+class CoherenceEngine:
+    """
+    Computes the coherences of several models on the same reference corpus with a single pass over it.
+    topics maps the name of a model to its topics, every topic is a list of words sorted by relevance.
+    The topics are prepared like gensim does: words unknown to the dictionary are removed and the topics
+    are cut to topn words. window_size overrides the sliding window size of all sliding window measures.
+    """
+
+    def __init__(
+            self,
+            texts: typing.Sequence[typing.Sequence[str]],
+            dictionary: gensim.corpora.Dictionary,
+            topics: typing.Mapping[str, typing.Sequence[typing.Sequence[str]]],
+            topn: int = 20,
+            window_size: int | None = None,
+            measures: typing.Iterable[CoherenceMeasure] = SUPPORTED_MEASURES,
+            batch_tokens: int = 1 << 22,
+            max_pairs: int = 1 << 24,
+    ):
+        self.measures: tuple[CoherenceMeasure, ...] = tuple(measures)
+        for measure in self.measures:
+            if measure not in SUPPORTED_MEASURES:
+                raise ValueError(f"{measure} is not supported, use one of {SUPPORTED_MEASURES}!")
+        self.texts = texts
+        self.dictionary = dictionary
+        self.topn = topn
+        self.window_size = window_size
+        self.batch_tokens = batch_tokens
+        self.max_pairs = max_pairs
+
+        prepared = {name: self._prepare_topics(model_topics) for name, model_topics in topics.items()}
+        relevant = np.unique(np.concatenate(
+            [topic for model_topics in prepared.values() for topic in model_topics] or [np.zeros(0, dtype=np.int64)]
+        ))
+        self.relevant_ids: npt.NDArray[np.int64] = relevant
+        """The dictionary ids of the relevant words, the counts are indexed by the position in this array."""
+        self.topics: dict[str, list[npt.NDArray[np.int64]]] = {
+            name: [np.searchsorted(relevant, topic) for topic in model_topics]
+            for name, model_topics in prepared.items()
+        }
+        self._raw_counts: dict[int, _RawCounts] | None = None
+        self._keys: npt.NDArray[np.int64] | None = None
+        self._word2relevant: dict[str, int] | None = None
+
+    def _prepare_topics(self, topics: typing.Sequence[typing.Sequence[str]]) -> list[npt.NDArray[np.int64]]:
+        token2id = self.dictionary.token2id
+        prepared = []
+        for topic in topics:
+            ids = [token2id[word] for word in topic if word in token2id]
+            if not ids:
+                raise ValueError('unable to interpret topic as either a list of tokens or a list of ids')
+            prepared.append(np.array(ids, dtype=np.int64))
+        if prepared and len(prepared[0]) > self.topn:
+            prepared = [topic[:self.topn] for topic in prepared]
+        return prepared
+
+    def _window_size_of(self, measure: CoherenceMeasure) -> int:
+        """The key of the counts of a measure."""
+        if measure == 'u_mass':
+            return _DOCUMENT
+        return self.window_size if self.window_size is not None else SLIDING_WINDOW_SIZES[measure]
+
+    @property
+    def window_sizes(self) -> list[int]:
+        return sorted({self._window_size_of(measure) for measure in self.measures})
+
+    @property
+    def counts(self) -> dict[int, CoOccurrenceCounts]:
+        """
+        The counts of the whole corpus by window size, the document-level counts have the key 0.
+        """
+        return self._to_counts(self.raw_counts)
+
+    @property
+    def raw_counts(self) -> dict[int, _RawCounts]:
+        if self._raw_counts is None:
+            self._raw_counts = self._accumulate()
+        return self._raw_counts
+
+    def _prepare_counting(self):
+        if self._keys is None:
+            self._keys = _pair_keys(itertools.chain.from_iterable(self.topics.values()), len(self.relevant_ids))
+            self._word2relevant = {
+                self.dictionary[int(word_id)]: i for i, word_id in enumerate(self.relevant_ids)
+            }
+
+    def _iter_batches(self, texts: typing.Iterable[typing.Sequence[str]]) -> typing.Iterator[list[typing.Sequence[str]]]:
+        texts = iter(texts)
+        while True:
+            batch = []
+            tokens = 0
+            for text in texts:
+                batch.append(text)
+                tokens += len(text)
+                if tokens >= self.batch_tokens:
+                    break
+            if not batch:
+                return
+            yield batch
+
+    def _count_batch(self, batch: list[typing.Sequence[str]]) -> dict[int, _RawCounts]:
+        """
+        Counts the documents of the batch, returns (num_docs, occurrences, pair counts) by window size.
+        """
+        self._prepare_counting()
+        size = len(self.relevant_ids)
+        doc_lengths = np.fromiter((len(text) for text in batch), dtype=np.int64, count=len(batch))
+        tokens = int(doc_lengths.sum())
+        ids = np.fromiter(
+            (self._word2relevant.get(word, -1) for word in itertools.chain.from_iterable(batch)),
+            dtype=np.int64, count=tokens
+        )
+        doc = np.repeat(np.arange(len(batch), dtype=np.int64), doc_lengths)
+        doc_starts = np.zeros(len(batch), dtype=np.int64)
+        np.cumsum(doc_lengths[:-1], out=doc_starts[1:])
+        pos = np.arange(tokens, dtype=np.int64) - doc_starts[doc]
+        found = ids >= 0
+        doc, pos, word = doc[found], pos[found], ids[found]
+        order = np.lexsort((pos, word, doc))
+        doc, pos, word = doc[order], pos[order], word[order]
+
+        result = {}
+        for window_size in self.window_sizes:
+            word_i, start, end, windows = _window_intervals(
+                doc, pos, word, doc_lengths, window_size if window_size != _DOCUMENT else None
+            )
+            pair_counts = np.zeros(len(self._keys), dtype=np.int64)
+            self._count_pairs(word_i, start, end, self._keys, size, pair_counts)
+            result[window_size] = (
+                int(windows.sum()),
+                np.bincount(word_i, weights=end - start, minlength=size).astype(np.int64),
+                pair_counts
+            )
+        return result
+
+    def _to_counts(self, raw: dict[int, _RawCounts]) -> dict[int, CoOccurrenceCounts]:
+        self._prepare_counting()
+        size = len(self.relevant_ids)
+        result = {}
+        for window_size, (num_docs, occurrences, pair_counts) in raw.items():
+            mask = pair_counts > 0
+            a, b = np.divmod(self._keys[mask], size)
+            values = pair_counts[mask]
+            diagonal = np.arange(size, dtype=np.int64)
+            co_occurrences = sps.csr_matrix(
+                (
+                    np.concatenate([values, values, occurrences]),
+                    (np.concatenate([a, b, diagonal]), np.concatenate([b, a, diagonal]))
+                ),
+                shape=(size, size),
+                dtype=np.int64
+            )
+            result[window_size] = CoOccurrenceCounts(num_docs, co_occurrences)
+        return result
+
+    def _accumulate(self) -> dict[int, _RawCounts]:
+        total: dict[int, _RawCounts] | None = None
+        processed = 0
+        for batch in self._iter_batches(self.texts):
+            counted = self._count_batch(batch)
+            if total is None:
+                total = counted
+            else:
+                total = {
+                    window_size: tuple(x + y for x, y in zip(total[window_size], values))
+                    for window_size, values in counted.items()
+                }
+            processed += len(batch)
+            print(f'  Counted co-occurrences in {processed} documents.')
+        if total is None:
+            total = self._count_batch([])
+        return total
+
+    def _count_pairs(
+            self,
+            word: npt.NDArray[np.int64],
+            start: npt.NDArray[np.int64],
+            end: npt.NDArray[np.int64],
+            keys: npt.NDArray[np.int64],
+            size: int,
+            target: npt.NDArray[np.int64]
+    ):
+        """
+        Adds the overlap of every pair of intervals to the count of the word pair, if the pair is in keys.
+        """
+        if len(keys) == 0 or len(word) == 0:
+            return
+        order = np.argsort(start, kind='stable')
+        word, start, end = word[order], start[order], end[order]
+        upper = np.searchsorted(start, end, side='left')
+        candidates = np.maximum(upper - np.arange(len(start)) - 1, 0)
+        total = np.cumsum(candidates)
+        first = 0
+        while first < len(start):
+            limit = (total[first - 1] if first > 0 else 0) + self.max_pairs
+            last = max(int(np.searchsorted(total, limit, side='right')), first + 1)
+            counts = candidates[first:last]
+            left = np.repeat(np.arange(first, last, dtype=np.int64), counts)
+            if len(left) > 0:
+                group_starts = np.cumsum(counts) - counts
+                right = left + 1 + np.arange(len(left), dtype=np.int64) - np.repeat(group_starts, counts)
+                overlap = np.minimum(end[left], end[right]) - start[right]
+                a, b = word[left], word[right]
+                pair = np.minimum(a, b) * size + np.maximum(a, b)
+                index = np.searchsorted(keys, pair)
+                index[index == len(keys)] = 0
+                valid = (keys[index] == pair) & (a != b)
+                target += np.bincount(index[valid], weights=overlap[valid], minlength=len(keys)).astype(np.int64)
+            first = last
+
+    def _topic_pairs(self, topic: npt.NDArray[np.int64]) -> npt.NDArray[np.int64]:
+        """The positions of the word pairs of the topic in the pair keys, the diagonal is -1."""
+        self._prepare_counting()
+        size = len(self.relevant_ids)
+        a, b = np.meshgrid(topic, topic, indexing='ij')
+        index = np.searchsorted(self._keys, np.minimum(a, b) * size + np.maximum(a, b))
+        np.fill_diagonal(index, -1)
+        return index
+
+    @staticmethod
+    def _log_ratio(co: npt.NDArray[np.float64], occurrences: npt.NDArray[np.float64],
+                   num_docs: npt.NDArray[np.float64], normalize: bool) -> npt.NDArray[np.float64]:
+        """
+        A pair with a word that does not occur is 0, like gensim handles the ZeroDivisionError of u_mass.
+        This only happens in samples, every word of the dictionary occurs in the reference corpus.
+        """
+        p = occurrences / num_docs[:, None]
+        denominator = p[:, :, None] * p[:, None, :]
+        value = np.log((co / num_docs[:, None, None] + _EPSILON) / denominator)
+        value[denominator == 0] = 0.0
+        if normalize:
+            value = value / -np.log(co / num_docs[:, None, None] + _EPSILON)
+        return value
+
+    def _topic_coherence(
+            self,
+            measure: CoherenceMeasure,
+            topic: npt.NDArray[np.int64],
+            num_docs: npt.NDArray[np.float64],
+            occurrences: npt.NDArray[np.float64],
+            pair_counts: npt.NDArray[np.float64]
+    ) -> npt.NDArray[np.float64]:
+        """
+        The coherence of the topic for every row of the counts, the rows are e.g. bootstrap replicates.
+        """
+        n = len(topic)
+        index = self._topic_pairs(topic)
+        co = pair_counts[:, np.maximum(index, 0)]
+        topic_occurrences = occurrences[:, topic]
+        diagonal = np.arange(n)
+        co[:, diagonal, diagonal] = topic_occurrences
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if measure == 'u_mass':
+                w_prime, w_star = np.tril_indices(n, -1)
+                star = topic_occurrences[:, w_star]
+                values = np.log(
+                    (co[:, w_prime, w_star] / num_docs[:, None] + _EPSILON) / (star / num_docs[:, None])
+                )
+                values[star == 0] = 0.0
+            elif measure == 'c_v':
+                npmi = self._log_ratio(co, topic_occurrences, num_docs, True)
+                topic_vector = npmi.sum(axis=1)
+                norms = np.linalg.norm(npmi, axis=2) * np.linalg.norm(topic_vector, axis=1)[:, None]
+                values = np.divide(
+                    np.einsum('rij,rj->ri', npmi, topic_vector), norms,
+                    out=np.zeros_like(norms), where=norms > 0
+                )
+            else:
+                values = self._log_ratio(co, topic_occurrences, num_docs, measure == 'c_npmi')
+                values = values[:, ~np.eye(n, dtype=bool)]
+            if values.shape[1] == 0:
+                return np.full(len(num_docs), np.nan)
+            return values.mean(axis=1)
+
+    def _coherences(self, name: str, measure: CoherenceMeasure,
+                    raw: dict[int, _RawCounts]) -> npt.NDArray[np.float64]:
+        """The coherences of the topics, shape (topics, rows of the counts)."""
+        if measure not in self.measures:
+            raise ValueError(f"The engine does not count the co-occurrences for {measure}!")
+        num_docs, occurrences, pair_counts = raw[self._window_size_of(measure)]
+        num_docs = np.atleast_1d(np.asarray(num_docs, dtype=np.float64))
+        occurrences = np.atleast_2d(occurrences).astype(np.float64)
+        pair_counts = np.atleast_2d(pair_counts).astype(np.float64)
+        return np.array([
+            self._topic_coherence(measure, topic, num_docs, occurrences, pair_counts) for topic in self.topics[name]
+        ]).reshape(len(self.topics[name]), len(num_docs))
+
+    def coherence_per_topic(self, name: str, measure: CoherenceMeasure) -> list[float]:
+        return self._coherences(name, measure, self.raw_counts)[:, 0].tolist()
+
+    def coherence(self, name: str, measure: CoherenceMeasure) -> float:
+        return float(np.mean(self.coherence_per_topic(name, measure)))
+
+    def calculate(self) -> dict[str, dict[CoherenceMeasure, float]]:
+        """
+        Returns the coherences of all models by model name and measure.
+        """
+        return {name: {measure: self.coherence(name, measure) for measure in self.measures} for name in self.topics}
+
+    def estimate(
+            self,
+            approximation: Approximation = Approximation()
+    ) -> dict[str, dict[CoherenceMeasure, ApproximateCoherence]]:
+        """
+        Returns the estimated coherences of all models by model name and measure, see Approximation.
+        A pair with a top word that does not occur in the sample scores 0, see _log_ratio.
+        """
+        rng = np.random.default_rng(approximation.seed)
+        order = rng.permutation(len(self.texts))
+        limit = len(order) if approximation.max_sample_size is None \
+            else min(approximation.max_sample_size, len(order))
+        sample_size = min(approximation.sample_size, limit)
+        blocks: list[dict[int, _RawCounts]] = []
+        sampled = 0
+        while True:
+            for first in range(sampled, sample_size, approximation.block_size):
+                indices = order[first:min(first + approximation.block_size, sample_size)]
+                blocks.append(self._count_batch([self.texts[i] for i in indices]))
+            sampled = sample_size
+            while len(blocks) > approximation.max_blocks:
+                # Merging neighbours keeps the blocks independent and bounds the cost of the bootstrap.
+                blocks = [self._stack(blocks[i:i + 2], True) for i in range(0, len(blocks), 2)]
+            result = self._bootstrap(blocks, approximation, rng, sampled)
+            print(f'  Estimated the coherences with {sampled} of {len(order)} documents.')
+            if approximation.target_width is None or sampled >= limit:
+                return result
+            # A width that is not finite is never narrow enough.
+            if all(value.width <= approximation.target_width for values in result.values() for value in values.values()):
+                return result
+            sample_size = min(2 * sampled, limit)
+
+    @staticmethod
+    def _stack(raws: list[dict[int, _RawCounts]], reduce: bool = False) -> dict[int, _RawCounts]:
+        """Stacks the counts to rows or sums them if reduce is set."""
+        combine = (lambda values: np.sum(values, axis=0)) if reduce else np.stack
+        return {
+            window_size: (
+                combine([raw[window_size][0] for raw in raws]),
+                combine([raw[window_size][1] for raw in raws]),
+                combine([raw[window_size][2] for raw in raws]),
+            )
+            for window_size in raws[0]
+        }
+
+    def _bootstrap(
+            self,
+            blocks: list[dict[int, _RawCounts]],
+            approximation: Approximation,
+            rng: np.random.Generator,
+            sample_size: int
+    ) -> dict[str, dict[CoherenceMeasure, ApproximateCoherence]]:
+        stacked = self._stack(blocks)
+        weights = rng.multinomial(len(blocks), np.full(len(blocks), 1 / len(blocks)), size=approximation.bootstraps)
+        # The first row is the whole sample, the point estimate.
+        weights = np.vstack([np.ones(len(blocks)), weights]).astype(np.float64)
+        replicates = {
+            window_size: tuple(weights @ np.asarray(values, dtype=np.float64).reshape(len(blocks), -1)
+                               for values in counts)
+            for window_size, counts in stacked.items()
+        }
+        tail = 100 * (1 - approximation.confidence) / 2
+        # The sample is drawn without replacement, a sample of the whole corpus has no sampling error.
+        correction = np.sqrt(1 - sample_size / len(self.texts)) if len(self.texts) > 0 else 0.0
+        result: dict[str, dict[CoherenceMeasure, ApproximateCoherence]] = {name: {} for name in self.topics}
+        for name in self.topics:
+            for measure in self.measures:
+                values = self._coherences(name, measure, {
+                    window_size: (num_docs.reshape(-1), occurrences, pair_counts)
+                    for window_size, (num_docs, occurrences, pair_counts) in replicates.items()
+                }).mean(axis=0)
+                point = values[0]
+                replicates_finite = values[1:][np.isfinite(values[1:])]
+                if np.isfinite(point) and len(replicates_finite) > 0:
+                    # The basic bootstrap interval, it reflects the bias of the replicates around the estimate.
+                    high, low = point - correction * (np.percentile(replicates_finite, [tail, 100 - tail]) - point)
+                else:
+                    low = high = np.nan
+                result[name][measure] = ApproximateCoherence(
+                    float(point), float(low), float(high), approximation.confidence, sample_size, len(self.texts)
+                )
+        return result
+
+    @classmethod
+    def from_data(
+            cls,
+            data: CoherenceModelData,
+            topics: typing.Mapping[str, typing.Sequence[typing.Sequence[str]]],
+            topn: int = 20,
+            window_size: int | None = None,
+            measures: typing.Iterable[CoherenceMeasure] = SUPPORTED_MEASURES,
+    ) -> 'CoherenceEngine':
+        return cls(data.corpus_texts, data.dictionary, topics, topn, window_size, measures)
@@ -0,0 +1,201 @@
+# Copyright 2024 Felix Engl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import typing
+
+import numpy as np
+import numpy.typing as npt
+
+# noinspection PyProtectedMember
+from gensim._matutils import dirichlet_expectation
+
+"""
+Batched variational E-step for topic models with fixed topics.
+
+The documents are stored like a CSR matrix (indptr, indices, data). Documents with a similar number of
+unique words are grouped into chunks, every chunk is padded to a dense (documents x words) block and
+the E-step runs for the whole block at once. Documents are removed from the block as soon as they converge.
+"""
+
+DEFAULT_CHUNK_SIZE = 256
+DEFAULT_MAX_CHUNK_ELEMENTS = 2 ** 24
+
+
+def pack_bows(
+        chunk: typing.Sequence[typing.Sequence[tuple[int, int]]],
+        dtype=np.float32
+) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64], npt.NDArray[np.floating]]:
+    """
+    Converts a list of bows into the CSR arrays (indptr, indices, data).
+    """
+    indptr = np.zeros(len(chunk) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter((len(doc) for doc in chunk), dtype=np.int64, count=len(chunk)), out=indptr[1:])
+    if indptr[-1] == 0:
+        return indptr, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=dtype)
+    flat = np.concatenate([np.asarray(doc, dtype=np.float64).reshape(-1, 2) for doc in chunk])
+    return indptr, flat[:, 0].astype(np.int64), flat[:, 1].astype(dtype)
+
+
+def plan_chunks(
+        indptr: npt.NDArray[np.integer],
+        k: int,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_chunk_elements: int = DEFAULT_MAX_CHUNK_ELEMENTS
+) -> list[npt.NDArray[np.intp]]:
+    """
+    Groups the documents by their number of unique words.
+    A chunk has at most chunk_size documents and (documents x longest document x k) stays below
+    max_chunk_elements, unless a single document is already bigger.
+    """
+    assert chunk_size > 0, "The chunk size has to be positive!"
+    lengths = np.diff(indptr)
+    order = np.argsort(lengths, kind='stable')
+    chunks: list[npt.NDArray[np.intp]] = []
+    start = 0
+    for i in range(len(order)):
+        width = max(1, int(lengths[order[i]]))
+        size = i - start + 1
+        if i > start and (size > chunk_size or size * width * k > max_chunk_elements):
+            chunks.append(order[start:i])
+            start = i
+    if start < len(order):
+        chunks.append(order[start:])
+    return chunks
+
+
+def _phinorm(
+        exp_e_log_theta: npt.NDArray[np.floating],
+        beta: npt.NDArray[np.floating],
+        epsilon: float
+) -> npt.NDArray[np.floating]:
+    return np.matmul(exp_e_log_theta[:, None, :], beta)[:, 0, :] + epsilon
+
+
+def infer_chunk(
+        exp_e_log_beta: npt.NDArray[np.floating],
+        alpha: float | npt.NDArray[np.floating],
+        indptr: npt.NDArray[np.integer],
+        indices: npt.NDArray[np.integer],
+        data: npt.NDArray[np.floating],
+        docs: npt.NDArray[np.intp],
+        gamma: npt.NDArray[np.floating],
+        iterations: int,
+        gamma_threshold: float,
+        collect_sstats: bool
+) -> tuple[npt.NDArray[np.floating], npt.NDArray[np.int64] | None, npt.NDArray[np.floating] | None]:
+    """
+    Runs the E-step for the documents docs, gamma contains the initial gamma of these documents.
+    Returns the gamma of the documents and, if collect_sstats is set, the word ids of the chunk and
+    the sufficient statistics for these ids (not yet multiplied with exp_e_log_beta).
+    """
+    dtype = exp_e_log_beta.dtype
+    k = exp_e_log_beta.shape[0]
+    epsilon = np.finfo(dtype).eps
+    # np.asarray(None, dtype) is nan, the inference would return nan without an error.
+    assert alpha is not None, "The inference needs an alpha, see SimpleTopicModel.prepare_inference!"
+    alpha = np.asarray(alpha, dtype=dtype)
+
+    lengths = indptr[docs + 1] - indptr[docs]
+    width = max(1, int(lengths.max(initial=0)))
+    mask = np.arange(width) < lengths[:, None]
+    src = np.repeat(indptr[docs] - (np.cumsum(lengths) - lengths), lengths) + np.arange(int(lengths.sum()))
+    ids = np.zeros((len(docs), width), dtype=np.int64)
+    cts = np.zeros((len(docs), width), dtype=dtype)
+    ids[mask] = indices[src]
+    cts[mask] = data[src]
+    del mask, src
+
+    if collect_sstats:
+        uids, columns = np.unique(ids, return_inverse=True)
+        columns = columns.reshape(ids.shape)
+        sstats = np.zeros((k, len(uids)), dtype=dtype)
+    else:
+        uids, columns, sstats = None, None, None
+
+    # (documents, k, words), the padded words have a count of 0 and do not contribute.
+    beta = np.ascontiguousarray(exp_e_log_beta[:, ids].transpose(1, 0, 2))
+    del ids
+
+    result = np.empty((len(docs), k), dtype=dtype)
+    active = np.arange(len(docs))
+    gamma_c = np.ascontiguousarray(gamma, dtype=dtype)
+    exp_e_log_theta = np.exp(dirichlet_expectation(gamma_c))
+    phinorm = _phinorm(exp_e_log_theta, beta, epsilon)
+
+    def finish(rows: npt.NDArray[np.bool_] | slice):
+        result[active[rows]] = gamma_c[rows]
+        if collect_sstats:
+            # Contribution of the documents to the expected sufficient statistics for the M step.
+            contribution = exp_e_log_theta[rows].T[:, :, None] * (cts[rows] / phinorm[rows])[None, :, :]
+            np.add.at(sstats, (slice(None), columns[rows].ravel()), contribution.reshape(k, -1))
+
+    for _ in range(iterations):
+        lastgamma = gamma_c
+        gamma_c = alpha + exp_e_log_theta * np.matmul(beta, (cts / phinorm)[:, :, None])[:, :, 0]
+        exp_e_log_theta = np.exp(dirichlet_expectation(gamma_c))
+        phinorm = _phinorm(exp_e_log_theta, beta, epsilon)
+        converged = np.mean(np.abs(gamma_c - lastgamma), axis=1) < gamma_threshold
+        if converged.any():
+            finish(converged)
+            keep = ~converged
+            active = active[keep]
+            if len(active) == 0:
+                break
+            gamma_c = gamma_c[keep]
+            exp_e_log_theta = exp_e_log_theta[keep]
+            phinorm = phinorm[keep]
+            cts = cts[keep]
+            beta = beta[keep]
+            if collect_sstats:
+                columns = columns[keep]
+    else:
+        if len(active) > 0:
+            finish(slice(None))
+
+    return result, uids, sstats
+
+
+def batched_inference(
+        exp_e_log_beta: npt.NDArray[np.floating],
+        alpha: float | npt.NDArray[np.floating],
+        indptr: npt.NDArray[np.integer],
+        indices: npt.NDArray[np.integer],
+        data: npt.NDArray[np.floating],
+        gamma: npt.NDArray[np.floating],
+        collect_sstats: bool = False,
+        iterations: int = 1000,
+        gamma_threshold: float = 0.0001,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_chunk_elements: int = DEFAULT_MAX_CHUNK_ELEMENTS
+) -> tuple[npt.NDArray[np.floating], npt.NDArray[np.floating] | None]:
+    """
+    Runs the E-step for all documents in the CSR arrays. gamma is the initial gamma with one row per document.
+    Returns the gamma and, if collect_sstats is set, the sufficient statistics like SimpleTopicModel.inference.
+    """
+    gamma = np.array(gamma, dtype=exp_e_log_beta.dtype)
+    sstats = np.zeros(exp_e_log_beta.shape, dtype=exp_e_log_beta.dtype) if collect_sstats else None
+    for docs in plan_chunks(indptr, exp_e_log_beta.shape[0], chunk_size, max_chunk_elements):
+        gamma_chunk, uids, sstats_chunk = infer_chunk(
+            exp_e_log_beta, alpha, indptr, indices, data, docs, gamma[docs],
+            iterations, gamma_threshold, collect_sstats
+        )
+        gamma[docs] = gamma_chunk
+        if collect_sstats:
+            sstats[:, uids] += sstats_chunk
+
+    if collect_sstats:
+        # sstats[k, w] = \sum_d n_{dw} * phi_{dwk}
+        # = \sum_d n_{dw} * exp{Elogtheta_{dk} + Elogbeta_{kw}} / phinorm_{dw}.
+        sstats *= exp_e_log_beta
+    return gamma, sstats
@@ -0,0 +1,174 @@
+# Copyright 2024 Felix Engl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from concurrent.futures import ProcessPoolExecutor, Future, FIRST_EXCEPTION, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+import numpy.typing as npt
+
+from ptmt.lda.inference import plan_chunks, infer_chunk, DEFAULT_CHUNK_SIZE, DEFAULT_MAX_CHUNK_ELEMENTS
+
+"""
+Process parallel version of the batched inference.
+
+The topic matrix (expElogbeta) is published once in a shared memory block, the workers attach to it in the
+pool initializer. The documents are split with the same chunk plan as the serial batched inference and the
+results are merged in the order of the chunks, therefore the results are identical to the serial path.
+"""
+
+
+class InferenceWorkerError(Exception):
+    pass
+
+
+_worker_state: tuple[shared_memory.SharedMemory, npt.NDArray[np.floating], npt.NDArray[np.floating], int, float] | None = None
+
+
+def _init_worker(name: str, shape: tuple[int, int], dtype: str, alpha: npt.NDArray[np.floating],
+                 iterations: int, gamma_threshold: float):
+    global _worker_state
+    shm = shared_memory.SharedMemory(name=name)
+    exp_e_log_beta = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    exp_e_log_beta.flags.writeable = False
+    _worker_state = (shm, exp_e_log_beta, alpha, iterations, gamma_threshold)
+
+
+def _run_chunk(
+        indptr: npt.NDArray[np.int64],
+        indices: npt.NDArray[np.int64],
+        data: npt.NDArray[np.floating],
+        gamma: npt.NDArray[np.floating],
+        collect_sstats: bool
+) -> tuple[npt.NDArray[np.floating], npt.NDArray[np.int64] | None, npt.NDArray[np.floating] | None]:
+    assert _worker_state is not None, "The worker was not initialized!"
+    _, exp_e_log_beta, alpha, iterations, gamma_threshold = _worker_state
+    return infer_chunk(
+        exp_e_log_beta, alpha, indptr, indices, data, np.arange(len(indptr) - 1), gamma,
+        iterations, gamma_threshold, collect_sstats
+    )
+
+
+class ParallelInference:
+    """
+    A worker pool for the batched inference. Use it as a context manager, the shared memory block
+    and the pool live until the context is left and can be used for multiple calls of infer.
+    """
+
+    def __init__(
+            self,
+            exp_e_log_beta: npt.NDArray[np.floating],
+            alpha: float | npt.NDArray[np.floating],
+            workers: int | None = None,
+            iterations: int = 1000,
+            gamma_threshold: float = 0.0001,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            max_chunk_elements: int = DEFAULT_MAX_CHUNK_ELEMENTS
+    ):
+        self.exp_e_log_beta = exp_e_log_beta
+        self.alpha = np.asarray(alpha, dtype=exp_e_log_beta.dtype)
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.iterations = iterations
+        self.gamma_threshold = gamma_threshold
+        self.chunk_size = chunk_size
+        self.max_chunk_elements = max_chunk_elements
+        self._shm: shared_memory.SharedMemory | None = None
+        self._pool: ProcessPoolExecutor | None = None
+
+    def __enter__(self) -> 'ParallelInference':
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, self.exp_e_log_beta.nbytes))
+        try:
+            shared = np.ndarray(self.exp_e_log_beta.shape, dtype=self.exp_e_log_beta.dtype, buffer=self._shm.buf)
+            shared[:] = self.exp_e_log_beta
+            del shared
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(
+                    self._shm.name,
+                    self.exp_e_log_beta.shape,
+                    self.exp_e_log_beta.dtype.str,
+                    self.alpha,
+                    self.iterations,
+                    self.gamma_threshold
+                )
+            )
+        except BaseException:
+            self._release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._release()
+
+    def _release(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def infer(
+            self,
+            indptr: npt.NDArray[np.integer],
+            indices: npt.NDArray[np.integer],
+            data: npt.NDArray[np.floating],
+            gamma: npt.NDArray[np.floating],
+            collect_sstats: bool = False
+    ) -> tuple[npt.NDArray[np.floating], npt.NDArray[np.floating] | None]:
+        """
+        Same as ptmt.lda.inference.batched_inference but the chunks are processed by the workers.
+        gamma is the initial gamma, every chunk gets its slice of it, so the result does not depend on the
+        order in which the workers finish.
+        """
+        assert self._pool is not None, "ParallelInference has to be used as a context manager!"
+        dtype = self.exp_e_log_beta.dtype
+        gamma = np.array(gamma, dtype=dtype)
+        sstats = np.zeros(self.exp_e_log_beta.shape, dtype=dtype) if collect_sstats else None
+
+        chunks = plan_chunks(indptr, self.exp_e_log_beta.shape[0], self.chunk_size, self.max_chunk_elements)
+        futures: list[Future] = []
+        for docs in chunks:
+            starts = indptr[docs]
+            lengths = indptr[docs + 1] - starts
+            sub_indptr = np.zeros(len(docs) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=sub_indptr[1:])
+            src = np.repeat(starts - sub_indptr[:-1], lengths) + np.arange(int(sub_indptr[-1]))
+            futures.append(self._pool.submit(
+                _run_chunk, sub_indptr, indices[src], data[src], gamma[docs], collect_sstats
+            ))
+
+        _, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in not_done:
+            future.cancel()
+
+        # Merge in the order of the chunks, like the serial implementation.
+        for future, docs in zip(futures, chunks):
+            try:
+                gamma_chunk, uids, sstats_chunk = future.result()
+            except BrokenProcessPool as e:
+                raise InferenceWorkerError("A worker of the inference pool died unexpectedly!") from e
+            except Exception as e:
+                raise InferenceWorkerError(f"The inference failed for a chunk with {len(docs)} documents!") from e
+            gamma[docs] = gamma_chunk
+            if collect_sstats:
+                sstats[:, uids] += sstats_chunk
+
+        if collect_sstats:
+            sstats *= self.exp_e_log_beta
+        return gamma, sstats
@@ -0,0 +1,230 @@
+# Copyright 2024 Felix Engl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import csv
+import dataclasses
+import itertools
+import json
+import os
+import time
+import traceback
+import typing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os import PathLike
+from pathlib import Path
+
+import tomotopy as tp
+
+from ptmt.lda.telemetry import TELEMETRY_FILE_NAME
+from ptmt.lda.topic_model import SimpleTopicModel, LDASaveMode
+from ptmt.lda.training import create_by_corpus, train_lda, EarlyStopping
+
+"""
+Trains a grid of LDA models (k, alpha, eta, seed) on the same corpus with a process pool.
+
+output_dir
+ ├ corpus.bin                       the corpus, if it was not provided as a path
+ ├ summary.tsv                      the summary table of the sweep
+ └ k25_a0.1_e0.01_s1234
+    ├ lda_model.tomotopy.bin
+    ├ training.json
+    ├ telemetry.jsonl
+    ├ sweep_result.json             marks a finished model, finished models are not trained again
+    └ trained_lda                   the SimpleTopicModel export
+"""
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class SweepConfig:
+    k: int
+    alpha: float
+    eta: float
+    seed: int
+
+    @property
+    def name(self) -> str:
+        return f'k{self.k}_a{self.alpha}_e{self.eta}_s{self.seed}'
+
+
+@dataclasses.dataclass(slots=True)
+class SweepResult:
+    config: SweepConfig
+    path: str
+    ll_per_word: float | None = None
+    perplexity: float | None = None
+    wall_time: float | None = None
+    iterations: int | None = None
+    stop_reason: str | None = None
+    error: str | None = None
+
+    def to_row(self) -> dict[str, typing.Any]:
+        row = dataclasses.asdict(self)
+        row.update(row.pop('config'))
+        return row
+
+    @staticmethod
+    def from_row(row: dict[str, typing.Any]) -> 'SweepResult':
+        row = dict(row)
+        config = SweepConfig(row.pop('k'), row.pop('alpha'), row.pop('eta'), row.pop('seed'))
+        return SweepResult(config, **row)
+
+
+def sweep_grid(
+        ks: typing.Iterable[int] = (25,),
+        alphas: typing.Iterable[float] = (0.1,),
+        etas: typing.Iterable[float] = (0.01,),
+        seeds: typing.Iterable[int] = (1234,)
+) -> list[SweepConfig]:
+    return [SweepConfig(*values) for values in itertools.product(ks, alphas, etas, seeds)]
+
+
+_worker_corpus: tp.utils.Corpus | None = None
+
+
+def _init_worker(corpus_path: str):
+    global _worker_corpus
+    _worker_corpus = tp.utils.Corpus.load(corpus_path)
+
+
+def _train_single(
+        config: SweepConfig,
+        target: Path,
+        iters: int,
+        threads: int,
+        early_stopping: EarlyStopping | None,
+        export_mode: LDASaveMode,
+        model_kwargs: dict[str, typing.Any]
+) -> SweepResult:
+    assert _worker_corpus is not None, "The worker was not initialized!"
+    start = time.perf_counter()
+    mdl = create_by_corpus(
+        _worker_corpus, k=config.k, alpha=config.alpha, eta=config.eta, seed=config.seed, **model_kwargs
+    )
+    target.mkdir(parents=True, exist_ok=True)
+    mdl, training = train_lda(
+        mdl, iters, early_stopping=early_stopping, workers=threads, telemetry=target / TELEMETRY_FILE_NAME
+    )
+    mdl.save(str(target / 'lda_model.tomotopy.bin'), True)
+    training.save(target / 'training.json')
+    SimpleTopicModel(model=mdl).save(target / 'trained_lda', export_mode)
+    return SweepResult(
+        config=config,
+        path=str(target),
+        ll_per_word=float(mdl.ll_per_word),
+        perplexity=float(mdl.perplexity),
+        wall_time=time.perf_counter() - start,
+        iterations=training.iterations,
+        stop_reason=training.stop_reason
+    )
+
+
+def _run_single(*args) -> SweepResult:
+    config: SweepConfig = args[0]
+    target: Path = args[1]
+    try:
+        result = _train_single(*args)
+    except Exception:
+        return SweepResult(config=config, path=str(target), error=traceback.format_exc())
+    (target / 'sweep_result.json').write_text(json.dumps(result.to_row()), encoding='utf-8')
+    return result
+
+
+def write_summary(results: list[SweepResult], path: Path):
+    columns = [field.name for field in dataclasses.fields(SweepConfig)] + \
+              [field.name for field in dataclasses.fields(SweepResult) if field.name != 'config']
+    with path.open('w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, delimiter='\t')
+        writer.writeheader()
+        for result in results:
+            row = result.to_row()
+            if row['error'] is not None:
+                row['error'] = row['error'].strip().splitlines()[-1]
+            writer.writerow(row)
+
+
+def run_sweep(
+        corpus: tp.utils.Corpus | Path | str | PathLike[str],
+        output_dir: Path | str | PathLike[str],
+        configs: typing.Iterable[SweepConfig],
+        iters: int = 1000,
+        processes: int | None = None,
+        threads_per_process: int | None = None,
+        early_stopping: EarlyStopping | None = None,
+        export_mode: LDASaveMode = 'b',
+        **model_kwargs
+) -> list[SweepResult]:
+    """
+    Trains a model for every config and returns the results in the order of the configs.
+    The corpus is loaded once per worker process, a Corpus object is stored in output_dir first.
+    By default the threads of tomotopy are split between the processes, so the machine is not oversubscribed.
+    Additional model_kwargs are passed to create_by_corpus, the parameters of SweepConfig are set by the configs.
+    A config whose worker process dies is recorded as failed, the other results are kept.
+    """
+    if reserved := sorted(model_kwargs.keys() & {field.name for field in dataclasses.fields(SweepConfig)}):
+        raise ValueError(f"The model_kwargs {reserved} are set by the sweep configs!")
+    if not isinstance(output_dir, Path):
+        output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if isinstance(corpus, tp.utils.Corpus):
+        corpus_path = output_dir / 'corpus.bin'
+        corpus.save(str(corpus_path))
+    else:
+        corpus_path = Path(corpus)
+
+    configs = list(configs)
+    cpus = os.cpu_count() or 1
+    processes = min(processes if processes is not None else cpus, max(len(configs), 1))
+    threads = threads_per_process if threads_per_process is not None else max(1, cpus // processes)
+    print(f'Sweep over {len(configs)} models with {processes} processes and {threads} threads each.')
+
+    results: dict[SweepConfig, SweepResult] = {}
+    pending: list[SweepConfig] = []
+    for config in configs:
+        finished = output_dir / config.name / 'sweep_result.json'
+        if finished.exists():
+            results[config] = SweepResult.from_row(json.loads(finished.read_text(encoding='utf-8')))
+            print(f'  {config.name} is already trained.')
+        else:
+            pending.append(config)
+
+    if pending:
+        with ProcessPoolExecutor(
+                max_workers=processes,
+                initializer=_init_worker,
+                initargs=(str(corpus_path),)
+        ) as pool:
+            futures = {
+                pool.submit(
+                    _run_single, config, output_dir / config.name, iters, threads,
+                    early_stopping, export_mode, model_kwargs
+                ): config
+                for config in pending
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                config = futures[future]
+                try:
+                    result = future.result()
+                except Exception:
+                    # E.g. a BrokenProcessPool if the worker was killed by the OOM killer.
+                    result = SweepResult(config=config, path=str(output_dir / config.name), error=traceback.format_exc())
+                results[config] = result
+                if result.error is None:
+                    print(f'  ({done}/{len(pending)}) {result.config.name}: ll {result.ll_per_word:.4f}, '
+                          f'perplexity {result.perplexity:.2f}, {result.wall_time:.1f}s')
+                else:
+                    print(f'  ({done}/{len(pending)}) {result.config.name} FAILED:\n{result.error}')
+
+    ordered = [results[config] for config in configs]
+    write_summary(ordered, output_dir / 'summary.tsv')
+    return ordered
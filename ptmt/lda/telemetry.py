@@ -0,0 +1,131 @@
+# Copyright 2024 Felix Engl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import statistics
+import time
+import typing
+from os import PathLike
+from pathlib import Path
+
+import tomotopy as tp
+
+"""
+JSON lines telemetry of the LDA training, one record per training step:
+{"time": unix time, "iteration": int, "log_likelihood": float, "perplexity": float, "wall_time": float,
+ "tokens_per_second": float, "rss": int | null, "workers": int}
+"""
+
+TELEMETRY_FILE_NAME = "telemetry.jsonl"
+"""The name of the telemetry file in the output directory of a training."""
+
+
+def current_rss() -> int | None:
+    """
+    The resident set size of this process in bytes, None if /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class TelemetryWriter:
+    """
+    Appends the records to the file, a resumed training continues the stream of the previous run.
+    """
+
+    def __init__(self, path: Path | str | PathLike[str]):
+        if not isinstance(path, Path):
+            path = Path(path)
+        self.path = path
+        self._file: typing.TextIO | None = None
+
+    def __enter__(self) -> 'TelemetryWriter':
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open('a', encoding='utf-8', newline='\n')
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def write_step(self, mdl: tp.LDAModel, iterations: int, wall_time: float, workers: int):
+        """
+        Records a training step of iterations iterations that took wall_time seconds.
+        """
+        assert self._file is not None, "TelemetryWriter has to be used as a context manager!"
+        self._file.write(json.dumps({
+            "time": time.time(),
+            "iteration": mdl.global_step,
+            "log_likelihood": float(mdl.ll_per_word),
+            "perplexity": float(mdl.perplexity),
+            "wall_time": wall_time,
+            "tokens_per_second": mdl.num_words * iterations / wall_time if wall_time > 0 else None,
+            "rss": current_rss(),
+            "workers": workers if workers > 0 else os.cpu_count(),
+        }))
+        self._file.write('\n')
+        self._file.flush()
+
+
+def read_telemetry(path: Path | str | PathLike[str]) -> list[dict[str, typing.Any]]:
+    with Path(path).open('r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records: list[dict[str, typing.Any]]) -> dict[str, typing.Any]:
+    throughput = [x["tokens_per_second"] for x in records if x["tokens_per_second"] is not None]
+    rss = [x["rss"] for x in records if x["rss"] is not None]
+    last = records[-1] if records else {}
+    return {
+        "iterations": last.get("iteration"),
+        "log_likelihood": last.get("log_likelihood"),
+        "perplexity": last.get("perplexity"),
+        "wall_time": sum(x["wall_time"] for x in records),
+        "tokens_per_second": statistics.median(throughput) if throughput else None,
+        "max_rss": max(rss) if rss else None,
+        "workers": last.get("workers"),
+    }
+
+
+def compare_runs(
+        runs: typing.Mapping[str, Path | str | PathLike[str]] | typing.Iterable[Path | str | PathLike[str]]
+) -> list[dict[str, typing.Any]]:
+    """
+    Summarizes the telemetry of several runs, one row per run. Runs without a name are named by their path.
+    """
+    if not isinstance(runs, typing.Mapping):
+        runs = {str(path): path for path in runs}
+    return [{"run": name, **summarize(read_telemetry(path))} for name, path in runs.items()]
+
+
+def format_table(rows: list[dict[str, typing.Any]]) -> str:
+    if not rows:
+        return ''
+
+    def fmt(value: typing.Any) -> str:
+        if value is None:
+            return '-'
+        if isinstance(value, float):
+            return f'{value:.4g}'
+        return str(value)
+
+    columns = list(rows[0].keys())
+    cells = [columns] + [[fmt(row.get(column)) for column in columns] for row in rows]
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+    return '\n'.join('  '.join(value.rjust(width) for value, width in zip(line, widths)) for line in cells)
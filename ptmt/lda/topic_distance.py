@@ -0,0 +1,265 @@
+# Copyright 2024 Felix Engl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import dataclasses
+import itertools
+import typing
+
+import numpy as np
+import numpy.typing as npt
+import scipy.sparse
+import scipy.special
+
+from ptmt.lda.topic_model import SimpleTopicModel
+
+"""
+Distances between the topics of a reference model and the topics of N (translated) models.
+
+The topics of a model are projected onto the vocabulary of the reference with an id map
+(word id of the model -> word id of the reference or -1). Words without a reference id are collected
+in an additional column, therefore the projected topics are still probability distributions.
+Several words mapped to the same reference id are summed.
+
+For every model the result is a (k_reference x k_model) matrix, the models are processed in chunks
+of chunk_size models and all matrices of a chunk are calculated at once.
+"""
+
+TopicDistanceMeasure = typing.Literal['hellinger', 'jensen_shannon', 'jaccard']
+SUPPORTED_MEASURES: tuple[TopicDistanceMeasure, ...] = typing.get_args(TopicDistanceMeasure)
+
+DEFAULT_CHUNK_SIZE = 16
+DEFAULT_MAX_CHUNK_ELEMENTS = 2 ** 24
+
+
+def vocabulary_map(
+        reference: SimpleTopicModel,
+        model: SimpleTopicModel,
+        translations: typing.Iterable[tuple[str, str]] | None = None
+) -> npt.NDArray[np.int64]:
+    """
+    The id of every word of model in the vocabulary of reference, -1 if there is none.
+    Without translations identical words are mapped, translations are pairs (word of model, word of reference),
+    the first translation of a word is used.
+    """
+    id_map = np.full(len(model.vocabulary), -1, dtype=np.int64)
+    if translations is None:
+        for i, word in enumerate(model.vocabulary):
+            id_map[i] = reference.word2id.get(word, -1)
+    else:
+        for word, translation in translations:
+            i = model.word2id.get(word)
+            if i is not None and id_map[i] < 0:
+                id_map[i] = reference.word2id.get(translation, -1)
+    return id_map
+
+
+def project_topics(
+        topics: npt.NDArray[np.floating],
+        id_map: npt.NDArray[np.integer] | None,
+        reference_size: int
+) -> npt.NDArray[np.float64]:
+    """
+    Projects the topics (k x V) onto the reference vocabulary, the result is (k x reference_size + 1).
+    The last column contains the probability of the words without a reference id.
+    id_map None means that the topics already use the reference vocabulary.
+    """
+    k, size = topics.shape
+    projected = np.zeros((k, reference_size + 1), dtype=np.float64)
+    if id_map is None:
+        assert size == reference_size, "Without id map the topics need the vocabulary of the reference!"
+        projected[:, :-1] = topics
+        return projected
+    assert len(id_map) == size, "The id map needs an entry for every word of the topics!"
+    columns = np.where(id_map < 0, reference_size, id_map)
+    projection = scipy.sparse.csr_matrix(
+        (np.ones(size), (np.arange(size), columns)),
+        shape=(size, reference_size + 1)
+    )
+    projected[:] = topics.astype(np.float64, copy=False) @ projection
+    return projected
+
+
+@dataclasses.dataclass(slots=True)
+class TopicDistances:
+    """
+    The matrices have the shape (models x k_reference x k_model), [m, i, j] is the distance between
+    the topic i of the reference and the topic j of the model m. Measures that were not calculated are None.
+    """
+    hellinger: npt.NDArray[np.float64] | None
+    jensen_shannon: npt.NDArray[np.float64] | None
+    """The Jensen-Shannon divergence with log2 in [0, 1], the square root is a metric."""
+    jaccard: npt.NDArray[np.float64] | None
+    """1 - the Jaccard index of the top_n words."""
+    unmapped: npt.NDArray[np.float64]
+    """(models x k_model) the probability of the words without a reference id."""
+
+    def __len__(self) -> int:
+        return len(self.unmapped)
+
+    def best_matches(self, measure: TopicDistanceMeasure = 'hellinger') -> npt.NDArray[np.intp]:
+        """
+        (models x k_reference) the closest topic of every model for every topic of the reference.
+        """
+        values = getattr(self, measure)
+        assert values is not None, f"{measure} was not calculated!"
+        return np.argmin(values, axis=2)
+
+    def drift(self, measure: TopicDistanceMeasure = 'hellinger') -> npt.NDArray[np.float64]:
+        """
+        (models x k) the distance between the topic i of the reference and the topic i of the model,
+        the translation keeps the topic ids of the original model.
+        """
+        values = getattr(self, measure)
+        assert values is not None, f"{measure} was not calculated!"
+        return np.diagonal(values, axis1=1, axis2=2).copy()
+
+    @staticmethod
+    def concatenate(parts: typing.Sequence['TopicDistances']) -> 'TopicDistances':
+        def _join(name: str) -> npt.NDArray[np.float64] | None:
+            values = [getattr(part, name) for part in parts]
+            return None if values[0] is None else np.concatenate(values)
+
+        return TopicDistances(
+            _join('hellinger'),
+            _join('jensen_shannon'),
+            _join('jaccard'),
+            np.concatenate([part.unmapped for part in parts])
+        )
+
+
+def _hellinger(reference: npt.NDArray[np.float64], models: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+    # H(p, q) = sqrt(1 - sum(sqrt(p * q))), the Bhattacharyya coefficients of all pairs are one matmul.
+    coefficients = np.matmul(np.sqrt(reference), np.swapaxes(np.sqrt(models), 1, 2))
+    return np.sqrt(np.clip(1.0 - coefficients, 0.0, 1.0))
+
+
+def _jensen_shannon(
+        reference: npt.NDArray[np.float64],
+        models: npt.NDArray[np.float64],
+        max_chunk_elements: int
+) -> npt.NDArray[np.float64]:
+    # JS(p, q) = (sum(p log p) + sum(q log q)) / 2 - sum(m log m) with m = (p + q) / 2
+    # and sum(m log m) = (sum(s log s) - log(2) sum(s)) / 2 with s = p + q.
+    # Only sum(s log s) needs all pairs, it is summed over blocks of words in reused buffers.
+    n, k_model, size = models.shape
+    k_reference = reference.shape[0]
+    pairs = n * k_reference * k_model
+    step = max(1, min(size, max_chunk_elements // max(1, pairs)))
+    sums = np.empty((n, k_reference, k_model, step), dtype=np.float64)
+    logs = np.empty_like(sums)
+    pair_entropy = np.zeros((n, k_reference, k_model), dtype=np.float64)
+    for start in range(0, size, step):
+        end = min(start + step, size)
+        s, log_s = sums[..., :end - start], logs[..., :end - start]
+        np.add(reference[None, :, None, start:end], models[:, None, :, start:end], out=s)
+        # s log s is 0 for s = 0, the tiny offset avoids 0 * log(0).
+        np.add(s, np.finfo(np.float64).tiny, out=log_s)
+        np.log(log_s, out=log_s)
+        np.multiply(s, log_s, out=log_s)
+        pair_entropy += log_s.sum(axis=3)
+    totals = reference.sum(axis=1)[None, :, None] + models.sum(axis=2)[:, None, :]
+    result = 0.5 * scipy.special.xlogy(reference, reference).sum(axis=1)[None, :, None]
+    result = result + 0.5 * scipy.special.xlogy(models, models).sum(axis=2)[:, None, :]
+    result -= 0.5 * (pair_entropy - np.log(2.0) * totals)
+    return np.clip(result / np.log(2.0), 0.0, 1.0)
+
+
+def _top_sets(top_ids: npt.NDArray[np.intp], size: int) -> scipy.sparse.csr_matrix:
+    rows = np.repeat(np.arange(top_ids.shape[0]), top_ids.shape[1])
+    return scipy.sparse.csr_matrix(
+        (np.ones(top_ids.size), (rows, top_ids.ravel())),
+        shape=(top_ids.shape[0], size)
+    )
+
+
+def _jaccard(
+        reference: scipy.sparse.csr_matrix,
+        models: npt.NDArray[np.float64],
+        top_n: int
+) -> npt.NDArray[np.float64]:
+    n, k_model, size = models.shape
+    # The column of the unmapped words is not a word.
+    top_ids = SimpleTopicModel._top_ids(models[:, :, :-1].reshape(n * k_model, size - 1), top_n)
+    sets = _top_sets(top_ids, size - 1)
+    intersection = (reference @ sets.T).toarray().reshape(reference.shape[0], n, k_model).transpose(1, 0, 2)
+    union = top_n + top_n - intersection
+    return 1.0 - intersection / union
+
+
+def iter_topic_distances(
+        reference: SimpleTopicModel,
+        models: typing.Iterable[SimpleTopicModel | tuple[SimpleTopicModel, npt.NDArray[np.integer] | None]],
+        measures: typing.Collection[TopicDistanceMeasure] = SUPPORTED_MEASURES,
+        top_n: int = 20,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_chunk_elements: int = DEFAULT_MAX_CHUNK_ELEMENTS
+) -> typing.Iterator[TopicDistances]:
+    """
+    Yields the distances for every chunk of chunk_size models, models can be a generator that loads the models lazily.
+    A model is either a SimpleTopicModel or a tuple of the model and its id map, see vocabulary_map.
+    Without id map identical words are mapped, the id map is reused for the following models with the same vocabulary.
+    All models of a chunk need the same number of topics.
+    """
+    assert chunk_size > 0, "The chunk size has to be positive!"
+    for measure in measures:
+        if measure not in SUPPORTED_MEASURES:
+            raise ValueError(f"Unsupported measure {measure}, supported are {SUPPORTED_MEASURES}!")
+    size = len(reference.vocabulary)
+    top_n = min(top_n, size)
+    reference_topics = project_topics(reference.topics, None, size)
+    reference_sets = _top_sets(reference.top_word_ids(top_n), size) if 'jaccard' in measures else None
+
+    last_vocabulary: npt.NDArray[str] | None = None
+    last_id_map: npt.NDArray[np.int64] | None = None
+
+    def _project(entry) -> npt.NDArray[np.float64]:
+        nonlocal last_vocabulary, last_id_map
+        if isinstance(entry, tuple):
+            model, id_map = entry
+        else:
+            model = entry
+            vocabulary = np.asarray(model.vocabulary)
+            if last_vocabulary is None or not np.array_equal(vocabulary, last_vocabulary):
+                last_vocabulary = vocabulary
+                last_id_map = None if np.array_equal(vocabulary, np.asarray(reference.vocabulary)) \
+                    else vocabulary_map(reference, model)
+            id_map = last_id_map
+        return project_topics(model.topics, id_map, size)
+
+    iterator = iter(models)
+    while chunk := list(itertools.islice(iterator, chunk_size)):
+        projected = np.stack([_project(entry) for entry in chunk])
+        del chunk
+        yield TopicDistances(
+            _hellinger(reference_topics, projected) if 'hellinger' in measures else None,
+            _jensen_shannon(reference_topics, projected, max_chunk_elements) if 'jensen_shannon' in measures else None,
+            _jaccard(reference_sets, projected, top_n) if 'jaccard' in measures else None,
+            projected[:, :, -1].copy()
+        )
+
+
+def topic_distances(
+        reference: SimpleTopicModel,
+        models: typing.Iterable[SimpleTopicModel | tuple[SimpleTopicModel, npt.NDArray[np.integer] | None]],
+        measures: typing.Collection[TopicDistanceMeasure] = SUPPORTED_MEASURES,
+        top_n: int = 20,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_chunk_elements: int = DEFAULT_MAX_CHUNK_ELEMENTS
+) -> TopicDistances:
+    """
+    The distances of all models in the order of models, see iter_topic_distances.
+    """
+    parts = list(iter_topic_distances(reference, models, measures, top_n, chunk_size, max_chunk_elements))
+    assert len(parts) > 0, "There are no models!"
+    return TopicDistances.concatenate(parts)
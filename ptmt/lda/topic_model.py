@@ -13,9 +13,13 @@
 # limitations under the License.
 
 import abc
+import dataclasses
 import enum
 import functools
 import io
+import json
+import os
+import shutil
 import typing
 import zipfile
 from collections import defaultdict
@@ -23,15 +27,24 @@ from os import PathLike
 from pathlib import Path
 from typing import Protocol, TypeVar
 import gensim.models
+import marisa_trie
 import numpy as np
 import pyLDAvis
+import scipy.sparse
+import scipy.special
 import tomotopy as tp
 import decimal
 import numpy.typing as npt
 
+if typing.TYPE_CHECKING:
+    import ldatranslate
+
 # noinspection PyProtectedMember
 from gensim._matutils import dirichlet_expectation, mean_absolute_difference
 
+from ptmt.lda.inference import pack_bows, batched_inference, DEFAULT_CHUNK_SIZE, DEFAULT_MAX_CHUNK_ELEMENTS
+from ptmt.lda.parallel_inference import ParallelInference
+
 """
 corpus = tomotopy.Corpus(<Deine Vorverarbeiteten Daten>)
 lda_model = tomopy.train_lda(corpus, iterationen=1000)
@@ -80,6 +93,63 @@ def float_to_str(f):
     return format(d1, 'f')
 
 
+def _format_row(row: typing.Iterable[np.floating]) -> str:
+    """
+    Same output as float_to_str for every value of the row, but without the detour over Decimal.
+    """
+    return ' '.join(np.format_float_positional(x, trim='0') for x in row)
+
+
+# Number of lines parsed at once by the text loaders.
+_PARSE_BLOCK_LINES = 8192
+
+
+def _iter_line_blocks(lines: typing.Iterable[str], block_lines: int = _PARSE_BLOCK_LINES) -> typing.Iterator[list[str]]:
+    block: list[str] = []
+    for line in lines:
+        block.append(line)
+        if len(block) == block_lines:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def _parse_block(block: list[str], dtype=np.float64) -> npt.NDArray:
+    """
+    Parses a block of lines with whitespace separated numbers into a (lines x numbers per line) array.
+    """
+    width = len(block[0].split())
+    values = np.fromstring(''.join(block), dtype=dtype, sep=' ')
+    if len(values) != len(block) * width:
+        raise ValueError(f"Expected {len(block) * width} values in the block but found {len(values)}!")
+    return values.reshape(len(block), width)
+
+
+def _read_matrix(open_member: typing.Callable[[], typing.TextIO], dtype, parse_dtype=np.float64) -> npt.NDArray:
+    """
+    Reads a text matrix in two passes. The first one counts the rows, the second one parses blocks
+    of lines straight into the preallocated result.
+    """
+    rows, width = 0, 0
+    with open_member() as member:
+        for line in member:
+            if rows == 0:
+                width = len(line.split())
+            rows += 1
+    result = np.empty((rows, width), dtype=dtype)
+    start = 0
+    with open_member() as member:
+        for block in _iter_line_blocks(member):
+            result[start:start + len(block)] = _parse_block(block, parse_dtype)
+            start += len(block)
+    return result
+
+
+def _read_vector(open_member: typing.Callable[[], typing.TextIO], dtype) -> npt.NDArray:
+    return _read_matrix(open_member, dtype, np.int64).reshape(-1)
+
+
 class CoherenceModelData:
     corpus_texts: list[list[str]]
     dictionary: gensim.corpora.Dictionary
@@ -108,75 +178,350 @@ class CoherenceModelData:
         self.dictionary = dictionary
         self.gensim_corpus = gensim_corpus
 
+    VERSION: typing.ClassVar[int] = 1
+
+    class Target(enum.StrEnum):
+        TOKENS = "tokens.npy"
+        TOKEN_OFFSETS = "tokens.offsets.npy"
+        BOW_IDS = "bow.ids.npy"
+        BOW_COUNTS = "bow.counts.npy"
+        BOW_OFFSETS = "bow.offsets.npy"
+        VOCABULARY = "vocabulary.utf8.npy"
+        VOCABULARY_OFFSETS = "vocabulary.offsets.npy"
+        DOCUMENT_FREQUENCY = "dfs.npy"
+        COLLECTION_FREQUENCY = "cfs.npy"
+        INFO = "data.info"
+
+    def save(self, path: Path, fingerprint: str | None = None):
+        """
+        Stores the texts as flat int32 token ids with offsets, the bow corpus in the same way and the
+        dictionary as a packed vocabulary with the frequencies. The info is written last and marks complete data.
+        """
+        path.mkdir(parents=True, exist_ok=True)
+        info_path = path / CoherenceModelData.Target.INFO
+        info_path.unlink(missing_ok=True)
+
+        token2id = self.dictionary.token2id
+        lengths = np.fromiter((len(text) for text in self.corpus_texts), dtype=np.int64, count=len(self.corpus_texts))
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        tokens = np.fromiter(
+            (token2id[word] for text in self.corpus_texts for word in text), dtype=np.int32, count=int(offsets[-1])
+        )
+        np.save(path / CoherenceModelData.Target.TOKENS, tokens)
+        np.save(path / CoherenceModelData.Target.TOKEN_OFFSETS, offsets)
+
+        lengths = np.fromiter((len(bow) for bow in self.gensim_corpus), dtype=np.int64, count=len(self.gensim_corpus))
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        bow = np.fromiter(
+            (value for doc in self.gensim_corpus for entry in doc for value in entry),
+            dtype=np.int32, count=2 * int(offsets[-1])
+        ).reshape(-1, 2)
+        np.save(path / CoherenceModelData.Target.BOW_IDS, bow[:, 0])
+        np.save(path / CoherenceModelData.Target.BOW_COUNTS, bow[:, 1])
+        np.save(path / CoherenceModelData.Target.BOW_OFFSETS, offsets)
+
+        size = len(self.dictionary)
+        blob, offsets = _pack_vocabulary(self.dictionary[i] for i in range(size))
+        np.save(path / CoherenceModelData.Target.VOCABULARY, blob)
+        np.save(path / CoherenceModelData.Target.VOCABULARY_OFFSETS, offsets)
+        np.save(path / CoherenceModelData.Target.DOCUMENT_FREQUENCY,
+                np.fromiter((self.dictionary.dfs.get(i, 0) for i in range(size)), dtype=np.int64, count=size))
+        np.save(path / CoherenceModelData.Target.COLLECTION_FREQUENCY,
+                np.fromiter((self.dictionary.cfs.get(i, 0) for i in range(size)), dtype=np.int64, count=size))
+
+        info_path.write_text(json.dumps({
+            "version": CoherenceModelData.VERSION,
+            "fingerprint": fingerprint,
+            "num_docs": self.dictionary.num_docs,
+            "num_pos": self.dictionary.num_pos,
+            "num_nnz": self.dictionary.num_nnz,
+        }), encoding='utf-8')
+
+    @classmethod
+    def load(cls, path: Path, fingerprint: str | None = None) -> 'CoherenceModelData | None':
+        """
+        Returns None if there is no complete data at path or if it was stored with another fingerprint.
+        """
+        info_path = path / CoherenceModelData.Target.INFO
+        if not info_path.exists():
+            return None
+        info = json.loads(info_path.read_text(encoding='utf-8'))
+        if info["version"] != CoherenceModelData.VERSION or info["fingerprint"] != fingerprint:
+            return None
+
+        vocabulary = _unpack_vocabulary(
+            np.load(path / CoherenceModelData.Target.VOCABULARY),
+            np.load(path / CoherenceModelData.Target.VOCABULARY_OFFSETS)
+        )
+        dictionary = gensim.corpora.Dictionary()
+        dictionary.token2id = dict(zip(vocabulary, range(len(vocabulary))))
+        dictionary.dfs = dict(enumerate(np.load(path / CoherenceModelData.Target.DOCUMENT_FREQUENCY).tolist()))
+        dictionary.cfs = dict(enumerate(np.load(path / CoherenceModelData.Target.COLLECTION_FREQUENCY).tolist()))
+        dictionary.num_docs = info["num_docs"]
+        dictionary.num_pos = info["num_pos"]
+        dictionary.num_nnz = info["num_nnz"]
+
+        words = np.array(vocabulary, dtype=object)[np.load(path / CoherenceModelData.Target.TOKENS)].tolist()
+        bounds = np.load(path / CoherenceModelData.Target.TOKEN_OFFSETS).tolist()
+        corpus_texts = [words[a:b] for a, b in zip(bounds, bounds[1:])]
+
+        entries = list(zip(
+            np.load(path / CoherenceModelData.Target.BOW_IDS).tolist(),
+            np.load(path / CoherenceModelData.Target.BOW_COUNTS).tolist()
+        ))
+        bounds = np.load(path / CoherenceModelData.Target.BOW_OFFSETS).tolist()
+        gensim_corpus = [entries[a:b] for a, b in zip(bounds, bounds[1:])]
+        return cls(corpus_texts, dictionary, gensim_corpus)
+
+
+LDASaveMode = typing.Literal['plain', 'p', 'deflated', 'd', 'binary', 'b']
+
+DocTopicDistsMode = typing.Literal['lazy', 'eager', 'skip']
+"""
+lazy: doc_topic_dists are loaded on first access (memory mapped for the binary layout)
+eager: doc_topic_dists are loaded with the model
+skip: doc_topic_dists are not available
+"""
+
+VocabularyBackend = typing.Literal['numpy', 'trie']
+"""
+numpy: The vocabulary is a numpy unicode array and word2id a dict.
+trie: The vocabulary is a SimpleTopicModel.TrieVocabulary, word2id is a view on the trie.
+"""
+
 
-LDASaveMode = typing.Literal['plain', 'p', 'deflated', 'd']
+def _as_matrix(values: typing.Iterable[typing.Iterable[float]] | npt.NDArray, dtype) -> npt.NDArray:
+    if isinstance(values, np.ndarray):
+        # Keeps memory mapped arrays as they are if the dtype already matches.
+        return np.asarray(values, dtype=dtype)
+    return np.array(
+        tuple(np.array(x, dtype=dtype) for x in values),
+        dtype=np.dtype(np.dtype(dtype))
+    )
+
+
+def _pack_vocabulary(vocabulary: typing.Iterable[str]) -> tuple[npt.NDArray[np.uint8], npt.NDArray[np.int64]]:
+    """
+    Packs the vocabulary into a single utf-8 blob and the offsets of the words in the blob.
+    The word i is at blob[offsets[i]:offsets[i+1]].
+    """
+    encoded = [str(word).encode('utf-8') for word in vocabulary]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter((len(x) for x in encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_vocabulary(blob: npt.NDArray[np.uint8], offsets: npt.NDArray[np.int64]) -> tuple[str, ...]:
+    data = blob.tobytes()
+    bounds = offsets.tolist()
+    return tuple(data[a:b].decode('utf-8') for a, b in zip(bounds, bounds[1:]))
 
 
 class SimpleTopicModel:
-    vocabulary: npt.NDArray[str]  # list[str]
-    topics: npt.NDArray[npt.NDArray[np.floating]]  # list[list[float]]
+    vocabulary: 'npt.NDArray[str] | SimpleTopicModel.TrieVocabulary'  # list[str]
     doc_lengths: npt.NDArray[np.int32]  # list[int]
-    doc_topic_dists: npt.NDArray[npt.NDArray[np.floating]]  # list[list[float]]
     term_frequency: npt.NDArray[np.int32]  # list[int]
 
     # Autogen oder spezial
-    word2id: dict[str, int]
+    word2id: typing.Mapping[str, int]
     gamma_threshold: float
     alpha: float | None
 
+    # Depth of the cached top word index, see top_word_ids
+    top_index_depth: int = 100
+
     def __init__(self, *,
                  model: tp.LDAModel | None = None,
-                 vocabulary: tuple[str, ...] | None = None,
+                 vocabulary: 'tuple[str, ...] | SimpleTopicModel.TrieVocabulary | None' = None,
                  topics: tuple[tuple[float, ...], ...] | None = None,
                  doc_lengths: tuple[int, ...] | None = None,
-                 doc_topic_dists: tuple[tuple[float, ...], ...] | None = None,
+                 doc_topic_dists: 'tuple[tuple[float, ...], ...] | SimpleTopicModel.DocTopicDistsSource | None' = None,
                  term_frequency: tuple[int, ...] | None = None,
                  alpha: float | None = None,
-                 dtype: np.floating = np.float32  # np.float16 .. np.float64
+                 dtype: np.floating = np.float32,  # np.float16 .. np.float64
+                 vocabulary_backend: VocabularyBackend = 'numpy'
                  ):
 
         if model is not None:
-            vocabulary = tuple(word for word in model.used_vocabs)
-            topics = tuple(tuple(float(value) for value in model.get_topic_word_dist(k)) for k in range(0, model.k))
-            doc_lengths = tuple(len(doc.words) for doc in model.docs)
-            doc_topic_dists = tuple(tuple(float(x) for x in doc.get_topic_dist()) for doc in model.docs)
-            term_frequency = tuple(int(x) for x in model.used_vocab_freq)
+            vocabulary, topics, doc_lengths, doc_topic_dists, term_frequency = \
+                SimpleTopicModel._extract_tomotopy(model, dtype)
             alpha = model.alpha
-            for topic in topics:
-                assert len(topic) == len(vocabulary)
         else:
             assert vocabulary is not None
             assert topics is not None
             assert doc_lengths is not None
-            assert doc_topic_dists is not None
+            # doc_topic_dists may be None if they are not needed.
             assert term_frequency is not None
 
-        self.vocabulary = np.array(vocabulary, dtype=str)
+        if isinstance(vocabulary, SimpleTopicModel.TrieVocabulary):
+            self.vocabulary = vocabulary
+        elif vocabulary_backend == 'trie':
+            self.vocabulary = SimpleTopicModel.TrieVocabulary.from_words(vocabulary)
+        elif vocabulary_backend == 'numpy':
+            self.vocabulary = np.array(vocabulary, dtype=str)
+        else:
+            raise ValueError(f"Illegal vocabulary backend: {vocabulary_backend}")
 
-        self.topics = np.array(
-            tuple(np.array(x, dtype=dtype) for x in topics),
-            dtype=np.dtype(np.dtype(dtype))
-        )
+        self._top_index: npt.NDArray[np.intp] | None = None
+        self.topics = _as_matrix(topics, dtype)
 
-        self.doc_topic_dists = np.array(
-            tuple(np.array(x, dtype=dtype) for x in doc_topic_dists),
-            dtype=np.dtype(np.dtype(dtype))
-        )
+        self._doc_topic_dists: npt.NDArray[npt.NDArray[np.floating]] | None = None
+        self._doc_topic_dists_source: SimpleTopicModel.DocTopicDistsSource | None = None
+        if isinstance(doc_topic_dists, SimpleTopicModel.DocTopicDistsSource):
+            self._doc_topic_dists_source = doc_topic_dists
+        elif doc_topic_dists is not None:
+            self._doc_topic_dists = _as_matrix(doc_topic_dists, dtype)
 
-        self.doc_lengths = np.array(doc_lengths, dtype=np.int32)
-        self.term_frequency = np.array(term_frequency, dtype=np.int32)
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.int32)
+        self.term_frequency = np.asarray(term_frequency, dtype=np.int32)
         self.alpha = alpha
 
         self.dtype = dtype
-        self.word2id = {k: i for i, k in enumerate(self.vocabulary)}
+        if isinstance(self.vocabulary, SimpleTopicModel.TrieVocabulary):
+            self.word2id = self.vocabulary.word2id
+        else:
+            self.word2id = {k: i for i, k in enumerate(self.vocabulary)}
         self.random_state = gensim.utils.get_random_state(None)
         self.gamma_threshold = 0.0001
 
+    # Number of documents extracted at once from a tomotopy model
+    extraction_chunk_size: int = 65536
+
+    @staticmethod
+    def _extract_tomotopy(
+            model: tp.LDAModel,
+            dtype: np.floating = np.float32,
+            chunk_size: int | None = None,
+    ) -> tuple[npt.NDArray[np.str_], npt.NDArray[np.float64], npt.NDArray[np.int32],
+               npt.NDArray[np.floating], npt.NDArray[np.int32]]:
+        """
+        Copies the topics and documents of a tomotopy model into preallocated arrays,
+        the topics and the vocabulary are taken from topics_of_tomotopy.
+        The doc_topic_dists are collected in a float64 buffer of chunk_size documents and written into
+        the result with the target dtype, so the values are the same as with a detour over Python floats.
+        """
+        chunk_size = SimpleTopicModel.extraction_chunk_size if chunk_size is None else chunk_size
+        assert chunk_size > 0, "The chunk size has to be positive!"
+        topic_model = SimpleTopicModel.topics_of_tomotopy(model, np.float64)
+
+        docs = model.docs
+        n_docs = len(docs)
+        doc_lengths = np.empty(n_docs, dtype=np.int32)
+        doc_topic_dists = np.empty((n_docs, model.k), dtype=dtype)
+        buffer = np.empty((min(chunk_size, max(n_docs, 1)), model.k), dtype=np.float64)
+        start = 0
+        for i, doc in enumerate(docs):
+            doc_lengths[i] = len(doc.words)
+            buffer[i - start] = doc.get_topic_dist()
+            if i + 1 - start == chunk_size or i + 1 == n_docs:
+                doc_topic_dists[start:i + 1] = buffer[:i + 1 - start]
+                start = i + 1
+                print(f'  Extracted {start}/{n_docs} documents.')
+        return topic_model.vocabulary, topic_model.topics, doc_lengths, doc_topic_dists, topic_model.term_frequency
+
+    @property
+    def topics(self) -> npt.NDArray[npt.NDArray[np.floating]]:  # list[list[float]]
+        return self._topics
+
+    @topics.setter
+    def topics(self, value: npt.NDArray[npt.NDArray[np.floating]]):
+        self._topics = value
+        self._top_index = None
+
     @property
     def k(self) -> int:
         return len(self.topics)
 
+    @property
+    def doc_topic_dists(self) -> npt.NDArray[npt.NDArray[np.floating]]:  # list[list[float]]
+        """
+        The doc_topic_dists are loaded on first access if the model was loaded lazily.
+        """
+        if self._doc_topic_dists is None:
+            if self._doc_topic_dists_source is None:
+                raise ValueError("The doc_topic_dists of this model are not available!")
+            self._doc_topic_dists = _as_matrix(self._doc_topic_dists_source.load(), self.dtype)
+        return self._doc_topic_dists
+
+    @doc_topic_dists.setter
+    def doc_topic_dists(self, value: npt.NDArray[npt.NDArray[np.floating]] | None):
+        self._doc_topic_dists = value
+        self._doc_topic_dists_source = None
+
+    @property
+    def has_doc_topic_dists(self) -> bool:
+        return self._doc_topic_dists is not None or self._doc_topic_dists_source is not None
+
+    def iter_doc_topic_dists(self, block_size: int = 65536) -> typing.Iterator[npt.NDArray[np.floating]]:
+        """
+        Streams the doc_topic_dists in blocks of block_size rows without loading all of them.
+        """
+        assert block_size > 0, "The block size has to be positive!"
+        if self._doc_topic_dists is not None:
+            for start in range(0, len(self._doc_topic_dists), block_size):
+                yield self._doc_topic_dists[start:start + block_size]
+        elif self._doc_topic_dists_source is not None:
+            for block in self._doc_topic_dists_source.iter_blocks(block_size):
+                yield np.asarray(block, dtype=self.dtype)
+        else:
+            raise ValueError("The doc_topic_dists of this model are not available!")
+
+    def topic_frequency(self) -> npt.NDArray[np.float64]:
+        """
+        The expected number of tokens per topic, calculated from the streamed doc_topic_dists.
+        """
+        result = np.zeros(self.k, dtype=np.float64)
+        start = 0
+        for block in self.iter_doc_topic_dists():
+            result += block.T.astype(np.float64) @ self.doc_lengths[start:start + len(block)]
+            start += len(block)
+        return result
+
+    @staticmethod
+    def _sort_descending(topics: npt.NDArray[np.floating], ids: npt.NDArray[np.intp]) -> npt.NDArray[np.intp]:
+        """
+        Sorts the word ids of every topic (row) by descending probability, ties by descending id.
+        """
+        values = np.take_along_axis(topics, ids, axis=1)
+        order = np.lexsort((ids, values), axis=-1)
+        return np.take_along_axis(ids, order, axis=1)[:, ::-1]
+
+    def top_word_ids(self, n: int | None = None) -> npt.NDArray[np.intp]:
+        """
+        Returns the ids of the n most probable words for every topic (k x n), sorted by descending probability.
+        The answer comes from a lazily built index of depth top_index_depth (one argpartition over all topics),
+        only if n exceeds the depth all topics are sorted completely.
+        The index is dropped when topics is set, changes to the topics in place are not detected.
+        """
+        size = self.topics.shape[1]
+        n = size if n is None else min(n, size)
+        depth = min(self.top_index_depth, size)
+        if n > depth:
+            return self._sort_descending(self.topics, np.broadcast_to(np.arange(size), self.topics.shape))[:, :n]
+        if self._top_index is None:
+            self._top_index = self._top_ids(self.topics, depth)
+        return self._top_index[:, :n]
+
+    @staticmethod
+    def _top_ids(topics: npt.NDArray[np.floating], n: int) -> npt.NDArray[np.intp]:
+        """
+        Returns the ids of the n biggest values of every topic (row), sorted like _sort_descending.
+        """
+        size = topics.shape[1]
+        if n >= size:
+            candidates = np.broadcast_to(np.arange(size), topics.shape)
+        else:
+            candidates = np.argpartition(topics, size - n, axis=1)[:, size - n:]
+        return SimpleTopicModel._sort_descending(topics, candidates)
+
     MODEL_ZIP_PATH = "model.zip"
+    MODEL_BINARY_PATH = "binary"
+    # The directory of the binary layout was named like a npy file before.
+    MODEL_BINARY_LEGACY_PATH = "model.npy"
+    # Version 2 adds the quantized topics, models without quantization are still written as version 1.
+    BINARY_VERSION = 2
 
     class Target(enum.StrEnum):
         DOC_LENGTHS = "doc/doc_lengths.freq"
@@ -186,6 +531,254 @@ class SimpleTopicModel:
         MODEL = "model/topic.model"
         VERSION_INFO = "version.info"
 
+    class BinaryTarget(enum.StrEnum):
+        TOPICS = "topics.npy"
+        DOC_TOPIC_DISTS = "doc_topic_dists.npy"
+        DOC_LENGTHS = "doc_lengths.npy"
+        TERM_FREQUENCY = "term_frequency.npy"
+        VOCABULARY = "vocabulary.utf8.npy"
+        VOCABULARY_OFFSETS = "vocabulary.offsets.npy"
+        VOCABULARY_TRIE = "vocabulary.marisa"
+        VOCABULARY_TRIE_IDS = "vocabulary.trie_ids.npy"
+        TOPICS_QUANTIZED = "topics.quantized.npy"
+        TOPICS_SCALE = "topics.scale.npy"
+        TOPICS_TOP_IDS = "topics.top_ids.npy"
+        TOPICS_RESIDUAL = "topics.residual.npy"
+        VERSION_INFO = "version.info"
+
+    @dataclasses.dataclass(frozen=True, slots=True)
+    class Quantization:
+        """
+        Lossy storage of the topics in the binary layout.
+        values: float16, log8 (8 bit logarithmic with a scale per topic) or None to keep the dtype of the model.
+        top_k: If set only the top_k words of every topic are stored, the remaining (residual) mass of
+        a topic is spread evenly over the other words.
+        """
+        values: typing.Literal['float16', 'log8'] | None = 'float16'
+        top_k: int | None = None
+
+        # The code 0 is reserved for a value of 0, the codes 1..255 cover [min, max] of the topic.
+        LOG8_STEPS: typing.ClassVar[int] = 254
+
+        def __post_init__(self):
+            if self.values not in (None, 'float16', 'log8'):
+                raise ValueError(f"Illegal value quantization: {self.values}")
+            if self.top_k is not None and self.top_k <= 0:
+                raise ValueError(f"top_k has to be positive but is {self.top_k}!")
+
+        def to_info(self) -> dict[str, typing.Any]:
+            return {"values": self.values, "top_k": self.top_k}
+
+        @staticmethod
+        def from_info(info: dict[str, typing.Any]) -> 'SimpleTopicModel.Quantization':
+            return SimpleTopicModel.Quantization(info["values"], info["top_k"])
+
+        def _encode(self, values: npt.NDArray[np.floating]) -> dict[str, npt.NDArray]:
+            match self.values:
+                case None:
+                    return {SimpleTopicModel.BinaryTarget.TOPICS_QUANTIZED: values}
+                case 'float16':
+                    return {SimpleTopicModel.BinaryTarget.TOPICS_QUANTIZED: values.astype(np.float16)}
+                case 'log8':
+                    positive = values > 0
+                    logs = np.log(np.where(positive, values, 1.0), dtype=np.float64)
+                    lo = np.where(positive, logs, np.inf).min(axis=1, initial=np.inf)
+                    hi = np.where(positive, logs, -np.inf).max(axis=1, initial=-np.inf)
+                    empty = ~np.isfinite(lo)
+                    lo[empty], hi[empty] = 0.0, 0.0
+                    width = np.where(hi > lo, hi - lo, 1.0)[:, None]
+                    codes = 1 + np.rint((logs - lo[:, None]) / width * self.LOG8_STEPS)
+                    return {
+                        SimpleTopicModel.BinaryTarget.TOPICS_QUANTIZED: np.where(positive, codes, 0).astype(np.uint8),
+                        SimpleTopicModel.BinaryTarget.TOPICS_SCALE: np.stack([lo, hi], axis=1),
+                    }
+
+        def _decode(self, load: typing.Callable[[str], npt.NDArray], dtype) -> npt.NDArray[np.floating]:
+            codes = load(SimpleTopicModel.BinaryTarget.TOPICS_QUANTIZED)
+            if self.values != 'log8':
+                return np.asarray(codes, dtype=dtype)
+            scale = load(SimpleTopicModel.BinaryTarget.TOPICS_SCALE)
+            lo, hi = scale[:, 0:1], scale[:, 1:2]
+            values = np.exp(lo + (codes - 1.0) * ((hi - lo) / self.LOG8_STEPS))
+            return np.where(codes == 0, 0.0, values).astype(dtype)
+
+        def quantize(self, topics: npt.NDArray[np.floating]) -> dict[str, npt.NDArray]:
+            """
+            Returns the members of the binary layout for the topics.
+            """
+            if self.top_k is None:
+                return self._encode(topics)
+            ids = SimpleTopicModel._top_ids(topics, self.top_k)
+            values = np.take_along_axis(topics, ids, axis=1)
+            residual = topics.sum(axis=1, dtype=np.float64) - values.sum(axis=1, dtype=np.float64)
+            members = self._encode(values)
+            members[SimpleTopicModel.BinaryTarget.TOPICS_TOP_IDS] = ids.astype(np.int32)
+            members[SimpleTopicModel.BinaryTarget.TOPICS_RESIDUAL] = np.maximum(residual, 0.0)
+            return members
+
+        def dequantize(
+                self,
+                load: typing.Callable[[str], npt.NDArray],
+                shape: tuple[int, int],
+                dtype=np.float32
+        ) -> npt.NDArray[np.floating]:
+            """
+            Restores the dense (k x vocabulary) topics, load returns the stored member for a BinaryTarget.
+            """
+            values = self._decode(load, dtype)
+            if self.top_k is None:
+                return values
+            ids = load(SimpleTopicModel.BinaryTarget.TOPICS_TOP_IDS)
+            residual = load(SimpleTopicModel.BinaryTarget.TOPICS_RESIDUAL)
+            rest = shape[1] - ids.shape[1]
+            topics = np.empty(shape, dtype=dtype)
+            topics[:] = (residual / max(rest, 1))[:, None]
+            np.put_along_axis(topics, np.asarray(ids, dtype=np.intp), values, axis=1)
+            return topics
+
+    @dataclasses.dataclass(frozen=True, slots=True)
+    class QuantizationReport:
+        """
+        The error of quantized topics compared to the original ones.
+        """
+        max_abs_error: float
+        mean_abs_error: float
+        top_n: int
+        top_n_overlap: float
+        """Mean share of the original top n words of a topic that are also in the quantized top n."""
+        top_n_rank_agreement: float
+        """Mean share of the top n ranks of a topic that hold the same word."""
+        stored_bytes: int
+        original_bytes: int
+
+    class TrieVocabulary(typing.Sequence[str]):
+        """
+        A compact vocabulary, every word is stored once in a marisa trie.
+        The trie assigns its own ids, trie_ids maps the id of a word in the model to the id in the trie.
+        Indexing with an int returns a str, indexing with a slice or an array of ids returns a numpy array.
+        """
+
+        def __init__(self, trie: marisa_trie.Trie, trie_ids: npt.NDArray[np.integer]):
+            if len(trie) != len(trie_ids):
+                raise ValueError(f"The trie has {len(trie)} words but there are {len(trie_ids)} ids!")
+            self.trie = trie
+            self.trie_ids = trie_ids
+            self.model_ids = np.empty(len(trie_ids), dtype=np.int32)
+            self.model_ids[trie_ids] = np.arange(len(trie_ids), dtype=np.int32)
+            self.word2id = SimpleTopicModel.TrieWord2Id(self)
+
+        @staticmethod
+        def from_words(words: typing.Iterable[str]) -> 'SimpleTopicModel.TrieVocabulary':
+            words = [str(word) for word in words]
+            trie = marisa_trie.Trie(words)
+            if len(trie) != len(words):
+                raise ValueError("The vocabulary contains duplicates, it can not be stored in a trie!")
+            return SimpleTopicModel.TrieVocabulary(
+                trie,
+                np.fromiter((trie[word] for word in words), dtype=np.int32, count=len(words))
+            )
+
+        @staticmethod
+        def load(trie_path: Path, trie_ids: npt.NDArray[np.integer]) -> 'SimpleTopicModel.TrieVocabulary':
+            """
+            Memory maps the trie at trie_path.
+            """
+            trie = marisa_trie.Trie()
+            trie.mmap(str(trie_path))
+            return SimpleTopicModel.TrieVocabulary(trie, trie_ids)
+
+        def save(self, trie_path: Path) -> npt.NDArray[np.int32]:
+            """
+            Saves the trie to trie_path and returns the trie_ids, they have to be stored by the caller.
+            """
+            self.trie.save(str(trie_path))
+            return np.asarray(self.trie_ids, dtype=np.int32)
+
+        def __len__(self) -> int:
+            return len(self.trie_ids)
+
+        @typing.overload
+        def __getitem__(self, index: int) -> str: ...
+
+        @typing.overload
+        def __getitem__(self, index: slice | npt.NDArray[np.integer] | typing.Sequence[int]) -> npt.NDArray[str]: ...
+
+        def __getitem__(self, index):
+            if isinstance(index, (int, np.integer)):
+                return self.trie.restore_key(int(self.trie_ids[index]))
+            return np.array([self.trie.restore_key(int(x)) for x in np.asarray(self.trie_ids[index]).reshape(-1)],
+                            dtype=str)
+
+        def __iter__(self) -> typing.Iterator[str]:
+            for x in self.trie_ids:
+                yield self.trie.restore_key(int(x))
+
+        def __contains__(self, word: object) -> bool:
+            return isinstance(word, str) and word in self.trie
+
+        def __array__(self, dtype=None, copy=None) -> npt.NDArray[str]:
+            return np.array(list(self), dtype=str if dtype is None else dtype)
+
+        def items_with_prefix(self, prefix: str) -> list[tuple[str, int]]:
+            """
+            Returns all words starting with prefix together with their ids in the model.
+            """
+            return [(word, int(self.model_ids[trie_id])) for word, trie_id in self.trie.items(prefix)]
+
+    class TrieWord2Id(typing.Mapping[str, int]):
+        """
+        The word2id of a TrieVocabulary, the ids are looked up in the trie instead of a dict.
+        """
+
+        def __init__(self, vocabulary: 'SimpleTopicModel.TrieVocabulary'):
+            self._v = vocabulary
+
+        def __getitem__(self, word: str) -> int:
+            return int(self._v.model_ids[self._v.trie[word]])
+
+        def __contains__(self, word: object) -> bool:
+            return word in self._v
+
+        def __len__(self) -> int:
+            return len(self._v)
+
+        def __iter__(self) -> typing.Iterator[str]:
+            return iter(self._v)
+
+    @typing.runtime_checkable
+    class DocTopicDistsSource(Protocol):
+        """
+        Provides the doc_topic_dists of a stored model without holding them in memory.
+        """
+
+        @abc.abstractmethod
+        def load(self) -> npt.NDArray[np.floating]:
+            ...
+
+        @abc.abstractmethod
+        def iter_blocks(self, block_size: int) -> typing.Iterator[npt.NDArray[np.floating]]:
+            ...
+
+    class StoredDocTopicDists(DocTopicDistsSource):
+        def __init__(self, path: Path | PathLike[str] | str):
+            if not isinstance(path, Path):
+                path = Path(path)
+            self._p = path
+
+        def load(self) -> npt.NDArray[np.floating]:
+            return SimpleTopicModel.load_partial(self._p, SimpleTopicModel.Target.DOC_TOPIC_DISTS)
+
+        def iter_blocks(self, block_size: int) -> typing.Iterator[npt.NDArray[np.floating]]:
+            if (binary := SimpleTopicModel._get_binary_path(self._p)) is not None:
+                dists = SimpleTopicModel._load_binary_member(binary, SimpleTopicModel.BinaryTarget.DOC_TOPIC_DISTS)
+                for start in range(0, len(dists), block_size):
+                    yield dists[start:start + block_size]
+                return
+            with SimpleTopicModel._get_filesys(self._p) as inp:
+                with inp.open(SimpleTopicModel.Target.DOC_TOPIC_DISTS) as targ:
+                    for block in _iter_line_blocks(targ, block_size):
+                        yield _parse_block(block).astype(np.float32)
+
     class TM_Output(Protocol):
         @abc.abstractmethod
         def open(self, path: str) -> typing.TextIO:
@@ -195,47 +788,68 @@ class SimpleTopicModel:
             return self
 
     class TM_Output_FileSystem(TM_Output):
+        """
+        Every file is written next to its target and replaces it on exit, a lazily loaded model
+        can therefore be saved to the directory it reads its doc_topic_dists from.
+        """
+
         def __init__(self, path: Path | PathLike[str] | str):
             if not isinstance(path, Path):
                 path = Path(path)
             self._p = path
+            self._written: list[tuple[Path, Path]] = []
 
         def open(self, path: str) -> typing.TextIO:
             p = self._p / path
-            if not p.exists():
-                p.parent.mkdir(parents=True, exist_ok=True)
-                p.touch(exist_ok=True)
-            return (self._p / path).open('w', encoding='utf-8')
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp = p.with_name(p.name + '.tmp')
+            self._written.append((tmp, p))
+            return tmp.open('w', encoding='utf-8')
 
         def __exit__(self, exc_type, exc_val, exc_tb):
-            pass
-
-    class _TextIO(io.StringIO):
-        _z: zipfile.ZipFile
+            for tmp, p in self._written:
+                if exc_type is None:
+                    os.replace(tmp, p)
+                else:
+                    tmp.unlink(missing_ok=True)
+
+    class _TextIO(io.TextIOWrapper):
+        """
+        Streams the text into the zip member, it is encoded and written in blocks of BLOCK_SIZE bytes.
+        """
+        BLOCK_SIZE = 1024 * 1024
 
         def __init__(self, z: zipfile.ZipFile, path: str):
-            self._z: zipfile.ZipFile = z
-            self._p = path
-            super().__init__()
-
-        def __enter__(self):
-            return self
-
-        def __exit__(self, exc_type, exc_val, exc_tb):
-            self._z.writestr(self._p, self.getvalue().encode(encoding='UTF-8'))
-            super().__exit__(exc_type, exc_val, exc_tb)
+            super().__init__(
+                io.BufferedWriter(
+                    z.open(path, mode='w', force_zip64=True),
+                    buffer_size=SimpleTopicModel._TextIO.BLOCK_SIZE
+                ),
+                encoding='UTF-8',
+                newline='\n'
+            )
 
     class TM_Output_Zip(TM_Output):
+        """
+        The zip is written next to path and replaces it on exit, see TM_Output_FileSystem.
+        """
+
         def __init__(self, path: Path | PathLike[str] | str):
             if not isinstance(path, Path):
                 path = Path(path)
-            self._z = zipfile.ZipFile(path, mode='w')
+            self._p = path
+            self._tmp = path.with_name(path.name + '.tmp')
+            self._z = zipfile.ZipFile(self._tmp, mode='w')
 
         def open(self, path: str) -> typing.TextIO:
             return SimpleTopicModel._TextIO(self._z, path)
 
         def __exit__(self, exc_type, exc_val, exc_tb):
             self._z.close()
+            if exc_type is None:
+                os.replace(self._tmp, self._p)
+            else:
+                self._tmp.unlink(missing_ok=True)
 
     class TM_Input(Protocol):
         @abc.abstractmethod
@@ -280,28 +894,112 @@ class SimpleTopicModel:
 
         with out.open(SimpleTopicModel.Target.VOCABULARY_FREQ) as voc:
             for f in self.term_frequency:
-                voc.write(f"{float_to_str(f)}\n")
+                voc.write(f"{int(f)}\n")
 
         with out.open(SimpleTopicModel.Target.DOC_LENGTHS) as voc:
             for f in self.doc_lengths:
                 voc.write(f"{f}\n")
 
         with out.open(SimpleTopicModel.Target.DOC_TOPIC_DISTS) as mf:
-            for topic in self.doc_topic_dists:
-                mf.write(' '.join(float_to_str(x) for x in topic))
-                mf.write("\n")
+            for block in self.iter_doc_topic_dists():
+                for topic in block:
+                    mf.write(_format_row(topic))
+                    mf.write("\n")
 
         with out.open(SimpleTopicModel.Target.MODEL) as mf:
             for topic in self.topics:
-                mf.write(' '.join(float_to_str(x) for x in topic))
+                mf.write(_format_row(topic))
                 mf.write("\n")
 
-    def save(self, path: str | Path, mode: LDASaveMode = 'p'):
+    def _save_binary(self, path: Path, quantization: 'SimpleTopicModel.Quantization | None' = None):
+        """
+        Writes every component as a npy file, the version info is written last and marks a complete model.
+        The model is written to a sibling directory and swapped in when it is complete, the arrays of a model
+        loaded from path may be memory mapped and are read while writing.
+        """
+        staging = path.with_name(path.name + '.tmp')
+        if staging.exists():
+            shutil.rmtree(staging)
+        staging.mkdir(parents=True)
+        try:
+            self._write_binary(staging, quantization)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        if path.exists():
+            # Open memory maps keep the replaced files alive.
+            replaced = path.with_name(path.name + '.old')
+            if replaced.exists():
+                shutil.rmtree(replaced)
+            os.replace(path, replaced)
+            os.replace(staging, path)
+            shutil.rmtree(replaced, ignore_errors=True)
+        else:
+            os.replace(staging, path)
+
+    def _write_binary(self, path: Path, quantization: 'SimpleTopicModel.Quantization | None' = None):
+        version_info = path / SimpleTopicModel.BinaryTarget.VERSION_INFO
+
+        blob, offsets = _pack_vocabulary(self.vocabulary)
+        np.save(path / SimpleTopicModel.BinaryTarget.VOCABULARY, blob)
+        np.save(path / SimpleTopicModel.BinaryTarget.VOCABULARY_OFFSETS, offsets)
+        trie_vocabulary = self.vocabulary
+        if not isinstance(trie_vocabulary, SimpleTopicModel.TrieVocabulary):
+            try:
+                trie_vocabulary = SimpleTopicModel.TrieVocabulary.from_words(trie_vocabulary)
+            except ValueError as e:
+                # Only the packed vocabulary is stored, see _load_binary_trie_vocabulary.
+                print(f"The vocabulary is stored without a trie: {e}")
+                trie_vocabulary = None
+        if trie_vocabulary is not None:
+            np.save(
+                path / SimpleTopicModel.BinaryTarget.VOCABULARY_TRIE_IDS,
+                trie_vocabulary.save(path / SimpleTopicModel.BinaryTarget.VOCABULARY_TRIE)
+            )
+        np.save(path / SimpleTopicModel.BinaryTarget.TERM_FREQUENCY, self.term_frequency)
+        np.save(path / SimpleTopicModel.BinaryTarget.DOC_LENGTHS, self.doc_lengths)
+        np.save(path / SimpleTopicModel.BinaryTarget.DOC_TOPIC_DISTS, self.doc_topic_dists)
+        if quantization is None:
+            np.save(path / SimpleTopicModel.BinaryTarget.TOPICS, self.topics)
+        else:
+            for target, value in quantization.quantize(self.topics).items():
+                np.save(path / target, value)
+
+        info = {
+            "format": "binary",
+            "version": 1 if quantization is None else SimpleTopicModel.BINARY_VERSION,
+            "dtype": np.dtype(self.topics.dtype).name,
+            "alpha": None if self.alpha is None else np.asarray(self.alpha, dtype=np.float64).tolist(),
+        }
+        if quantization is not None:
+            info["quantization"] = quantization.to_info()
+            info["shape"] = list(self.topics.shape)
+        version_info.write_text(json.dumps(info), encoding='utf-8')
+
+    def save(
+            self,
+            path: str | Path,
+            mode: LDASaveMode = 'p',
+            quantization: 'SimpleTopicModel.Quantization | None' = None
+    ):
+        """
+        A quantization makes the storage of the topics lossy, it is only supported by the binary mode.
+        load prefers the binary layout over the zip over the plain files, therefore a saved model removes
+        the models of the preferred layouts in path after it is written.
+        """
         if isinstance(path, str):
             path = Path(path)
 
+        if quantization is not None and mode not in ('b', 'binary'):
+            raise ValueError(f"The mode {mode} does not support a quantization, use the binary mode!")
+
         path.mkdir(parents=True, exist_ok=True)
 
+        if mode in ('b', 'binary'):
+            self._save_binary(path / SimpleTopicModel.MODEL_BINARY_PATH, quantization)
+            shutil.rmtree(path / SimpleTopicModel.MODEL_BINARY_LEGACY_PATH, ignore_errors=True)
+            return
+
         if mode in ('p', 'plain'):
             out = SimpleTopicModel.TM_Output_FileSystem(path)
         else:
@@ -310,31 +1008,140 @@ class SimpleTopicModel:
         with out as o:
             self._save_routinr(o)
 
+        # Open memory maps of a removed binary model stay valid.
+        shutil.rmtree(path / SimpleTopicModel.MODEL_BINARY_PATH, ignore_errors=True)
+        shutil.rmtree(path / SimpleTopicModel.MODEL_BINARY_LEGACY_PATH, ignore_errors=True)
+        if mode in ('p', 'plain'):
+            (path / SimpleTopicModel.MODEL_ZIP_PATH).unlink(missing_ok=True)
+
     @staticmethod
-    def _load_routine(inp: TM_Input) -> 'SimpleTopicModel':
+    def _load_routine(
+            inp: TM_Input,
+            doc_topic_dists: 'SimpleTopicModel.DocTopicDistsSource | None' = None,
+            skip_doc_topic_dists: bool = False,
+            vocabulary_backend: VocabularyBackend = 'numpy'
+    ) -> 'SimpleTopicModel':
+        """
+        Reads the doc_topic_dists only if there is no source for them and they are not skipped.
+        """
         with inp.open(SimpleTopicModel.Target.VOCABULARY) as voc:
-            vocabulary = tuple(x.rstrip() for x in voc.readlines())
-
-        with inp.open(SimpleTopicModel.Target.VOCABULARY_FREQ) as voc:
-            term_frequency = tuple(int(x) for x in voc.readlines())
-
-        with inp.open(SimpleTopicModel.Target.DOC_LENGTHS) as voc:
-            doc_lengths = tuple(int(x) for x in voc.readlines())
+            vocabulary = tuple(x.rstrip() for x in voc)
 
-        with inp.open(SimpleTopicModel.Target.MODEL) as mf:
-            topics = tuple(tuple(float(value) for value in line.split(' ')) for line in mf.readlines())
+        term_frequency = _read_vector(lambda: inp.open(SimpleTopicModel.Target.VOCABULARY_FREQ), np.int32)
+        doc_lengths = _read_vector(lambda: inp.open(SimpleTopicModel.Target.DOC_LENGTHS), np.int32)
+        topics = _read_matrix(lambda: inp.open(SimpleTopicModel.Target.MODEL), np.float32)
 
-        with inp.open(SimpleTopicModel.Target.DOC_TOPIC_DISTS) as mf:
-            doc_topic_dists = tuple(tuple(float(value) for value in line.split(' ')) for line in mf.readlines())
+        if doc_topic_dists is None and not skip_doc_topic_dists:
+            doc_topic_dists = _read_matrix(lambda: inp.open(SimpleTopicModel.Target.DOC_TOPIC_DISTS), np.float32)
 
         return SimpleTopicModel(
             vocabulary=vocabulary,
             topics=topics,
             term_frequency=term_frequency,
             doc_lengths=doc_lengths,
-            doc_topic_dists=doc_topic_dists
+            doc_topic_dists=doc_topic_dists,
+            vocabulary_backend=vocabulary_backend
         )
 
+    @staticmethod
+    def _get_binary_path(path: _PathType) -> Path | None:
+        """
+        Returns the path to the binary model if there is a complete one.
+        """
+        if not isinstance(path, Path):
+            path = Path(path)
+        for name in (SimpleTopicModel.MODEL_BINARY_PATH, SimpleTopicModel.MODEL_BINARY_LEGACY_PATH):
+            binary = path / name
+            if (binary / SimpleTopicModel.BinaryTarget.VERSION_INFO).exists():
+                return binary
+        return None
+
+    @staticmethod
+    def _read_binary_info(path: Path) -> dict[str, typing.Any]:
+        info = json.loads((path / SimpleTopicModel.BinaryTarget.VERSION_INFO).read_text(encoding='utf-8'))
+        if info.get("format") != "binary" or info.get("version", 0) > SimpleTopicModel.BINARY_VERSION:
+            raise ValueError(f"Unsupported binary model at {path}: {info}")
+        return info
+
+    @staticmethod
+    def _load_binary_member(path: Path, target: 'SimpleTopicModel.BinaryTarget') -> npt.NDArray:
+        return np.load(path / target, mmap_mode='r', allow_pickle=False)
+
+    @staticmethod
+    def _load_binary_trie_vocabulary(path: Path) -> 'SimpleTopicModel.TrieVocabulary':
+        """
+        Memory maps the stored trie, older binary models without a trie get a new one.
+        """
+        if (path / SimpleTopicModel.BinaryTarget.VOCABULARY_TRIE).exists():
+            return SimpleTopicModel.TrieVocabulary.load(
+                path / SimpleTopicModel.BinaryTarget.VOCABULARY_TRIE,
+                SimpleTopicModel._load_binary_member(path, SimpleTopicModel.BinaryTarget.VOCABULARY_TRIE_IDS)
+            )
+        return SimpleTopicModel.TrieVocabulary.from_words(
+            _unpack_vocabulary(
+                SimpleTopicModel._load_binary_member(path, SimpleTopicModel.BinaryTarget.VOCABULARY),
+                SimpleTopicModel._load_binary_member(path, SimpleTopicModel.BinaryTarget.VOCABULARY_OFFSETS),
+            )
+        )
+
+    @staticmethod
+    def _load_binary(
+            path: Path,
+            doc_topic_dists: 'SimpleTopicModel.DocTopicDistsSource | None' = None,
+            skip_doc_topic_dists: bool = False,
+            vocabulary_backend: VocabularyBackend = 'numpy'
+    ) -> 'SimpleTopicModel':
+        info = SimpleTopicModel._read_binary_info(path)
+        topics = SimpleTopicModel._load_binary_topics(path, info)
+        if doc_topic_dists is None and not skip_doc_topic_dists:
+            doc_topic_dists = SimpleTopicModel._load_binary_member(path, SimpleTopicModel.BinaryTarget.DOC_TOPIC_DISTS)
+        if vocabulary_backend == 'trie':
+            vocabulary = SimpleTopicModel._load_binary_trie_vocabulary(path)
+        else:
+            vocabulary = SimpleTopicModel._load_binary_partial(path, SimpleTopicModel.Target.VOCABULARY)
+        return SimpleTopicModel(
+            vocabulary=vocabulary,
+            topics=topics,
+            term_frequency=SimpleTopicModel._load_binary_member(path, SimpleTopicModel.BinaryTarget.TERM_FREQUENCY),
+            doc_lengths=SimpleTopicModel._load_binary_member(path, SimpleTopicModel.BinaryTarget.DOC_LENGTHS),
+            doc_topic_dists=doc_topic_dists,
+            alpha=info.get("alpha"),
+            dtype=topics.dtype.type,
+            vocabulary_backend=vocabulary_backend
+        )
+
+    @staticmethod
+    def _load_binary_topics(path: Path, info: dict[str, typing.Any]) -> npt.NDArray[np.floating]:
+        """
+        Quantized topics are dequantized into a dense array of the original dtype, otherwise they are memory mapped.
+        """
+        if (quantization := info.get("quantization")) is None:
+            return SimpleTopicModel._load_binary_member(path, SimpleTopicModel.BinaryTarget.TOPICS)
+        return SimpleTopicModel.Quantization.from_info(quantization).dequantize(
+            functools.partial(SimpleTopicModel._load_binary_member, path),
+            tuple(info["shape"]),
+            np.dtype(info["dtype"]).type
+        )
+
+    @staticmethod
+    def _load_binary_partial(path: Path, target: 'SimpleTopicModel.Target') -> npt.NDArray:
+        match target:
+            case SimpleTopicModel.Target.MODEL:
+                return SimpleTopicModel._load_binary_topics(path, SimpleTopicModel._read_binary_info(path))
+            case SimpleTopicModel.Target.DOC_TOPIC_DISTS:
+                return SimpleTopicModel._load_binary_member(path, SimpleTopicModel.BinaryTarget.DOC_TOPIC_DISTS)
+            case SimpleTopicModel.Target.VOCABULARY_FREQ:
+                return SimpleTopicModel._load_binary_member(path, SimpleTopicModel.BinaryTarget.TERM_FREQUENCY)
+            case SimpleTopicModel.Target.DOC_LENGTHS:
+                return SimpleTopicModel._load_binary_member(path, SimpleTopicModel.BinaryTarget.DOC_LENGTHS)
+            case SimpleTopicModel.Target.VOCABULARY:
+                return np.array(_unpack_vocabulary(
+                    SimpleTopicModel._load_binary_member(path, SimpleTopicModel.BinaryTarget.VOCABULARY),
+                    SimpleTopicModel._load_binary_member(path, SimpleTopicModel.BinaryTarget.VOCABULARY_OFFSETS),
+                ), dtype=str)
+            case invalid:
+                raise ValueError(f"The target {invalid} is not supported by the binary layout!")
+
     @staticmethod
     def _get_filesys(path: _PathType) -> TM_Input:
         if not isinstance(path, Path):
@@ -348,42 +1155,105 @@ class SimpleTopicModel:
 
     @staticmethod
     def _load_partial(inp: TM_Input, target: 'SimpleTopicModel.Target') -> npt.NDArray:
-        with inp.open(target) as targ:
-            match target:
-                case SimpleTopicModel.Target.MODEL | SimpleTopicModel.Target.DOC_TOPIC_DISTS:
-                    loaded = tuple(
-                        np.array(tuple(float(value) for value in line.split(' ')), dtype=np.float32) for line in
-                        targ.readlines())
-                    return np.array(
-                        loaded,
-                        dtype=np.dtype(np.dtype(np.float32))
-                    )
-                case SimpleTopicModel.Target.VOCABULARY_FREQ | SimpleTopicModel.Target.DOC_LENGTHS:
-                    loaded = tuple(int(x) for x in targ.readlines())
-                    return np.array(loaded, dtype=np.int32)
-                case SimpleTopicModel.Target.VOCABULARY:
-                    loaded = tuple(x.rstrip() for x in targ.readlines())
-                    return np.array(loaded, dtype=str)
+        match target:
+            case SimpleTopicModel.Target.MODEL | SimpleTopicModel.Target.DOC_TOPIC_DISTS:
+                return _read_matrix(lambda: inp.open(target), np.float32)
+            case SimpleTopicModel.Target.VOCABULARY_FREQ | SimpleTopicModel.Target.DOC_LENGTHS:
+                return _read_vector(lambda: inp.open(target), np.int32)
+            case SimpleTopicModel.Target.VOCABULARY:
+                with inp.open(target) as targ:
+                    return np.array(tuple(x.rstrip() for x in targ), dtype=str)
 
     @staticmethod
     def load_partial(path: _PathType, target: 'SimpleTopicModel.Target') -> npt.NDArray:
+        if (binary := SimpleTopicModel._get_binary_path(path)) is not None:
+            SimpleTopicModel._read_binary_info(binary)
+            return SimpleTopicModel._load_binary_partial(binary, target)
         with SimpleTopicModel._get_filesys(path) as inp:
             return SimpleTopicModel._load_partial(inp, target)
 
     @staticmethod
-    def load(path: _PathType) -> 'SimpleTopicModel':
+    def load(
+            path: _PathType,
+            doc_topic_dists: DocTopicDistsMode = 'lazy',
+            vocabulary_backend: VocabularyBackend = 'numpy'
+    ) -> 'SimpleTopicModel':
+        """
+        Loads a model, the binary layout is preferred if it exists. The arrays of a binary model are memory mapped.
+        By default the doc_topic_dists are only loaded on first access, see DocTopicDistsMode.
+        With the trie backend the vocabulary is kept compact, see VocabularyBackend.
+        """
+        match doc_topic_dists:
+            case 'lazy':
+                source, skip = SimpleTopicModel.StoredDocTopicDists(path), False
+            case 'eager':
+                source, skip = None, False
+            case 'skip':
+                source, skip = None, True
+            case invalid:
+                raise ValueError(f"Illegal mode: {invalid}")
+        if (binary := SimpleTopicModel._get_binary_path(path)) is not None:
+            return SimpleTopicModel._load_binary(binary, source, skip, vocabulary_backend)
         with SimpleTopicModel._get_filesys(path) as inp:
-            return SimpleTopicModel._load_routine(inp)
+            return SimpleTopicModel._load_routine(inp, source, skip, vocabulary_backend)
+
+    @staticmethod
+    def convert_to_binary(
+            path: _PathType,
+            target: _PathType | None = None,
+            quantization: 'SimpleTopicModel.Quantization | None' = None
+    ) -> Path:
+        """
+        Converts a plain or zipped model at path to the binary layout.
+        If target is None the binary model is stored next to the original one.
+        """
+        if not isinstance(path, Path):
+            path = Path(path)
+        with SimpleTopicModel._get_filesys(path) as inp:
+            model = SimpleTopicModel._load_routine(inp)
+        target = path if target is None else Path(target)
+        model.save(target, 'b', quantization)
+        return target
+
+    def quantization_report(
+            self,
+            quantization: 'SimpleTopicModel.Quantization',
+            top_n: int = 20
+    ) -> 'SimpleTopicModel.QuantizationReport':
+        """
+        Quantizes the topics in memory and compares the restored topics with the original ones.
+        """
+        members = quantization.quantize(self.topics)
+        restored = quantization.dequantize(members.__getitem__, self.topics.shape, self.dtype)
+        error = np.abs(restored.astype(np.float64) - self.topics)
+        top_n = min(top_n, self.topics.shape[1])
+        original_top = self.top_word_ids(top_n)
+        restored_top = SimpleTopicModel._top_ids(restored, top_n)
+        overlap = np.mean([len(np.intersect1d(a, b)) / top_n for a, b in zip(original_top, restored_top)])
+        return SimpleTopicModel.QuantizationReport(
+            max_abs_error=float(error.max(initial=0.0)),
+            mean_abs_error=float(error.mean()) if error.size else 0.0,
+            top_n=top_n,
+            top_n_overlap=float(overlap),
+            top_n_rank_agreement=float(np.mean(original_top == restored_top)),
+            stored_bytes=sum(value.nbytes for value in members.values()),
+            original_bytes=self.topics.nbytes
+        )
 
     def visualize(self, output_file: Path | str | PathLike[str]):
         if isinstance(output_file, str):
             output_file = Path(output_file)
 
+        # pyLDAvis only needs the topic frequencies of the documents, they are passed as a single
+        # document so the doc_topic_dists never have to be in memory as a whole.
+        topic_frequency = self.topic_frequency()
+        total = topic_frequency.sum()
+
         data = pyLDAvis.prepare(
             self.topics,
-            self.doc_topic_dists,
-            self.doc_lengths,
-            self.vocabulary,
+            (topic_frequency / total)[None, :],
+            np.array([total]),
+            np.asarray(self.vocabulary),
             self.term_frequency,
             start_index=0,
             sort_topics=False
@@ -397,22 +1267,39 @@ class SimpleTopicModel:
     def translate(self, words: typing.Iterable[str]) -> list[tuple[str, int | None]]:
         return [(word, self.word2id.get(word, None)) for word in words]
 
+    def get_words_with_prefix(self, prefix: str) -> list[tuple[str, int]]:
+        """
+        Returns all words of the vocabulary starting with prefix together with their ids.
+        """
+        if isinstance(self.vocabulary, SimpleTopicModel.TrieVocabulary):
+            return self.vocabulary.items_with_prefix(prefix)
+        ids = np.flatnonzero(np.char.startswith(self.vocabulary, prefix))
+        return [(str(self.vocabulary[i]), int(i)) for i in ids]
+
     def get_top_topic_words_iter(self, topic: int) -> typing.Iterator[tuple[str, float]]:
-        _sorted = np.flip(np.argsort(self.topics[topic]))
-        for value in _sorted:
+        # Starts with the index and only sorts the whole topic if the consumer needs more words.
+        top = self.top_word_ids(self.top_index_depth)[topic]
+        for value in top:
             yield str(self.vocabulary[value]), float(self.topics[topic][value])
+        if len(top) < self.topics.shape[1]:
+            topic_values = self.topics[topic:topic + 1]
+            full = self._sort_descending(topic_values, np.arange(topic_values.shape[1])[None, :])[0]
+            for value in full[len(top):]:
+                yield str(self.vocabulary[value]), float(self.topics[topic][value])
 
     def get_all_top_topic_words_iter(self) -> list[typing.Iterator[tuple[str, float]]]:
         return [self.get_top_topic_words_iter(k) for k in range(self.k)]
 
     def get_top_topic_words(self, topic: int, n: int | None = None) -> list[tuple[str, float]]:
-        _sorted = np.flip(np.argsort(self.topics[topic]))
-        if n is not None:
-            _sorted = _sorted[:n]
+        _sorted = self.top_word_ids(n)[topic]
         return [(str(self.vocabulary[x]), float(self.topics[topic][x])) for x in _sorted]
 
     def get_all_top_topic_words(self, n: int | None = 10) -> list[list[tuple[str, float]]]:
-        return [self.get_top_topic_words(k, n) for k in range(self.k)]
+        top = self.top_word_ids(n)
+        return [
+            [(str(self.vocabulary[x]), float(self.topics[k][x])) for x in top[k]]
+            for k in range(self.k)
+        ]
 
     def summary(self, *, file: SupportsWrite[str] | None = None):
         for topic in range(self.k):
@@ -447,27 +1334,101 @@ class SimpleTopicModel:
         with (target_path / 'summary.txt').open('w', encoding='UTF-8', newline='\n') as w:
             self.summary(file=w)
 
-    def topic_as_sorted_strings(self, topic: int) -> list[str]:
-        _sorted = np.flip(np.argsort(self.topics[topic]))
-        return list(np.array(self.vocabulary)[_sorted])
+    def topic_as_sorted_strings(self, topic: int, n: int | None = None) -> list[str]:
+        _sorted = self.top_word_ids(n)[topic]
+        return list(self.vocabulary[_sorted])
 
-    def topics_as_sorted_strings(self) -> list[list[str]]:
-        return [self.topic_as_sorted_strings(x) for x in range(self.k)]
+    def topics_as_sorted_strings(self, n: int | None = None) -> list[list[str]]:
+        return [list(self.vocabulary[ids]) for ids in self.top_word_ids(n)]
 
     @classmethod
     def prepare_coherence_model_data(cls, path_or_corpus: _PathType | tp.utils.Corpus) -> CoherenceModelData:
         return CoherenceModelData.create_from(path_or_corpus)
 
+    def _word_ids(self, words: typing.Iterable[str | int]) -> npt.NDArray[np.int64]:
+        """
+        Translates the words to ids, unknown words and ids outside the vocabulary get the id -1.
+        """
+        size = len(self.vocabulary)
+        ids = np.fromiter(
+            (self.word2id.get(x, -1) if isinstance(x, str) else x for x in words),
+            dtype=np.int64
+        )
+        ids[(ids < 0) | (ids >= size)] = -1
+        return ids
+
+    def get_word_probabilities(
+            self,
+            words: typing.Iterable[str | int]
+    ) -> tuple[npt.NDArray[np.floating], npt.NDArray[np.bool_]]:
+        """
+        Returns the probabilities of the words for every topic (k x words) and a mask of the known words.
+        The columns of unknown words are 0.
+        """
+        ids = self._word_ids(words)
+        known = ids >= 0
+        probabilities = self.topics[:, np.where(known, ids, 0)]
+        probabilities[:, ~known] = 0
+        return probabilities, known
+
     def get_word_probability(self, word: str | int, min_probability: float = 1E-10) -> list[tuple[int, float]]:
-        if isinstance(word, str):
-            word = self.word2id[word]
         min_probability = max(1E-10, min_probability)
-        values: list[tuple[int, float]] = []
-        for topic_id in range(self.k):
-            prob = float(self.topics[topic_id][word])
-            if prob >= min_probability:
-                values.append((topic_id, prob))
-        return values
+        probabilities, known = self.get_word_probabilities((word,))
+        if not known[0]:
+            raise KeyError(word)
+        column = probabilities[:, 0]
+        return [(int(topic_id), float(column[topic_id])) for topic_id in np.flatnonzero(column >= min_probability)]
+
+    @dataclasses.dataclass(frozen=True, slots=True)
+    class WordTopics:
+        """
+        The per word topics of a document, one row per unique word of the document.
+        """
+        word_ids: npt.NDArray[np.int64]
+        phi: npt.NDArray[np.floating]
+        """The phi values (words x k), values below the minimum are 0."""
+        topics_sorted: npt.NDArray[np.intp]
+        """The topics of every word by descending phi value (words x k)."""
+        topic_counts: npt.NDArray[np.intp]
+        """The number of topics per word with a phi value above the minimum, the first entries of topics_sorted."""
+
+    def get_doc_topics(
+            self,
+            doc: typing.Iterable[str] | typing.Iterable[int],
+            minimum_phi_value: float = 1E-10,
+            per_word_topics: bool = False
+    ) -> 'tuple[npt.NDArray[np.floating], SimpleTopicModel.WordTopics | None]':
+        """
+        The array version of get_doc_probability. Returns the normalized topic distribution of the document
+        and, if per_word_topics is set, the per word topics for all words of the document at once.
+        """
+        minimum_phi_value = max(1E-10, minimum_phi_value)
+        if not isinstance(doc, list):
+            doc = list(doc)
+        bow, missing = self.doc2bow(doc)
+        gamma, phis = self.inference([bow], collect_sstats=per_word_topics)
+        topic_dist = gamma[0] / gamma[0].sum()
+        if not per_word_topics:
+            return topic_dist, None
+
+        word_ids = np.fromiter((word_type for word_type, _ in bow), dtype=np.int64, count=len(bow))
+        return topic_dist, self._word_topics(phis, word_ids, minimum_phi_value)
+
+    def _word_topics(
+            self,
+            phis: npt.NDArray[np.floating],
+            word_ids: npt.NDArray[np.int64],
+            minimum_phi_value: float
+    ) -> 'SimpleTopicModel.WordTopics':
+        phi = phis[:, word_ids].T
+        above = phi >= minimum_phi_value
+        phi = np.where(above, phi, 0)
+        return SimpleTopicModel.WordTopics(
+            word_ids=word_ids,
+            phi=phi,
+            topics_sorted=self._sort_descending(phi, np.broadcast_to(np.arange(self.k), phi.shape)),
+            topic_counts=above.sum(axis=1)
+        )
 
     def get_doc_probability(
             self,
@@ -478,44 +1439,27 @@ class SimpleTopicModel:
     ) -> tuple[
         list[tuple[int, float]], None | list[tuple[int, list[int]]], None | list[tuple[int, list[tuple[int, float]]]]]:
         minimum_probability = max(1E-10, minimum_probability)
-        minimum_phi_value = max(1E-10, minimum_phi_value)
-        if not isinstance(doc, list):
-            doc = list(doc)
-        bow, missing = self.doc2bow(doc)
-        #  bow = [(word_i2, count)...]
-        gamma, phis = self.inference([bow], collect_sstats=per_word_topics)
-        topic_dist = gamma[0] / sum(gamma[0])  # normalize distribution
+        topic_dist, word_topics = self.get_doc_topics(doc, minimum_phi_value, per_word_topics)
 
         document_topics: list[tuple[int, float]] = [
             (topicid, topicvalue) for topicid, topicvalue in enumerate(topic_dist)
             if topicvalue >= minimum_probability
         ]
 
-        if not per_word_topics:
+        if word_topics is None:
             return document_topics, None, None
 
-        word_topic: list[tuple[int, list[int]]] = []  # contains word and corresponding topic
-        word_phi: list[tuple[int, list[tuple[int, float]]]] = []  # contains word and phi values
-        for word_type, weight in bow:
-            phi_values: list[tuple[float, int]] = []  # contains (phi_value, topic) pairing to later be sorted
-            phi_topic: list[
-                tuple[int, float]] = []  # contains topic and corresponding phi value to be returned 'raw' to user
-            for topic_id in range(self.k):
-                _v = float(phis[topic_id][word_type])
-                if _v >= minimum_phi_value:
-                    # appends phi values for each topic for that word
-                    # these phi values are scaled by feature length
-                    phi_values.append((_v, topic_id))
-                    phi_topic.append((topic_id, _v))
-
-            # list with ({word_id => [(topic_0, phi_value), (topic_1, phi_value) ...]).
-            word_phi.append((word_type, phi_topic))
-            # sorts the topics based on most likely topic
-            # returns a list like ({word_id => [topic_id_most_probable, topic_id_second_most_probable, ...]).
-            sorted_phi_values = sorted(phi_values, reverse=True)
-            topics_sorted = [x[1] for x in sorted_phi_values]
-            word_topic.append((word_type, topics_sorted))
-
+        # list with ({word_id => [topic_id_most_probable, topic_id_second_most_probable, ...]).
+        word_topic: list[tuple[int, list[int]]] = [
+            (int(word_type), topics[:count].tolist())
+            for word_type, topics, count in
+            zip(word_topics.word_ids, word_topics.topics_sorted, word_topics.topic_counts)
+        ]
+        # list with ({word_id => [(topic_0, phi_value), (topic_1, phi_value) ...]).
+        word_phi: list[tuple[int, list[tuple[int, float]]]] = [
+            (int(word_type), [(int(topic_id), float(values[topic_id])) for topic_id in np.flatnonzero(values)])
+            for word_type, values in zip(word_topics.word_ids, word_topics.phi)
+        ]
         return document_topics, word_topic, word_phi  # returns 2-tuple
 
     def prepare_inference(self, original_model: tp.LDAModel | None = None, /, alpha=None,
@@ -547,12 +1491,95 @@ class SimpleTopicModel:
 
         return [(k, v) for k, v in cts.items()], fallback
 
+    def docs2csr(
+            self,
+            docs: typing.Iterable[typing.Iterable[str] | typing.Iterable[int]]
+    ) -> tuple[scipy.sparse.csr_matrix, npt.NDArray[np.int64]]:
+        """
+        Converts the documents in one pass to a (documents x vocabulary) csr matrix with the word counts
+        and returns it together with the number of out of vocabulary tokens per document.
+        Strings are translated with word2id, integers are used as word ids.
+
+        Memory: the matrix needs 4 bytes (int32 index) + 4 bytes (float32 count) per unique word of a document
+        and 8 bytes per document for the indptr. A corpus of 1M documents with ~150 unique words per document
+        needs ~1.2 GB, the same corpus as bows (lists of tuples of python ints) needs more than 15 GB.
+        """
+        indices: list[npt.NDArray[np.int32]] = []
+        data: list[npt.NDArray[np.floating]] = []
+        lengths: list[int] = []
+        oov: list[int] = []
+        for doc in docs:
+            ids = np.fromiter(
+                (self.word2id.get(x, -1) if isinstance(x, str) else x for x in doc),
+                dtype=np.int64
+            )
+            known = ids[ids >= 0]
+            oov.append(len(ids) - len(known))
+            uids, counts = np.unique(known, return_counts=True)
+            indices.append(uids.astype(np.int32))
+            data.append(counts.astype(self.dtype))
+            lengths.append(len(uids))
+
+        indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(np.asarray(lengths, dtype=np.int64), out=indptr[1:])
+        csr = scipy.sparse.csr_matrix(
+            (
+                np.concatenate(data) if data else np.zeros(0, dtype=self.dtype),
+                np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32),
+                indptr
+            ),
+            shape=(len(lengths), len(self.vocabulary))
+        )
+        return csr, np.asarray(oov, dtype=np.int64)
+
+    def inference_csr(
+            self,
+            csr: scipy.sparse.csr_matrix,
+            collect_sstats: bool = False,
+            iterations: int = 1000,
+            workers: int | None = 1,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            max_chunk_elements: int = DEFAULT_MAX_CHUNK_ELEMENTS
+    ):
+        """
+        The inference for a csr matrix created by docs2csr, the csr arrays are used directly.
+        Uses the batched inference if workers is 1, otherwise a worker pool with the given number of workers.
+        """
+        assert csr.shape[1] == len(self.vocabulary), "The csr matrix does not match the vocabulary!"
+        gamma = self.random_state.gamma(100., 1. / 100., (csr.shape[0], self.k)).astype(self.dtype, copy=False)
+        data = csr.data.astype(self.dtype, copy=False)
+        if workers == 1:
+            return batched_inference(
+                self.topics,
+                self.alpha,
+                csr.indptr,
+                csr.indices,
+                data,
+                gamma,
+                collect_sstats=collect_sstats,
+                iterations=iterations,
+                gamma_threshold=self.gamma_threshold,
+                chunk_size=chunk_size,
+                max_chunk_elements=max_chunk_elements
+            )
+        with ParallelInference(
+                self.topics,
+                self.alpha,
+                workers=workers,
+                iterations=iterations,
+                gamma_threshold=self.gamma_threshold,
+                chunk_size=chunk_size,
+                max_chunk_elements=max_chunk_elements
+        ) as pool:
+            return pool.infer(csr.indptr, csr.indices, data, gamma, collect_sstats=collect_sstats)
+
     def inference(
             self,
             chunk: list[list[tuple[int, int]]],
             collect_sstats: bool = False,
             iterations: int = 1000
     ):
+        assert self.alpha is not None, "The inference needs an alpha, see prepare_inference!"
         gamma = self.random_state.gamma(100., 1. / 100., (len(chunk), self.k)).astype(self.dtype, copy=False)
         e_log_theta = dirichlet_expectation(gamma)
         exp_e_log_theta = np.exp(e_log_theta)
@@ -611,6 +1638,178 @@ class SimpleTopicModel:
         assert gamma.dtype == self.dtype
         return gamma, sstats
 
+    def inference_batched(
+            self,
+            chunk: list[list[tuple[int, int]]],
+            collect_sstats: bool = False,
+            iterations: int = 1000,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            max_chunk_elements: int = DEFAULT_MAX_CHUNK_ELEMENTS
+    ):
+        """
+        Same as inference but runs the E-step for chunks of documents at once.
+        chunk_size limits the documents per chunk and max_chunk_elements the size of the
+        (k x documents x unique words) block held in memory for a chunk.
+        """
+        gamma = self.random_state.gamma(100., 1. / 100., (len(chunk), self.k)).astype(self.dtype, copy=False)
+        indptr, indices, data = pack_bows(chunk, self.dtype)
+        return batched_inference(
+            self.topics,
+            self.alpha,
+            indptr,
+            indices,
+            data,
+            gamma,
+            collect_sstats=collect_sstats,
+            iterations=iterations,
+            gamma_threshold=self.gamma_threshold,
+            chunk_size=chunk_size,
+            max_chunk_elements=max_chunk_elements
+        )
+
+    def inference_parallel(
+            self,
+            chunk: list[list[tuple[int, int]]],
+            collect_sstats: bool = False,
+            iterations: int = 1000,
+            workers: int | None = None,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            max_chunk_elements: int = DEFAULT_MAX_CHUNK_ELEMENTS
+    ):
+        """
+        Same as inference_batched but the chunks are processed by a pool of workers (default: all cores).
+        The results are identical to inference_batched with the same random state.
+        """
+        gamma = self.random_state.gamma(100., 1. / 100., (len(chunk), self.k)).astype(self.dtype, copy=False)
+        indptr, indices, data = pack_bows(chunk, self.dtype)
+        with ParallelInference(
+                self.topics,
+                self.alpha,
+                workers=workers,
+                iterations=iterations,
+                gamma_threshold=self.gamma_threshold,
+                chunk_size=chunk_size,
+                max_chunk_elements=max_chunk_elements
+        ) as pool:
+            return pool.infer(indptr, indices, data, gamma, collect_sstats=collect_sstats)
+
+    def log_perplexity(
+            self,
+            corpus: 'typing.Iterable[typing.Iterable[str] | typing.Iterable[int]] | scipy.sparse.csr_matrix',
+            iterations: int = 1000,
+            workers: int | None = 1,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            max_chunk_elements: int = DEFAULT_MAX_CHUNK_ELEMENTS
+    ) -> float:
+        """
+        The variational bound per word of a held-out corpus, like gensim's LdaModel.log_perplexity.
+        The perplexity is 2 ** -bound. The topics are fixed, so the bound has no topic term.
+        corpus: documents or a csr matrix created by docs2csr, unknown words are ignored.
+        """
+        if not isinstance(corpus, scipy.sparse.csr_matrix):
+            corpus, _ = self.docs2csr(corpus)
+        assert self.alpha is not None, "The inference needs an alpha, see prepare_inference!"
+        gamma, _ = self.inference_csr(
+            corpus, iterations=iterations, workers=workers, chunk_size=chunk_size, max_chunk_elements=max_chunk_elements
+        )
+        gamma = gamma.astype(np.float64)
+        alpha = np.broadcast_to(np.asarray(self.alpha, dtype=np.float64), (self.k,))
+        e_log_theta = dirichlet_expectation(gamma)
+        with np.errstate(divide='ignore'):
+            e_log_beta = np.log(self.topics.astype(np.float64)).T
+
+        # E[log p(docs | theta, beta)], the nonzero counts are processed in chunks of max_chunk_elements values.
+        rows = np.repeat(np.arange(corpus.shape[0]), np.diff(corpus.indptr))
+        step = max(1, max_chunk_elements // self.k)
+        score = 0.0
+        for start in range(0, corpus.nnz, step):
+            end = min(start + step, corpus.nnz)
+            values = scipy.special.logsumexp(
+                e_log_theta[rows[start:end]] + e_log_beta[corpus.indices[start:end]], axis=1
+            )
+            score += float(np.dot(corpus.data[start:end].astype(np.float64), values))
+
+        # E[log p(theta | alpha) - log q(theta | gamma)]
+        score += float(np.sum((alpha - gamma) * e_log_theta))
+        score += float(np.sum(scipy.special.gammaln(gamma) - scipy.special.gammaln(alpha)))
+        score += float(np.sum(scipy.special.gammaln(np.sum(alpha)) - scipy.special.gammaln(np.sum(gamma, axis=1))))
+
+        words = float(corpus.data.sum())
+        return score / words if words > 0 else float('nan')
+
+    @classmethod
+    def topics_of_tomotopy(cls, model: tp.LDAModel, dtype: np.floating = np.float32) -> 'SimpleTopicModel':
+        """
+        Only the topics and the vocabulary of a tomotopy model, without the documents of the training.
+        Enough for the inference of new documents.
+        """
+        vocabulary = tuple(model.used_vocabs)
+        topics = np.empty((model.k, len(vocabulary)), dtype=np.float64)
+        for k in range(model.k):
+            topic = model.get_topic_word_dist(k)
+            assert len(topic) == len(vocabulary)
+            topics[k] = topic
+        return cls(
+            vocabulary=vocabulary,
+            topics=topics,
+            doc_lengths=np.zeros(0, dtype=np.int32),
+            term_frequency=np.asarray(model.used_vocab_freq, dtype=np.int64),
+            alpha=model.alpha,
+            dtype=dtype
+        )
+
+    @classmethod
+    def from_py_topic_model(
+            cls,
+            model: 'ldatranslate.PyTopicModel',
+            alpha: float | None = None,
+            dtype: np.floating = np.float32,
+            normalize: bool = True
+    ) -> 'SimpleTopicModel':
+        """
+        Converts a (translated) topic model of ldatranslate, e.g. for the inference.
+        The word counts of the training are not part of a PyTopicModel, they are set to zero.
+        If normalize is set, values that are not finite are set to zero and the topics are normalized,
+        otherwise the topics are used as they are, like PyTopicModel.get_doc_probability does.
+        """
+        vocabulary = tuple(str(word) for word in model.vocabulary())
+        topics = np.array([model.get_topic(k) for k in range(model.k)], dtype=np.float64)
+        if normalize:
+            topics[~np.isfinite(topics)] = 0.0
+            sums = topics.sum(axis=1, keepdims=True)
+            np.divide(topics, sums, out=topics, where=sums > 0)
+        return cls(
+            vocabulary=vocabulary,
+            topics=topics,
+            doc_lengths=np.zeros(0, dtype=np.int32),
+            term_frequency=np.zeros(len(vocabulary), dtype=np.int32),
+            alpha=alpha,
+            dtype=dtype
+        )
+
+    def get_docs_probability(
+            self,
+            docs: typing.Iterable[typing.Iterable[str] | typing.Iterable[int]],
+            minimum_probability: float = 1E-10,
+            workers: int | None = 1,
+            chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> list[list[tuple[int, float]]]:
+        """
+        The document topics of get_doc_probability for many documents at once.
+        Uses the batched inference if workers is 1, otherwise a worker pool with the given number of workers.
+        """
+        minimum_probability = max(1E-10, minimum_probability)
+        bows = [self.doc2bow(doc if isinstance(doc, list) else list(doc))[0] for doc in docs]
+        if workers == 1:
+            gamma, _ = self.inference_batched(bows, chunk_size=chunk_size)
+        else:
+            gamma, _ = self.inference_parallel(bows, workers=workers, chunk_size=chunk_size)
+        topic_dists = gamma / gamma.sum(axis=1, keepdims=True)
+        return [
+            [(topic_id, topic_value) for topic_id, topic_value in enumerate(topic_dist) if topic_value >= minimum_probability]
+            for topic_dist in topic_dists
+        ]
+
     @classmethod
     def calculate_metrics(
             cls,
@@ -619,7 +1818,7 @@ class SimpleTopicModel:
             topn: int = 20,
             window_size: int | None = None,
     ) -> dict[str, gensim.models.CoherenceModel]:
-        lda_a = SimpleTopicModel.load(path_to_model)
+        lda_a = SimpleTopicModel.load(path_to_model, doc_topic_dists='skip')
         if isinstance(path_or_corpus_or_data, CoherenceModelData):
             data = path_or_corpus_or_data
         else:
@@ -12,16 +12,30 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
+import dataclasses
+import hashlib
+import json
+import os
 import sys
+import time
+import typing
 from os import PathLike
 from pathlib import Path
+import numpy as np
 import tomotopy as tp
-from ptmt.lda.topic_model import SimpleTopicModel
+from ptmt.lda.telemetry import TelemetryWriter, TELEMETRY_FILE_NAME
+from ptmt.lda.topic_model import SimpleTopicModel, LDASaveMode
 
 
-def export_tomotopy(model: tp.LDAModel, path: Path | str):
+def export_tomotopy(
+        model: tp.LDAModel,
+        path: Path | str,
+        mode: LDASaveMode = 'p',
+        quantization: SimpleTopicModel.Quantization | None = None
+):
     lda = SimpleTopicModel(model=model)
-    lda.save(path)
+    lda.save(path, mode, quantization)
     lda.visualize(path / 'visualisation.html')
     with (path/'summary.txt').open('w', encoding='UTF-8', newline='\n') as w:
         lda.summary(file=w)
@@ -37,17 +51,232 @@ def create_by_corpus(corpus: tp.utils.Corpus, **kwargs) -> tp.LDAModel:
     mdl.add_corpus(corpus)
     return mdl
 
-def run_lda(mdl: tp.LDAModel, output_path: Path | str | PathLike[str], iters: None | int = None) -> Path:
-    if not isinstance(output_path, Path):
-        output_path = Path(output_path)
+
+def model_fingerprint(mdl: tp.LDAModel) -> dict[str, typing.Any]:
+    """
+    The parameters and the corpus of a prepared model (after train(0)) before the training.
+    tomotopy does not expose the seed, it is part of the hash by the initial topics of the words.
+    """
+    digest = hashlib.sha256()
+    for word in mdl.vocabs:
+        digest.update(word.encode('utf-8') + b'\0')
+    for doc in mdl.docs:
+        words = np.asarray(doc.words)
+        digest.update(len(words).to_bytes(8, 'little'))
+        digest.update(words.tobytes())
+        digest.update(np.asarray(doc.topics).tobytes())
+    return {
+        'k': mdl.k,
+        'alpha': np.asarray(mdl.alpha, dtype=np.float64).tolist(),
+        'eta': float(mdl.eta),
+        'tw': int(mdl.tw),
+        'num_docs': len(mdl.docs),
+        'num_words': mdl.num_words,
+        'num_vocabs': mdl.num_vocabs,
+        'sha256': digest.hexdigest()
+    }
+
+
+StopReason = typing.Literal['iterations', 'early_stopping']
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class EarlyStopping:
+    """
+    Stops the training if the relative improvement of the log-likelihood per word over the
+    last window steps is below epsilon.
+    """
+    epsilon: float = 1E-4
+    window: int = 5
+
+    def should_stop(self, history: list[float]) -> bool:
+        if len(history) <= self.window:
+            return False
+        old, new = history[-1 - self.window], history[-1]
+        return (new - old) / abs(old) < self.epsilon
+
+
+@dataclasses.dataclass(slots=True)
+class TrainingResult:
+    iterations: int
+    stop_reason: StopReason
+    log_likelihood: list[float]
+    """The log-likelihood per word after every step, including the steps before a resume."""
+    resumed_from: int | None = None
+
+    def save(self, path: Path):
+        path.write_text(json.dumps(dataclasses.asdict(self), indent=2), encoding='utf-8')
+
+
+class Checkpoints:
+    """
+    Stores the model every interval iterations in the directory and keeps the newest keep checkpoints.
+    A checkpoint consists of the model and a json file with the state of the training, the json file is
+    written last and marks a complete checkpoint. It also contains the size and hash of the model file,
+    tomotopy aborts the process when it loads a broken file, therefore the file is checked before loading.
+    The json file contains the model_fingerprint of the model the training started with, checkpoints of
+    another model or corpus are discarded.
+    """
+
+    def __init__(self, directory: Path | str | PathLike[str], interval: int = 100, keep: int = 3):
+        assert interval > 0, "The interval has to be positive!"
+        assert keep > 0, "At least one checkpoint has to be kept!"
+        if not isinstance(directory, Path):
+            directory = Path(directory)
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+
+    def _model_path(self, iteration: int) -> Path:
+        return self.directory / f'checkpoint-{iteration:06d}.tomotopy.bin'
+
+    def _state_path(self, iteration: int) -> Path:
+        return self.directory / f'checkpoint-{iteration:06d}.json'
+
+    def iterations(self) -> list[int]:
+        """
+        The iterations of all complete checkpoints, the newest first.
+        """
+        if not self.directory.exists():
+            return []
+        found = []
+        for state in self.directory.glob('checkpoint-*.json'):
+            iteration = int(state.name[len('checkpoint-'):-len('.json')])
+            if self._model_path(iteration).exists():
+                found.append(iteration)
+        found.sort(reverse=True)
+        return found
+
+    @staticmethod
+    def _digest(path: Path) -> str:
+        with path.open('rb') as f:
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+
+    def _discard(self, iteration: int):
+        self._state_path(iteration).unlink(missing_ok=True)
+        self._model_path(iteration).unlink(missing_ok=True)
+
+    def save(self, mdl: tp.LDAModel, history: list[float], fingerprint: dict[str, typing.Any]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        iteration = mdl.global_step
+        model_path = self._model_path(iteration)
+        tmp = model_path.with_suffix('.tmp')
+        mdl.save(str(tmp), True)
+        os.replace(tmp, model_path)
+        self._state_path(iteration).write_text(json.dumps({
+            'iteration': iteration,
+            'size': model_path.stat().st_size,
+            'sha256': self._digest(model_path),
+            'fingerprint': fingerprint,
+            'log_likelihood': history
+        }), encoding='utf-8')
+        for old in self.iterations()[self.keep:]:
+            self._discard(old)
+
+    def load_newest(self, fingerprint: dict[str, typing.Any]) -> tuple[tp.LDAModel, list[float]] | None:
+        """
+        Loads the newest valid checkpoint with the fingerprint, broken checkpoints are skipped.
+        Checkpoints with another fingerprint are deleted, otherwise save would delete the new checkpoints
+        of the training as the oldest ones.
+        """
+        for iteration in self.iterations():
+            model_path = self._model_path(iteration)
+            try:
+                state = json.loads(self._state_path(iteration).read_text(encoding='utf-8'))
+                if state.get('fingerprint') != fingerprint:
+                    print(
+                        f'Discarding the checkpoint {iteration}: it belongs to another model or corpus',
+                        file=sys.stderr
+                    )
+                    self._discard(iteration)
+                    continue
+                if model_path.stat().st_size != state['size'] or self._digest(model_path) != state['sha256']:
+                    print(f'Skipping the checkpoint {iteration}: the model file was modified', file=sys.stderr)
+                    continue
+                mdl = tp.LDAModel.load(str(model_path))
+            except Exception as e:
+                print(f'Skipping the broken checkpoint {iteration}: {e}', file=sys.stderr)
+                continue
+            if mdl.global_step != state['iteration']:
+                print(f'Skipping the checkpoint {iteration}: it contains iteration {mdl.global_step}', file=sys.stderr)
+                continue
+            return mdl, state['log_likelihood']
+        return None
+
+
+def train_lda(
+        mdl: tp.LDAModel,
+        iters: int = 1000,
+        step: int = 10,
+        checkpoints: Checkpoints | None = None,
+        early_stopping: EarlyStopping | None = None,
+        workers: int = 0,
+        telemetry: Path | None = None
+) -> tuple[tp.LDAModel, TrainingResult]:
+    """
+    Trains the model in steps of step iterations up to iters iterations.
+    If there is a checkpoint of mdl and its corpus the training resumes from it, in this case the returned
+    model is not mdl.
+    workers is the number of threads of tomotopy, 0 uses all cores.
+    If telemetry is set every step is recorded in this file, see ptmt.lda.telemetry.
+    """
+    history: list[float] = []
+    resumed_from = None
     mdl.burn_in = 100
-    mdl.train(0)
+    mdl.train(0, workers=workers)
+    fingerprint = model_fingerprint(mdl) if checkpoints is not None else None
+    if checkpoints is not None and (found := checkpoints.load_newest(fingerprint)) is not None:
+        mdl, history = found
+        resumed_from = mdl.global_step
+        print(f'Resuming from the checkpoint at iteration {resumed_from}.', file=sys.stderr, flush=True)
+
     print('Num docs:', len(mdl.docs), ', Vocab size:', len(mdl.used_vocabs), ', Num words:', mdl.num_words)
     print('Removed top words:', mdl.removed_top_words)
     print('Training...', file=sys.stderr, flush=True)
-    for i in range(0, iters if iters else 1000, 10):
-        mdl.train(10)
-        print('Iteration: {}\tLog-likelihood: {}'.format(i, mdl.ll_per_word))
+    stop_reason: StopReason = 'iterations'
+    with TelemetryWriter(telemetry) if telemetry is not None else contextlib.nullcontext() as writer:
+        while mdl.global_step < iters:
+            if early_stopping is not None and early_stopping.should_stop(history):
+                stop_reason = 'early_stopping'
+                print(f'Stopping early at iteration {mdl.global_step}.', file=sys.stderr, flush=True)
+                break
+            i = mdl.global_step
+            start = time.perf_counter()
+            mdl.train(min(step, iters - i), workers=workers)
+            wall_time = time.perf_counter() - start
+            history.append(mdl.ll_per_word)
+            print('Iteration: {}\tLog-likelihood: {}'.format(i, mdl.ll_per_word))
+            if writer is not None:
+                writer.write_step(mdl, mdl.global_step - i, wall_time, workers)
+            if checkpoints is not None and mdl.global_step // checkpoints.interval > i // checkpoints.interval:
+                checkpoints.save(mdl, history, fingerprint)
+
+    return mdl, TrainingResult(mdl.global_step, stop_reason, history, resumed_from)
+
+
+def run_lda(
+        mdl: tp.LDAModel,
+        output_path: Path | str | PathLike[str],
+        iters: None | int = None,
+        checkpoint_interval: int | None = None,
+        checkpoint_keep: int = 3,
+        early_stopping: EarlyStopping | None = None
+) -> tuple[Path, tp.LDAModel]:
+    """
+    Returns the output path and the trained model, the model may be a resumed checkpoint and not mdl.
+    Checkpoints are stored in output_path / 'checkpoints' if a checkpoint_interval is set.
+    """
+    if not isinstance(output_path, Path):
+        output_path = Path(output_path)
+    checkpoints = None
+    if checkpoint_interval is not None:
+        checkpoints = Checkpoints(output_path / 'checkpoints', checkpoint_interval, checkpoint_keep)
+    mdl, result = train_lda(
+        mdl, iters if iters else 1000,
+        checkpoints=checkpoints,
+        early_stopping=early_stopping,
+        telemetry=output_path / TELEMETRY_FILE_NAME
+    )
 
     mdl.summary()
     print('Saving...', file=sys.stderr, flush=True)
@@ -56,6 +285,7 @@ def run_lda(mdl: tp.LDAModel, output_path: Path | str | PathLike[str], iters: No
     save_path.mkdir(parents=True, exist_ok=True)
 
     mdl.save(str(output_path / 'lda_model.tomotopy.bin'), True)
+    result.save(output_path / 'training.json')
 
     for k in range(mdl.k):
         print('Topic #{}'.format(k))
@@ -63,5 +293,4 @@ def run_lda(mdl: tp.LDAModel, output_path: Path | str | PathLike[str], iters: No
             print('\t', word, prob, sep='\t')
 
     export_tomotopy(mdl, save_path)
-    return output_path
-
+    return output_path, mdl
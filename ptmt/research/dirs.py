@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
+import json
 import os
 import typing
 from array import array
@@ -25,13 +27,22 @@ from gensim.models import CoherenceModel
 from ldatranslate import PyTopicModel
 from tomotopy.utils import Corpus
 
+from ptmt.lda.coherence import ApproximateCoherence
+from ptmt.lda.telemetry import TELEMETRY_FILE_NAME
+from ptmt.lda.topic_model import CoherenceModelData
 from ptmt.research.protocols import TranslationConfig
+from ptmt.research.ratings import RatingsBatch
 
 Rating = list[tuple[int, list[tuple[int, float]]]]
 """
 [(doc_id, [(topic_id, probability)])]
 """
 
+RatingView = RatingsBatch | tuple[tuple[int, list[tuple[int, float]]], ...]
+"""
+A read-only Rating, a memory mapped RatingsBatch or the cached Rating of a legacy file.
+"""
+
 NDCG = tuple[
     dict[int, tuple[list[float], None | dict[int, int | float] | list[int]]],
     list[int] | None,
@@ -60,6 +71,13 @@ class CoherencesDir:
         if isinstance(model, CoherenceModel):
             model.save(str(path.absolute()))
             return
+        if isinstance(model, ApproximateCoherence):
+            with path.open('wb') as f:
+                f.write(b"!#APPRX")
+                array('d', [
+                    float(model), model.low, model.high, model.confidence, model.sample_size, model.num_docs
+                ]).tofile(f)
+            return
         success = False
         with path.open('wb') as f:
             if not isinstance(model, float):
@@ -80,20 +98,36 @@ class CoherencesDir:
     def exists(self, name: str) -> bool:
         return self.coherence_path(name).exists()
 
-    def load_coherence(self, name: str) -> float | CoherenceModel | None:
+    def is_approximate(self, name: str) -> bool:
+        path = self.coherence_path(name)
+        if not path.exists():
+            return False
+        with path.open('rb') as f:
+            return f.read(len(b"!#APPRX")) == b"!#APPRX"
+
+    def load_coherence(self, name: str) -> float | ApproximateCoherence | CoherenceModel | None:
+        """
+        Approximate coherences are loaded as ApproximateCoherence, a float with the confidence interval.
+        """
         path = self.coherence_path(name)
         if path.exists():
             with path.open('rb') as f:
-                if b"!#VALUE" == f.read(len(b"!#VALUE")):
+                marker = f.read(len(b"!#VALUE"))
+                if b"!#VALUE" == marker:
                     arr = array('d')
                     arr.frombytes(f.read())
                     ret_val = arr[0]
                     del arr
                     return ret_val
+                if b"!#APPRX" == marker:
+                    arr = array('d')
+                    arr.frombytes(f.read())
+                    value, low, high, confidence, sample_size, num_docs = arr
+                    return ApproximateCoherence(value, low, high, confidence, int(sample_size), int(num_docs))
             return CoherenceModel.load(str(path.absolute()))
         return None
 
-    def load_coherences(self) -> dict[str, float | CoherenceModel]:
+    def load_coherences(self) -> dict[str, float | ApproximateCoherence | CoherenceModel]:
         result = dict()
         for file in self._root_dir.iterdir():
             result[file.stem] = self.load_coherence(file.stem)
@@ -107,7 +141,9 @@ class LazyLoadingEntry:
             model_name: str = "translated_lda.bin",
             config_name: str = "config.json",
             ratings_name: str = "ratings.json",
+            ratings_array_name: str = "ratings.npy",
             ndcg_name: str = "ndcg.json",
+            perplexity_name: str = "perplexity.json",
             parent = None
     ):
         path.mkdir(exist_ok=True, parents=True)
@@ -118,9 +154,11 @@ class LazyLoadingEntry:
         self._config_path = config_name
         self._config = None
         self._rating_path = ratings_name
+        self._rating_array_path = ratings_array_name
         self._rating = None
         self._ndcg_path = ndcg_name
         self._ndcg = None
+        self._perplexity_path = perplexity_name
         self._parent = parent
 
     @property
@@ -168,20 +206,60 @@ class LazyLoadingEntry:
         return self.path / self._rating_path
 
     @property
-    def rating(self) -> Rating:
+    def rating_array_path(self) -> Path:
+        return self.path / self._rating_array_path
+
+    @property
+    def has_rating(self) -> bool:
+        return self.rating_array_path.exists() or self.rating_path.exists()
+
+    def _load_rating(self) -> RatingView:
+        if self.rating_array_path.exists():
+            return RatingsBatch.load(self.rating_array_path)
+        return tuple(ldatranslate.load_ratings(self.rating_path))
+
+    @property
+    def rating(self) -> RatingView:
+        """
+        Not a copy, the ratings.npy is memory mapped.
+        """
         if self._rating is None:
-            self._rating = tuple(ldatranslate.load_ratings(self.rating_path))
-        return list(self._rating)
+            self._rating = self._load_rating()
+        return self._rating
 
-    def rating_uncached(self) -> Rating:
+    def rating_uncached(self) -> RatingView:
         if self._rating is None:
-            return ldatranslate.load_ratings(self.rating_path)
-        return list(self._rating)
+            return self._load_rating()
+        return self._rating
+
+    def convert_rating(self, remove_legacy: bool = False) -> bool:
+        """
+        Writes the ratings.json as ratings.npy, returns False if there is nothing to convert.
+        With remove_legacy the ratings.json is deleted as soon as the ratings.npy exists.
+        """
+        if not self.rating_path.exists():
+            return False
+        converted = not self.rating_array_path.exists()
+        if converted:
+            try:
+                rating = ldatranslate.load_ratings(self.rating_path)
+            except Exception:
+                # The deepl translation was written with jsonpickle.
+                rating = jsonpickle.loads(self.rating_path.read_text())
+            RatingsBatch.from_rating(rating).save(self.rating_array_path)
+            self._rating = None
+        if remove_legacy:
+            self.rating_path.unlink()
+        return converted
 
     @property
     def ndcg_path(self) -> Path:
         return self.path / self._ndcg_path
 
+    @property
+    def perplexity_path(self) -> Path:
+        return self.path / self._perplexity_path
+
 
 
     @property
@@ -304,6 +382,21 @@ class DataDirectory:
     def original_model_paths(self) -> tuple[Path, Path]:
         return self.shareable_paths / "lda_model.tomotopy.bin", self.shareable_paths / "lda_model.bin"
 
+    @property
+    def checkpoint_path(self) -> Path:
+        """The checkpoints of the training of the original model."""
+        return self.shareable_paths / "checkpoints"
+
+    @property
+    def training_info_path(self) -> Path:
+        """The state of the finished training, e.g. the reason why it stopped."""
+        return self.shareable_paths / "training.json"
+
+    @property
+    def telemetry_path(self) -> Path:
+        """The telemetry of the training of the original model, run_lda_impl passes it to train_lda."""
+        return self.shareable_paths / TELEMETRY_FILE_NAME
+
     @property
     def coherences(self) -> CoherencesDir:
         return self._coherences
@@ -339,15 +432,86 @@ class DataDirectory:
     def set_corpus(self, target_lang: str, corpus: Corpus):
         self._corpus[target_lang] = corpus
 
+    def coherence_data_path(self, target_lang: str) -> Path:
+        return self.shareable_paths / "coherence_data" / target_lang
+
+    def coherence_data_fingerprint(self, target_lang: str, **parameters) -> str | None:
+        """
+        The fingerprint of the corpus file of target_lang and the processing parameters,
+        None if there is no corpus file.
+        """
+        path = self.corpus_path(target_lang)
+        if not path.exists():
+            return None
+        with path.open('rb') as f:
+            digest = hashlib.file_digest(f, 'sha256')
+        digest.update(json.dumps(
+            {"version": CoherenceModelData.VERSION, "parameters": parameters}, sort_keys=True, default=str
+        ).encode('utf-8'))
+        return digest.hexdigest()
+
+    def load_coherence_data(self, target_lang: str, fingerprint: str | None) -> CoherenceModelData | None:
+        if fingerprint is None:
+            return None
+        return CoherenceModelData.load(self.coherence_data_path(target_lang), fingerprint)
+
+    def save_coherence_data(self, target_lang: str, data: CoherenceModelData, fingerprint: str | None):
+        data.save(self.coherence_data_path(target_lang), fingerprint)
+
+    def filtered_dictionary_path(self, fingerprint: str) -> Path:
+        return self.shareable_paths / "filtered_dictionaries" / fingerprint
+
     def translation_rating_path(self) -> Path:
         return self.root_dir / 'translation/ratings_original.json'
 
-    def load_original_rating(self) -> Rating:
-        return jsonpickle.loads((self.root_dir / 'translation/ratings_original.json').read_text())
+    def translation_perplexity_path(self) -> Path:
+        return self.root_dir / 'translation/perplexity_original.json'
+
+    def translation_rating_array_path(self) -> Path:
+        return self.root_dir / 'translation/ratings_original.npy'
+
+    def load_original_rating(self) -> RatingsBatch | Rating:
+        if self.translation_rating_array_path().exists():
+            return RatingsBatch.load(self.translation_rating_array_path())
+        return jsonpickle.loads(self.translation_rating_path().read_text())
+
+    def convert_ratings(self, remove_legacy: bool = False) -> int:
+        """
+        Migrates the original and all translated ratings to the .npy format, returns the number of converted files.
+        """
+        converted = 0
+        legacy = self.translation_rating_path()
+        if legacy.exists():
+            if not self.translation_rating_array_path().exists():
+                RatingsBatch.from_rating(jsonpickle.loads(legacy.read_text())).save(self.translation_rating_array_path())
+                converted += 1
+            if remove_legacy:
+                legacy.unlink()
+        for entry in self.iter_all_translations():
+            if entry.convert_rating(remove_legacy):
+                converted += 1
+        print(f"Converted {converted} ratings in {self.root_dir}")
+        return converted
 
     def translations_path(self) -> Path:
         return self.root_dir / 'translation/translations'
 
+    def translation_staging_path(self) -> Path:
+        """
+        The translations are written here first and moved to translations_path when they are complete.
+        """
+        return self.root_dir / 'translation/staging'
+
+    def is_translated(self, model_id: str) -> bool:
+        """
+        True if the translation has a model and ratings, does not create the directory.
+        """
+        d = self.translations_path() / model_id
+        if not d.is_dir():
+            return False
+        entry = self._lazy_cache.get(d) or LazyLoadingEntry(d, parent=self)
+        return entry.model_path.exists() and entry.has_rating
+
     def load_single(self, model_id: str) -> LazyLoadingEntry | None:
         d = self.root_dir / 'translation/translations'
         d = d / model_id
@@ -19,6 +19,7 @@ from collections import defaultdict
 import numpy
 import numpy as np
 from ptmt.research.dirs import Rating
+from ptmt.research.ratings import RatingsBatch
 
 
 def _dicount(n: int) -> numpy.ndarray:
@@ -212,7 +213,9 @@ def calculate_ndcg(
     return result, missed_ideals, missed_targets
 
 
-def rating_to_doc_id_to_ranking(rating: Rating) -> dict[int, list[int]]:
+def rating_to_doc_id_to_ranking(rating: Rating | RatingsBatch) -> dict[int, list[int]]:
+    if isinstance(rating, RatingsBatch):
+        return rating.to_ranking()
     return dict(
         (doc_id, list(topic_id for topic_id, _prob in sorted(ideal, key=lambda x: x[1], reverse=True)))
         for doc_id, ideal in rating
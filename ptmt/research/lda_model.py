@@ -17,14 +17,21 @@ import sys
 import typing
 from pathlib import Path
 
+import numpy as np
+import numpy.typing as npt
+import scipy.sparse
+
 from ldatranslate.convert_tomotopy_lda import tomotopy_to_topic_model
 from ldatranslate import PyTopicModel
 from tomotopy import LDAModel
 from tomotopy.utils import Corpus
 
-from ptmt.lda.training import create_by_corpus, run_lda, export_tomotopy
+from ptmt.lda.inference import DEFAULT_CHUNK_SIZE, DEFAULT_MAX_CHUNK_ELEMENTS
+from ptmt.lda.topic_model import SimpleTopicModel
+from ptmt.lda.training import create_by_corpus, run_lda, export_tomotopy, train_lda, Checkpoints, EarlyStopping
 from ptmt.corpus_extraction.align import read_aligned_articles
 from ptmt.research.dirs import DataDirectory
+from ptmt.research.ratings import RatingsBatch
 
 
 def generate_lang_a_lda_model(
@@ -54,7 +61,7 @@ def generate_lang_a_lda_model(
         corpus.add_doc(tokens)
     print(f"Accepted: {accepted}/{overall}")
     mdl: LDAModel = create_by_corpus(corpus)
-    run_lda(mdl, path, 1000)
+    _, mdl = run_lda(mdl, path, 1000)
     topic_model: PyTopicModel = tomotopy_to_topic_model(mdl, 'en')
     topic_model.save_binary(path / 'lda_model.bin')
     return mdl, topic_model
@@ -91,15 +98,71 @@ def create_ratings(model: PyTopicModel, alpha: float, gamma: float, documents: t
     return [(doc_id, model.get_doc_probability(doc, alpha, gamma)[0]) for doc_id, doc in documents]
 
 
-def run_lda_impl(mdl: LDAModel, output_path: DataDirectory, iters: None | int = None):
-    mdl.burn_in = 100
-    mdl.train(0)
-    print('Num docs:', len(mdl.docs), ', Vocab size:', len(mdl.used_vocabs), ', Num words:', mdl.num_words)
-    print('Removed top words:', mdl.removed_top_words)
-    print('Training...', file=sys.stderr, flush=True)
-    for i in range(0, iters if iters else 1000, 10):
-        mdl.train(10)
-        print('Iteration: {}\tLog-likelihood: {}'.format(i, mdl.ll_per_word))
+def create_ratings_batched(
+        model: SimpleTopicModel | PyTopicModel,
+        alpha: float | typing.Sequence[float],
+        gamma_threshold: float,
+        documents: typing.Iterable[tuple[int, list[str]]] | tuple[npt.NDArray[np.integer], scipy.sparse.csr_matrix],
+        top_k: int | None = None,
+        minimum_probability: float = 1E-10,
+        workers: int | None = 1,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_chunk_elements: int = DEFAULT_MAX_CHUNK_ELEMENTS
+) -> RatingsBatch:
+    """
+    Ratings like create_ratings with one batched inference of a SimpleTopicModel over all documents.
+    documents are (id, tokens) or (ids, csr) from SimpleTopicModel.docs2csr or ColumnarTestData.
+    A PyTopicModel is converted with from_py_topic_model without normalizing the topics (in float64),
+    the inference uses the topics like PyTopicModel.get_doc_probability.
+    A SimpleTopicModel is prepared with alpha and gamma_threshold.
+    Only the top_k topics with at least minimum_probability are kept.
+    """
+    if not isinstance(model, SimpleTopicModel):
+        model = SimpleTopicModel.from_py_topic_model(model, dtype=np.float64, normalize=False)
+    model.prepare_inference(alpha=alpha, gamma_threshold=gamma_threshold)
+    if isinstance(documents, tuple) and len(documents) == 2 and isinstance(documents[1], scipy.sparse.csr_matrix):
+        doc_ids, csr = documents
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    else:
+        documents = list(documents)
+        doc_ids = np.fromiter((doc_id for doc_id, _ in documents), dtype=np.int64, count=len(documents))
+        csr, _ = model.docs2csr(doc for _, doc in documents)
+        del documents
+
+    gamma, _ = model.inference_csr(csr, workers=workers, chunk_size=chunk_size, max_chunk_elements=max_chunk_elements)
+    topic_dists = gamma / gamma.sum(axis=1, keepdims=True)
+    top_k = model.k if top_k is None else min(top_k, model.k)
+    order = np.lexsort((np.broadcast_to(np.arange(model.k), topic_dists.shape), -topic_dists), axis=-1)[:, :top_k]
+    probabilities = np.take_along_axis(topic_dists, order, axis=1)
+    return RatingsBatch(
+        doc_ids=doc_ids,
+        topics_sorted=order.astype(np.int32),
+        probabilities=probabilities.astype(np.float32, copy=False),
+        topic_counts=(probabilities >= max(1E-10, minimum_probability)).sum(axis=1).astype(np.int32)
+    )
+
+
+def run_lda_impl(
+        mdl: LDAModel,
+        output_path: DataDirectory,
+        iters: None | int = None,
+        checkpoint_interval: int | None = 100,
+        checkpoint_keep: int = 3,
+        early_stopping: EarlyStopping | None = None
+) -> LDAModel:
+    """
+    Returns the trained model, if the training resumed from a checkpoint in output_path.checkpoint_path
+    this is not mdl.
+    """
+    checkpoints = None
+    if checkpoint_interval is not None:
+        checkpoints = Checkpoints(output_path.checkpoint_path, checkpoint_interval, checkpoint_keep)
+    mdl, result = train_lda(
+        mdl, iters if iters else 1000,
+        checkpoints=checkpoints,
+        early_stopping=early_stopping,
+        telemetry=output_path.telemetry_path
+    )
 
     mdl.summary()
     print('Saving...', file=sys.stderr, flush=True)
@@ -107,6 +170,7 @@ def run_lda_impl(mdl: LDAModel, output_path: DataDirectory, iters: None | int =
     output_path.original_model_paths[0].parent.mkdir(parents=True, exist_ok=True)
 
     mdl.save(str(output_path.original_model_paths[0]), True)
+    result.save(output_path.training_info_path)
 
     for k in range(mdl.k):
         print('Topic #{}'.format(k))
@@ -114,5 +178,4 @@ def run_lda_impl(mdl: LDAModel, output_path: DataDirectory, iters: None | int =
             print('\t', word, prob, sep='\t')
 
     export_tomotopy(mdl, output_path.original_model_paths[0].parent / "lda_model_original")
-
-
+    return mdl
@@ -147,7 +147,7 @@ class PlotData:
         for x in range(self.ndcg_at + 1):
             top_n_eq.append([])
 
-        origin_rating = dict(paper_dir.load_original_rating().copy())
+        origin_rating = dict(paper_dir.load_original_rating())
         for value in origin_rating.values():
             value.sort(key=lambda x: x[1], reverse=True)
 
@@ -0,0 +1,155 @@
+# Copyright 2024 Felix Engl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import typing
+from os import PathLike
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+
+"""
+Ratings are the topic rankings of the test documents: [(doc_id, [(topic_id, probability)])].
+RatingsBatch stores them as arrays and in a single .npy file with one structured record per document:
+doc_id (int64), count (int32), topics (int32 x width), values (float32 x width).
+The file is loaded with np.load(mmap_mode='r') and all fields are read-only views on the memory map.
+"""
+
+
+def _record_dtype(width: int) -> np.dtype:
+    return np.dtype([
+        ('doc_id', '<i8'),
+        ('count', '<i4'),
+        ('topics', '<i4', (width,)),
+        ('values', '<f4', (width,)),
+    ])
+
+
+class RatingsBatch(typing.Sequence[tuple[int, list[tuple[int, float]]]]):
+    """
+    The topic rankings of documents, the topics of document i are topics_sorted[i, :topic_counts[i]].
+    Topics are sorted by descending probability and ties by ascending topic id.
+    As a sequence it behaves like the rating lists of create_ratings, the rows are created on access.
+    """
+
+    # Rows converted at once while iterating
+    iteration_block_size: int = 4096
+
+    def __init__(
+            self,
+            doc_ids: npt.NDArray[np.int64],
+            topics_sorted: npt.NDArray[np.int32],
+            probabilities: npt.NDArray[np.floating],
+            topic_counts: npt.NDArray[np.integer]
+    ):
+        assert len(doc_ids) == len(topics_sorted) == len(probabilities) == len(topic_counts), \
+            "All arrays need one entry per document!"
+        self.doc_ids = doc_ids
+        self.topics_sorted = topics_sorted
+        self.probabilities = probabilities
+        self.topic_counts = topic_counts
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @typing.overload
+    def __getitem__(self, index: int) -> tuple[int, list[tuple[int, float]]]: ...
+
+    @typing.overload
+    def __getitem__(self, index: slice) -> 'RatingsBatch': ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RatingsBatch(
+                self.doc_ids[index], self.topics_sorted[index], self.probabilities[index], self.topic_counts[index]
+            )
+        count = int(self.topic_counts[index])
+        return int(self.doc_ids[index]), list(zip(
+            self.topics_sorted[index, :count].tolist(), self.probabilities[index, :count].tolist()
+        ))
+
+    def __iter__(self) -> typing.Iterator[tuple[int, list[tuple[int, float]]]]:
+        for start in range(0, len(self), self.iteration_block_size):
+            yield from self[start:start + self.iteration_block_size].to_rating()
+
+    def to_rating(self) -> list[tuple[int, list[tuple[int, float]]]]:
+        """
+        The format of create_ratings and ldatranslate.save_ratings.
+        """
+        return [
+            (doc_id, list(zip(topics[:count], probabilities[:count])))
+            for doc_id, topics, probabilities, count in zip(
+                self.doc_ids.tolist(), self.topics_sorted.tolist(), self.probabilities.tolist(), self.topic_counts.tolist()
+            )
+        ]
+
+    def to_ranking(self) -> dict[int, list[int]]:
+        """
+        doc_id -> topic ids by descending probability, like evaluation.rating_to_doc_id_to_ranking.
+        """
+        return {
+            doc_id: topics[:count]
+            for doc_id, topics, count in zip(self.doc_ids.tolist(), self.topics_sorted.tolist(), self.topic_counts.tolist())
+        }
+
+    @staticmethod
+    def from_rating(
+            rating: typing.Iterable[tuple[int, typing.Iterable[tuple[int, float]]]],
+            top_k: int | None = None
+    ) -> 'RatingsBatch':
+        """
+        Converts rating lists, the order of the topics in a list only decides between equal probabilities.
+        """
+        rows = [(doc_id, sorted(topics, key=lambda x: x[1], reverse=True)) for doc_id, topics in rating]
+        width = max((len(topics) for _, topics in rows), default=0)
+        if top_k is not None:
+            width = min(width, top_k)
+        topics_sorted = np.zeros((len(rows), width), dtype=np.int32)
+        probabilities = np.zeros((len(rows), width), dtype=np.float32)
+        topic_counts = np.zeros(len(rows), dtype=np.int32)
+        for i, (_, topics) in enumerate(rows):
+            topics = topics[:width]
+            topic_counts[i] = len(topics)
+            if topics:
+                topics_sorted[i, :len(topics)] = [topic for topic, _ in topics]
+                probabilities[i, :len(topics)] = [probability for _, probability in topics]
+        return RatingsBatch(
+            np.fromiter((doc_id for doc_id, _ in rows), dtype=np.int64, count=len(rows)),
+            topics_sorted,
+            probabilities,
+            topic_counts
+        )
+
+    def save(self, path: Path | PathLike[str] | str):
+        """
+        Writes the records to a temporary file first, a complete file replaces path.
+        """
+        path = Path(path)
+        records = np.zeros(len(self), dtype=_record_dtype(self.topics_sorted.shape[1]))
+        records['doc_id'] = self.doc_ids
+        records['count'] = self.topic_counts
+        records['topics'] = self.topics_sorted
+        records['values'] = self.probabilities
+        tmp = path.with_name(path.name + '.tmp')
+        with tmp.open('wb') as f:
+            np.save(f, records)
+        tmp.replace(path)
+
+    @staticmethod
+    def load(path: Path | PathLike[str] | str, mmap: bool = True) -> 'RatingsBatch':
+        """
+        With mmap the arrays are read-only views on the memory mapped file.
+        """
+        records = np.load(path, mmap_mode='r' if mmap else None)
+        return RatingsBatch(records['doc_id'], records['topics'], records['values'], records['count'])
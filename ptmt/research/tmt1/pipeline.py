@@ -40,7 +40,9 @@ from ptmt.research.tmt1.toolkit.data_creator import create_train_data
 from ptmt.research.tmt1.toolkit.deepl_translation import deepl_translate
 from ptmt.research.tmt1.toolkit.dictionary_creation import make_dictionary
 from ptmt.research.tmt1.toolkit.model_training import train_models
-from ptmt.research.tmt1.toolkit.model_translation import SINGLE_FILTER, translate_models, DefectModelError
+from ptmt.research.tmt1.toolkit.model_translation import SINGLE_FILTER, translate_models, DefectModelError, FilterIdentity, \
+    TranslationError
+from ptmt.research.tmt1.toolkit.perplexity import calculate_perplexities, PerplexityKwArgs
 from ptmt.research.tmt1.toolkit.tables import output_table
 from ptmt.research.tmt1.toolkit.unstemm_dict_creation import create_unstemm_dictionary
 
@@ -101,14 +103,17 @@ class _RunSingleKWArgs(TypedDict):
     lang_a: str
     lang_b: str
     dictionary: PyDictionary
+    dictionary_path: Path | None
     limit: int | None
     stop_words: dict[str, PyStopWords] | None
     filters: tuple[SINGLE_FILTER, SINGLE_FILTER] | None
+    filter_identity: FilterIdentity | None
     deepl: bool
     translate_mode: typing.Literal["simple", "complex"]
     mark_baselines: bool
     generate_Excel: bool | int | tuple[int, ...]
     coocurences_kwargs: CoocurrencesKwArgs | bool
+    perplexity_kwargs: PerplexityKwArgs | bool
     ndcg_kwargs: NDCGKwArgs | None
     bar_plot_args: BarPlotKWArgs | None
     line_plot_args: LinePlotKWArgs | None
@@ -118,6 +123,7 @@ class _RunSingleKWArgs(TypedDict):
     skip_if_finished_marker_set: bool
     ngram_statistics: PyNGramStatistics | None
     min_not_nan: int | float | None
+    translation_workers: int | None
 
 
 
@@ -146,14 +152,17 @@ def run_single(
         lang_a: str,
         lang_b: str,
         dictionary: PyDictionary,
+        dictionary_path: Path | None,
         limit: int | None,
         stop_words: dict[str, PyStopWords] | None,
         filters: tuple[SINGLE_FILTER, SINGLE_FILTER] | None,
+        filter_identity: FilterIdentity | None,
         deepl: bool,
         translate_mode: typing.Literal["simple", "complex"],
         mark_baselines: bool,
         generate_Excel: bool | int | tuple[int, ...],
         coocurences_kwargs: CoocurrencesKwArgs | bool,
+        perplexity_kwargs: PerplexityKwArgs | bool,
         ndcg_kwargs: NDCGKwArgs | None,
         bar_plot_args: BarPlotKWArgs | None,
         line_plot_args: LinePlotKWArgs | None,
@@ -162,7 +171,8 @@ def run_single(
         clean_translation: bool,
         skip_if_finished_marker_set: bool,
         ngram_statistics: PyNGramStatistics | None,
-        min_not_nan: int | float | None
+        min_not_nan: int | float | None,
+        translation_workers: int | None
 ) -> DataDirectory:
     if skip_if_finished_marker_set and data_dir.is_finished():
         print(f"{data_dir.root_dir} is already finished.")
@@ -205,7 +215,7 @@ def run_single(
 
     print("Finished training model\nStart translating")
     try:
-        translate_models(
+        failures = translate_models(
             lang_a,
             lang_b,
             data_dir,
@@ -216,12 +226,18 @@ def run_single(
             filters,
             configs=configs,
             config_modifier=config_modifier,
-            min_not_nan=min_not_nan
+            min_not_nan=min_not_nan,
+            workers=translation_workers,
+            dictionary_path=dictionary_path,
+            filter_identity=filter_identity
         )
     except DefectModelError as e:
         print("The confiuration failed to translate the topic model properly!")
         data_dir.mark_as_finished()
         raise e
+    if failures:
+        # The evaluation would run on a partial set, the failed configs are translated again by the next run.
+        raise TranslationError(failures)
     print("Finished translating models")
 
 
@@ -271,6 +287,19 @@ def run_single(
             value.calculate_ndcg_for((1, 1, 1), save=True)
     print("Calculated NDCG@3!")
 
+    if not isinstance(perplexity_kwargs, bool) or perplexity_kwargs:
+        if isinstance(perplexity_kwargs, bool):
+            perplexity_kwargs = PerplexityKwArgs()
+        calculate_perplexities(
+            lang_a,
+            lang_b,
+            data_dir,
+            test,
+            limit,
+            **perplexity_kwargs
+        )
+        print("Calculated the perplexities!")
+
     to_plot = PlotData(data_dir, 3, mark_baselines=mark_baselines)
     print("Generated Plot data")
 
@@ -490,6 +519,7 @@ def run_pipeline(
         mark_baselines: bool = False,
         generate_Excel: bool | int | tuple[int, ...] = False,
         coocurences_kwargs: CoocurrencesKwArgs | bool = False,
+        perplexity_kwargs: PerplexityKwArgs | bool = False,
         ndcg_kwargs: NDCGKwArgs | None = None,
         bar_plot_args: BarPlotKWArgs | None = None,
         line_plot_args: LinePlotKWArgs | None = None,
@@ -501,6 +531,7 @@ def run_pipeline(
         shared_dir: Path | PathLike | str | None = None,
         ngram_statistics: Path | PathLike | str | None | PyNGramStatistics = None,
         min_not_nan: int | float | None = None,
+        translation_workers: int | None = 1,
 ) -> dict[str, DataDirectory]:
     """
 
@@ -522,6 +553,7 @@ def run_pipeline(
     :param mark_baselines:
     :param generate_Excel:
     :param coocurences_kwargs:
+    :param perplexity_kwargs: The held-out perplexity of the original and the translated models, see calculate_perplexities.
     :param ndcg_kwargs:
     :param bar_plot_args:
     :param line_plot_args:
@@ -531,6 +563,7 @@ def run_pipeline(
     :param clean_translations:
     :param global_model:
     :param ngram_statistics:
+    :param translation_workers: The number of processes that translate the configs, None uses all cores.
     :return:
     """
 
@@ -673,6 +706,7 @@ def run_pipeline(
         lang_a=lang_a,
         lang_b=lang_b,
         dictionary=dictionary,
+        dictionary_path=big_data_gen_path/dictionary_file_name,
         limit=limit,
         deepl=deepl,
         translate_mode=translate_mode,
@@ -682,14 +716,17 @@ def run_pipeline(
         bar_plot_args=bar_plot_args,
         line_plot_args=line_plot_args,
         coocurences_kwargs=coocurences_kwargs,
+        perplexity_kwargs=perplexity_kwargs,
         stop_words=None,
         filters=None,
+        filter_identity=None,
         configs=configs,
         config_modifier=config_modifier,
         clean_translation=clean_translations,
         skip_if_finished_marker_set=skip_if_finished_marker_set,
         ngram_statistics=ngram_statistics,
-        min_not_nan=min_not_nan
+        min_not_nan=min_not_nan,
+        translation_workers=translation_workers
     )
 
     error = []
@@ -726,6 +763,7 @@ def run_pipeline(
 
         args_copy = dict(args)
         args_copy["filters"] = ((_filter_a1, _filter_a1), (_filter_a2, _filter_a2))
+        args_copy["filter_identity"] = FilterIdentity("filtered_dict")
         try:
             docs_filtered = run_single("filtered_dict", docs_filtered, **args_copy)
         except DefectModelError as e:
@@ -753,6 +791,7 @@ def run_pipeline(
 
         args_copy = dict(args)
         args_copy["filters"] = ((_filter_a1, _filter_a1), (_filter_a2, _filter_a2))
+        args_copy["filter_identity"] = FilterIdentity("filtered_dict_no_phrase")
         try:
             docs_filtered_phrase = run_single("filtered_dict_no_phrase", docs_filtered_phrase, **args_copy)
         except DefectModelError as e:
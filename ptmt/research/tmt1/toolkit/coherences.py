@@ -12,8 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import multiprocessing
+import os
+import time
+import traceback
 import typing
+from multiprocessing.connection import Connection, wait
 from os import PathLike
 from pathlib import Path
 from typing import TypedDict, Callable
@@ -23,6 +28,7 @@ from gensim.corpora import Dictionary
 from gensim.models import CoherenceModel
 from ldatranslate import PyTopicModel, TokenCountFilter
 
+from ptmt.lda.coherence import CoherenceEngine, SUPPORTED_MEASURES, Approximation, ApproximateCoherence
 from ptmt.lda.topic_model import CoherenceModelData
 from ptmt.research.dirs import DataDirectory, CoherencesDir
 from ptmt.research.helpers.timer import SimpleTimer
@@ -39,15 +45,132 @@ class CoherenceModelKwArgs(TypedDict, total=False):
     window_size: int | None
 
 
-def _execute_get_coherence(queue: multiprocessing.Queue, coherence_kwargs: CoherenceModelKwArgs):
-    try:
-        coherence = gensim.models.CoherenceModel(**coherence_kwargs)
-        value = coherence.get_coherence()
-        if not isinstance(value, float):
-            value = float(value)
-        queue.put(value)
-    except Exception as e:
-        queue.put(e)
+def _coherence_worker(connection: Connection, data: CoherenceModelData):
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        key, coherence_kwargs = job
+        try:
+            coherence = gensim.models.CoherenceModel(
+                texts=data.corpus_texts,
+                dictionary=data.dictionary,
+                corpus=data.gensim_corpus,
+                processes=1,
+                **coherence_kwargs
+            )
+            value = float(coherence.get_coherence())
+        except Exception:
+            value = RuntimeError(traceback.format_exc())
+        connection.send((key, value))
+
+
+class CoherenceWorkerPool:
+    """
+    Long-lived worker processes that calculate gensim coherences on the same reference corpus.
+    The workers are forked, so the corpus is shared copy-on-write instead of being pickled for every job.
+    A job that runs longer than the timeout fails with a TimeoutError, only its worker is replaced.
+    timeout_for_calculation: in minutes
+    """
+
+    def __init__(
+            self,
+            data: CoherenceModelData,
+            workers: int | None = None,
+            timeout_for_calculation: int | None = None
+    ):
+        self.data = data
+        self.workers = workers if workers is not None else self.default_workers()
+        assert self.workers > 0, "At least one worker is needed!"
+        self.timeout = 60 * (20 if timeout_for_calculation is None else timeout_for_calculation)
+        self._context = multiprocessing.get_context('fork')
+        self._processes: list[multiprocessing.Process | None] = []
+        self._connections: list[Connection | None] = []
+
+    @staticmethod
+    def default_workers() -> int:
+        return max(1, (os.cpu_count() or 1) - 1)
+
+    def _start_worker(self, index: int):
+        parent, child = self._context.Pipe()
+        process = self._context.Process(target=_coherence_worker, args=(child, self.data))
+        process.start()
+        child.close()
+        self._processes[index] = process
+        self._connections[index] = parent
+
+    def _stop_worker(self, index: int, terminate: bool):
+        process, connection = self._processes[index], self._connections[index]
+        if process is None:
+            return
+        if not terminate:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+            process.join(5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        connection.close()
+        process.close()
+        self._processes[index] = None
+        self._connections[index] = None
+
+    def __enter__(self) -> 'CoherenceWorkerPool':
+        self._processes = [None] * self.workers
+        self._connections = [None] * self.workers
+        for index in range(self.workers):
+            self._start_worker(index)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for index in range(len(self._processes)):
+            self._stop_worker(index, exc_type is not None)
+
+    def run(
+            self,
+            jobs: typing.Iterable[tuple[typing.Hashable, CoherenceModelKwArgs]]
+    ) -> typing.Iterator[tuple[typing.Hashable, float | Exception]]:
+        """
+        Runs the jobs (key, kwargs of the CoherenceModel without the corpus) and yields (key, value) in the order
+        of completion. A failed job yields the exception instead of the value.
+        """
+        assert self._processes, "CoherenceWorkerPool has to be used as a context manager!"
+        pending = collections.deque(jobs)
+        idle = list(range(self.workers))
+        running: dict[int, tuple[typing.Hashable, float]] = {}
+        while pending or running:
+            while pending and idle:
+                index = idle.pop()
+                key, coherence_kwargs = pending.popleft()
+                self._connections[index].send((key, coherence_kwargs))
+                running[index] = (key, time.monotonic() + self.timeout)
+            deadline = min(deadline for _, deadline in running.values())
+            by_connection = {self._connections[index]: index for index in running}
+            for connection in wait(list(by_connection), max(0.0, deadline - time.monotonic())):
+                index = by_connection[connection]
+                key, _ = running.pop(index)
+                try:
+                    _, value = connection.recv()
+                except EOFError:
+                    self._processes[index].join(5)
+                    value = RuntimeError(f'The worker died with the exit code {self._processes[index].exitcode}')
+                    self._stop_worker(index, True)
+                    self._start_worker(index)
+                idle.append(index)
+                yield key, value
+            now = time.monotonic()
+            for index, (key, deadline) in list(running.items()):
+                if deadline <= now:
+                    del running[index]
+                    self._stop_worker(index, True)
+                    self._start_worker(index)
+                    idle.append(index)
+                    yield key, TimeoutError(f'The calculation took longer than {self.timeout} seconds')
 
 
 class LazyPyTopicModelLoader:
@@ -76,92 +199,171 @@ class LazyCoherenceModelData:
 
     def __call__(self) -> CoherenceModelData:
         if self._coherence_data is None:
+            target_lang = self.corpus_language if self.corpus_language is not None else self.language
+            # The token filter is already part of the stored corpus, so its file covers it.
+            parameters = {"language": self.language, "corpus_language": target_lang}
+            fingerprint = self.output.coherence_data_fingerprint(target_lang, **parameters)
+            self._coherence_data = self.output.load_coherence_data(target_lang, fingerprint)
+            if self._coherence_data is not None:
+                print(f"Loaded coherence data for {self.language} with target {self.corpus_language}")
+                return self._coherence_data
             print(f"Create coherence data for {self.language} with target {self.corpus_language}")
             corpus = create_corpus(self.language, self.input_path, self.output, token_filter=self.token_filter,
                                    corpus_language=self.corpus_language)
             self._coherence_data = CoherenceModelData.create_from(corpus)
+            fingerprint = self.output.coherence_data_fingerprint(target_lang, **parameters)
+            if fingerprint is not None:
+                self.output.save_coherence_data(target_lang, self._coherence_data, fingerprint)
         return self._coherence_data
 
 
-def calculate_and_store_coocurrence_single(
-        model: PyTopicModel | LazyPyTopicModelLoader,
-        coherence_dir: CoherencesDir,
+def _topics_of(model: PyTopicModel, keep_phrases: bool) -> list[list[str]]:
+    return [
+        [word for word, _ in model.get_words_of_topic_sorted(x) if keep_phrases or ' ' not in word]
+        for x in range(model.k)
+    ]
+
+
+def _is_stored(coherence_dir: CoherencesDir, target: str, approximate: bool) -> bool:
+    """
+    An approximate coherence is only good enough if an approximation is requested, an exact one always is.
+    """
+    return coherence_dir.exists(target) and (approximate or not coherence_dir.is_approximate(target))
+
+
+def calculate_and_store_with_engine(
+        models: typing.Iterable[tuple[PyTopicModel | LazyPyTopicModelLoader, CoherencesDir]],
         data: CoherenceModelData | LazyCoherenceModelData,
         coocurrences: typing.Iterable[str],
         topn: int = 20,
         window_size: int | None = None,
         keep_phrases: bool = False,
-        timeout_for_calculation: int | None = None,
-) -> dict[str, float | CoherenceModel]:
+        approximation: Approximation | None = None,
+):
     """
-    timeout_for_calculation: in minutes
+    Calculates the measures supported by the CoherenceEngine for all models with a single pass over the corpus
+    and stores them. Already stored coherences are not calculated again, other measures are ignored.
+    If approximation is set, the coherences are estimated from a sample and stored as approximate.
+    Without approximation stored approximate coherences are replaced by exact ones.
     """
-    print(f"Create Coherences for {coherence_dir.root_dir}")
-    result = dict()
+    measures = [target for target in coocurrences if target in SUPPORTED_MEASURES]
+    missing = []
+    for model, coherence_dir in models:
+        targets = [target for target in measures if not _is_stored(coherence_dir, target, approximation is not None)]
+        if targets:
+            missing.append((model, coherence_dir, targets))
+    if not missing:
+        return
+    print(f"Create Coherences {', '.join(measures)} for {len(missing)} models")
+    with SimpleTimer():
+        topics = {}
+        for i, (model, _, _) in enumerate(missing):
+            model = model if not isinstance(model, LazyPyTopicModelLoader) else model()
+            topics[str(i)] = _topics_of(model, keep_phrases)
+        if isinstance(data, LazyCoherenceModelData):
+            data = data()
+        engine = CoherenceEngine.from_data(
+            data, topics, topn=topn, window_size=window_size,
+            measures=sorted({target for _, _, targets in missing for target in targets})
+        )
+        estimates = engine.estimate(approximation) if approximation is not None else None
+        for i, (_, coherence_dir, targets) in enumerate(missing):
+            for target in targets:
+                coherence_dir.save_coherence(
+                    target, engine.coherence(str(i), target) if estimates is None else estimates[str(i)][target]
+                )
 
-    timeout_for_calculation = 20 if timeout_for_calculation is None else timeout_for_calculation
 
-    with SimpleTimer():
+def calculate_and_store_with_pool(
+        models: typing.Iterable[tuple[PyTopicModel | LazyPyTopicModelLoader, CoherencesDir]],
+        data: CoherenceModelData | LazyCoherenceModelData,
+        coocurrences: typing.Iterable[str],
+        topn: int = 20,
+        window_size: int | None = None,
+        keep_phrases: bool = False,
+        timeout_for_calculation: int | None = None,
+        workers: int | None = None,
+        approximate: bool = False,
+) -> list[dict[str, float | CoherenceModel]]:
+    """
+    Calculates the missing coherences of all models in a CoherenceWorkerPool, the measures and models
+    run at the same time. Returns the stored and calculated coherences for every model, failed ones are missing.
+    Without approximate stored approximate coherences are calculated again. With approximate the measures of the
+    CoherenceEngine are left to calculate_and_store_with_engine and only loaded.
+    timeout_for_calculation: in minutes
+    """
+    results: list[dict[str, float | CoherenceModel]] = []
+    jobs: list[tuple[tuple[int, str], CoherenceModelKwArgs]] = []
+    coherence_dirs: list[CoherencesDir] = []
+    for i, (model, coherence_dir) in enumerate(models):
+        print(f"Create Coherences for {coherence_dir.root_dir}")
+        result = dict()
         topics: list[list[str]] | None = None
         for target in coocurrences:
-
-            if coherence_dir.exists(target):
+            if _is_stored(coherence_dir, target, approximate):
                 print(f'  load {target}')
                 result[target] = coherence_dir.load_coherence(target)
-            else:
-                print(f'  generate {target}')
-                try:
-                    if topics is None:
-                        model = model if not isinstance(model, LazyPyTopicModelLoader) else model()
-                        topics = [
-                            [word for word, _ in model.get_words_of_topic_sorted(x) if keep_phrases or ' ' not in word] for
-                            x in range(model.k)]
-                    if isinstance(data, LazyCoherenceModelData):
-                        data = data()
-                    coherence = CoherenceModelKwArgs(
-                        topics=topics,
-                        texts=data.corpus_texts,
-                        dictionary=data.dictionary,
-                        corpus=data.gensim_corpus,
-                        topn=topn,
-                        coherence=target,
-                        window_size=window_size,
-                    )
-                    q = multiprocessing.Queue()
-                    failed = False
-                    p = multiprocessing.Process(target=_execute_get_coherence, args=(q, coherence))
-                    p.start()
-                    p.join(60 * timeout_for_calculation)
-                    if p.exitcode != 0:
-                        failed = True
-                    p.close()
-                    del p
-                    if failed:
-                        q.close()
-                        print(f'  failed {target}')
-                        continue
-
-                    value = q.get_nowait()
-                    q.close()
-                    del q
-
-                    if not isinstance(value, float):
-                        print(f"Failed with:")
-                        print(value)
-                        del value
-                        continue
-
-                except Exception as e:
-                    print(f"Bad Error with:")
-                    print(e)
+                continue
+            if approximate and target in SUPPORTED_MEASURES:
+                print(f'  skip {target}, it is estimated by the engine')
+                continue
+            print(f'  generate {target}')
+            if topics is None:
+                model = model if not isinstance(model, LazyPyTopicModelLoader) else model()
+                topics = _topics_of(model, keep_phrases)
+            jobs.append(((i, target), CoherenceModelKwArgs(
+                topics=topics,
+                topn=topn,
+                coherence=target,
+                window_size=window_size,
+            )))
+        results.append(result)
+        coherence_dirs.append(coherence_dir)
+
+    if not jobs:
+        return results
+    if isinstance(data, LazyCoherenceModelData):
+        data = data()
+    with SimpleTimer():
+        workers = min(workers if workers is not None else CoherenceWorkerPool.default_workers(), len(jobs))
+        with CoherenceWorkerPool(data, workers, timeout_for_calculation) as pool:
+            for (i, target), value in pool.run(jobs):
+                if not isinstance(value, float):
+                    print(f'  failed {target} for {coherence_dirs[i].root_dir} with:')
+                    print(value)
                     continue
-                coherence_dir.save_coherence(
-                    target,
-                    value
-                )
-                result[target] = value
-    return result
+                coherence_dirs[i].save_coherence(target, value)
+                results[i][target] = value
+    return results
+
 
+def calculate_and_store_coocurrence_single(
+        model: PyTopicModel | LazyPyTopicModelLoader,
+        coherence_dir: CoherencesDir,
+        data: CoherenceModelData | LazyCoherenceModelData,
+        coocurrences: typing.Iterable[str],
+        topn: int = 20,
+        window_size: int | None = None,
+        keep_phrases: bool = False,
+        timeout_for_calculation: int | None = None,
+        workers: int | None = None,
+        approximate: bool = False,
+) -> dict[str, float | CoherenceModel]:
+    """
+    timeout_for_calculation: in minutes
+    approximate: see calculate_and_store_with_pool
+    """
+    return calculate_and_store_with_pool(
+        [(model, coherence_dir)],
+        data,
+        coocurrences,
+        topn=topn,
+        window_size=window_size,
+        keep_phrases=keep_phrases,
+        timeout_for_calculation=timeout_for_calculation,
+        workers=workers,
+        approximate=approximate
+    )[0]
 
 
 def calculate_coocurrences(
@@ -176,9 +378,14 @@ def calculate_coocurrences(
         coocurrences: typing.Iterable[str] | None = None,
         keep_phrases: bool = False,
         timeout_for_calculation: int | None = None,
+        workers: int | None = None,
+        approximation: Approximation | None = None,
 ):
     """
     timeout_for_calculation: in minutes
+    workers: the number of coherence worker processes, by default one less than the number of cpus
+    approximation: estimate u_mass, c_v, c_uci and c_npmi from a sample of the corpus instead of calculating them
+    exactly, approximate values are marked with \\approx in the table.
     """
     print("Load Corpora")
     data_a = LazyCoherenceModelData(lang_a, input_path, data_dir, token_filter=token_filter)
@@ -187,6 +394,29 @@ def calculate_coocurrences(
     coocurrences = coocurrences if coocurrences is not None else ('u_mass', 'c_v', 'c_uci', 'c_npmi', 'c_w2v')
     assert coocurrences is not None
 
+    calculate_and_store_with_engine(
+        [(LazyPyTopicModelLoader(data_dir.load_original_py_model), data_dir.coherences)],
+        data_a,
+        coocurrences,
+        topn=topn,
+        window_size=window_size,
+        keep_phrases=keep_phrases,
+        approximation=approximation
+    )
+    translations = list(data_dir.iter_all_translations())
+    calculate_and_store_with_engine(
+        [
+            (LazyPyTopicModelLoader(lambda translation=translation: translation.model_uncached), translation.coherences)
+            for translation in translations
+        ],
+        data_b,
+        coocurrences,
+        topn=topn,
+        window_size=window_size,
+        keep_phrases=keep_phrases,
+        approximation=approximation
+    )
+
     original = {
         k: v if isinstance(v, float) else v.get_coherence() for k, v in calculate_and_store_coocurrence_single(
             LazyPyTopicModelLoader(data_dir.load_original_py_model),
@@ -196,21 +426,28 @@ def calculate_coocurrences(
             topn=topn,
             window_size=window_size,
             keep_phrases=keep_phrases,
-            timeout_for_calculation=timeout_for_calculation
+            timeout_for_calculation=timeout_for_calculation,
+            workers=workers,
+            approximate=approximation is not None
         ).items()
     }
 
     other = [
-        (translation.name, {k: v if isinstance(v, float) else v.get_coherence() for k, v in calculate_and_store_coocurrence_single(
-            LazyPyTopicModelLoader(lambda: translation.model_uncached),
-            translation.coherences,
+        (translation.name, {k: v if isinstance(v, float) else v.get_coherence() for k, v in values.items()})
+        for translation, values in zip(translations, calculate_and_store_with_pool(
+            [
+                (LazyPyTopicModelLoader(lambda translation=translation: translation.model_uncached), translation.coherences)
+                for translation in translations
+            ],
             data_b,
             coocurrences,
             topn=topn,
             window_size=window_size,
             keep_phrases=keep_phrases,
-            timeout_for_calculation=timeout_for_calculation
-        ).items()}) for translation in data_dir.iter_all_translations()
+            timeout_for_calculation=timeout_for_calculation,
+            workers=workers,
+            approximate=approximation is not None
+        ))
     ]
 
     s = [
@@ -234,6 +471,8 @@ def calculate_coocurrences(
                         splitted = cont.split('_')
                         cont = splitted[0] + '_' + '_'.join([f'{{{value}}}' for value in splitted[1:]])
                     f.write(cont)
+                elif isinstance(cont, ApproximateCoherence):
+                    f.write(f'$\\approx${cont:.5f}')
                 elif isinstance(cont, float):
                     f.write(f'{cont:.5f}')
             f.write('\\\\\n')
@@ -23,7 +23,7 @@ from ldatranslate import PyDictionary, PyAlignedArticleProcessor, LanguageHint,
 from numpy.lib.function_base import quantile
 
 from ptmt.research.dirs import DataDirectory
-from ptmt.research.lda_model import create_ratings
+from ptmt.research.lda_model import create_ratings_batched
 from ptmt.research.tmt1.toolkit.simple_processing import _process_token_list
 from ptmt.research.tmt1.toolkit.test_data_load_helper import load_test_data
 
@@ -232,8 +232,8 @@ def deepl_translate(
     b_data = load_test_data(test_data, limit, language_hint)[str(language_hint)]
     new_model.show_top(10)
 
-    b_ratings = create_ratings(new_model, paper_dir.load_original_models()[0].alpha, 0.01, b_data)
+    b_ratings = create_ratings_batched(new_model, paper_dir.load_original_models()[0].alpha, 0.01, b_data)
     assert len(b_ratings) == len(b_data)
-    paper_dir.deepl().rating_path.write_text(jsonpickle.dumps(b_ratings))
+    b_ratings.save(paper_dir.deepl().rating_array_path)
 
     return new_model
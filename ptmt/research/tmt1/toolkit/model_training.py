@@ -42,7 +42,7 @@ def train_models(
 
     corpus = create_corpus(language, input_path, output_path, token_filter)
     mdl: LDAModel = create_by_corpus(corpus)
-    run_lda_impl(mdl, output_path, iters)
+    mdl = run_lda_impl(mdl, output_path, iters)
     topic_model: PyTopicModel = tomotopy_to_topic_model(mdl, language)
     topic_model.save_binary(output_path.original_model_paths[1])
     output_path.set_original_models(mdl, topic_model)
@@ -12,24 +12,36 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import dataclasses
 import functools
+import hashlib
 import itertools
+import json
+import marshal
 import math
+import multiprocessing
+import os
+import shutil
+import traceback
+import types
 import typing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from os import PathLike
 from pathlib import Path
 from typing import Callable
 
 import jsonpickle
 import ldatranslate
+from _tomotopy import LDAModel
 from ldatranslate import PyDictionary, translate_topic_model, LoadedMetadataEx, MetaField
 from ldatranslate.ldatranslate import PyNGramStatistics
 
-from ptmt.research.dirs import DataDirectory
-from ptmt.research.lda_model import create_ratings
+from ptmt.research.dirs import DataDirectory, LazyLoadingEntry
+from ptmt.research.lda_model import create_ratings_batched
 from ptmt.research.protocols import TranslationConfig
 from ptmt.research.tmt1.configs import create_configs
 from ptmt.research.tmt1.toolkit.data_creator import TokenizedValue
+from ptmt.research.tmt1.toolkit.test_data_cache import ColumnarTestData
 
 _DICTIONARY_FILTER = Callable[[str, LoadedMetadataEx | None], bool]
 SINGLE_FILTER = tuple[_DICTIONARY_FILTER, _DICTIONARY_FILTER]
@@ -61,6 +73,16 @@ class ExtendedConfigCreator:
 class DefectModelError(Exception):
     pass
 
+
+class TranslationError(Exception):
+    """
+    Some configs could not be translated, failures maps the config id to the traceback.
+    """
+
+    def __init__(self, failures: dict[str, str]):
+        super().__init__(f"Failed to translate: {', '.join(failures)}")
+        self.failures = failures
+
 def _check_nans(translated: ldatranslate.PyTopicModel, min_not_nan: int | float | None):
     def check_int(ct: int):
         for i in range(translated.k):
@@ -94,36 +116,79 @@ def _check_nans(translated: ldatranslate.PyTopicModel, min_not_nan: int | float
         case v:
             raise ValueError(f"Value {v} is not supported!")
 
-def translate_models(
-    lang_a: str,
-    lang_b: str,
-    out_dir: DataDirectory,
-    dictionary: PyDictionary | Path | PathLike | str,
-    ngram_statistics: PyNGramStatistics | None,
-    test_data: Path | PathLike | str,
-    limit: int | None,
-    filters: tuple[SINGLE_FILTER, SINGLE_FILTER] | None,
-    configs: typing.Collection[TranslationConfig] | Callable[[], typing.Collection[TranslationConfig]],
-    config_modifier: Callable[[TranslationConfig, ldatranslate.PyTopicModel, PyDictionary], ldatranslate.PyTranslationConfig] | None,
-    min_not_nan: int | float | None = None,
-):
-    if callable(configs):
-        my_configs = configs()
-    else:
-        my_configs = configs
-
-    finished_count = 0
-
-    for config in my_configs:
-        targ = out_dir.load_single(config.config_id)
-        if targ.model_path.exists():
-            finished_count += 1
-            continue
+def load_test_data(
+        lang_a: str,
+        lang_b: str,
+        test_data: Path | PathLike | str,
+        limit: int | None
+) -> tuple[list[tuple[int, list[str]]], list[tuple[int, list[str]]]]:
+    """
+    Loads the tokenized test documents as (id, tokens) for lang_a and lang_b.
+    If there is a limit only the limit documents with the smallest ids are loaded.
+    The documents come from the columnar cache next to test_data, the file is only decoded if there is none.
+    """
+    test_data = Path(test_data)
+    if (columns := ColumnarTestData.load_or_create(test_data)) is not None:
+        indices = columns.select(limit)
+        if limit is not None:
+            print(f'Limited to {len(indices)}')
+        a_data = columns.documents(str(lang_a), indices)
+        b_data = columns.documents(str(lang_b), indices)
+        assert len(a_data) > 0 and len(b_data) > 0
+        return a_data, b_data
 
-    if finished_count == len(my_configs):
-        print(f"Everything is already translated!")
-        return
+    loaded_data = []
+    with test_data.open("r", encoding="UTF-8") as inp:
+        l_a = str(lang_a)
+        l_b = str(lang_b)
+        for value in inp:
+            dat: TokenizedValue = jsonpickle.loads(value)
+            loaded_data.append((dat.id, dat.entries[l_a].tokenized, dat.entries[l_b].tokenized))
 
+    if limit is not None:
+        loaded_data.sort(key=lambda x: x[0])
+        loaded_data = loaded_data[:limit]
+        print(f'Limited to {len(loaded_data)}')
+    a_data = []
+    b_data = []
+    for entry in loaded_data:
+        a_data.append((entry[0], entry[1]))
+        b_data.append((entry[0], entry[2]))
+    del loaded_data
+    assert a_data is not None and len(a_data) > 0
+    assert b_data is not None and len(b_data) > 0
+    return a_data, b_data
+
+
+@dataclasses.dataclass(slots=True)
+class _TranslationWorkerState:
+    out_dir: DataDirectory
+    configs: list[TranslationConfig]
+    original_model: LDAModel
+    topic_model: ldatranslate.PyTopicModel
+    dictionary: PyDictionary | Path | PathLike | str
+    filters: tuple[SINGLE_FILTER, SINGLE_FILTER] | None
+    b_data: list[tuple[int, list[str]]]
+    ngram_statistics: PyNGramStatistics | None
+    config_modifier: Callable[[TranslationConfig, ldatranslate.PyTopicModel, PyDictionary], ldatranslate.PyTranslationConfig] | None
+    min_not_nan: int | float | None
+    dictionaries: tuple[PyDictionary, PyDictionary] | None = None
+    """Loaded by the first translation, the cache of the filtered dictionaries is filled after the fork."""
+
+    def get_dictionaries(self, dictionary_cache: Path | None) -> tuple[PyDictionary, PyDictionary]:
+        if self.dictionaries is None:
+            self.dictionaries = _load_dictionaries(self.dictionary, self.filters) if dictionary_cache is None \
+                else _load_cached_dictionaries(dictionary_cache)
+        return self.dictionaries
+
+
+_worker_state: _TranslationWorkerState | None = None
+
+
+def _load_dictionaries(
+        dictionary: PyDictionary | Path | PathLike | str,
+        filters: tuple[SINGLE_FILTER, SINGLE_FILTER] | None
+) -> tuple[PyDictionary, PyDictionary]:
     if filters is None:
         def _default(_word: str, _meta: LoadedMetadataEx | None) -> bool:
             return True
@@ -143,74 +208,346 @@ def translate_models(
         MetaField.Registers,
         MetaField.UnalteredVocabulary
     )
+    return d1, d2
 
-    original_model, topic_model = out_dir.load_original_models()
 
-    test_data = Path(test_data)
-    loaded_data = []
-    with test_data.open("r", encoding="UTF-8") as inp:
-        l_a = str(lang_a)
-        l_b = str(lang_b)
-        for value in inp:
-            dat: TokenizedValue = jsonpickle.loads(value)
-            loaded_data.append((dat.id, dat.entries[l_a].tokenized, dat.entries[l_b].tokenized))
+@dataclasses.dataclass(frozen=True, slots=True)
+class FilterIdentity:
+    """
+    The declared identity of the dictionary filters, used for the cache of the filtered dictionaries.
+    The code of the filter functions and the values they capture are part of the fingerprint as well,
+    but functions called by the filters are not.
+    """
+    name: str
+    parameters: typing.Mapping[str, typing.Any] = dataclasses.field(default_factory=dict)
 
-    if limit is not None:
-        loaded_data.sort(key=lambda x: x[0])
-        loaded_data = loaded_data[:limit]
-        print(f'Limited to {len(loaded_data)}')
-    a_data = []
-    b_data = []
-    for entry in loaded_data:
-        a_data.append((entry[0], entry[1]))
-        b_data.append((entry[0], entry[2]))
-    del loaded_data
-    assert a_data is not None and len(a_data) > 0
-    assert b_data is not None and len(b_data) > 0
 
-    a_ratings = create_ratings(topic_model, original_model.alpha, 0.01, a_data)
+# Increase if the filtering in _load_dictionaries changes.
+FILTERED_DICTIONARY_VERSION = 1
 
-    with open(out_dir.translation_rating_path(), "w") as f:
-        f.write(jsonpickle.dumps(a_ratings))
 
-    for config in my_configs:
-        print(f"Translate: {config.config_id}")
-        targ = out_dir.load_single(config.config_id)
+def _normalized_code(code: types.CodeType) -> types.CodeType:
+    # The name and the position in the file are not part of the filter.
+    return code.replace(
+        co_name='',
+        co_qualname='',
+        co_filename='',
+        co_firstlineno=1,
+        co_linetable=b'',
+        co_consts=tuple(_normalized_code(c) if isinstance(c, types.CodeType) else c for c in code.co_consts)
+    )
 
-        if targ.model_path.exists():
-            print(f"{config.config_id} already translated. Skipping!")
-            continue
 
-        config.alpha = original_model.alpha
-        if config.limited_dictionary:
-            d = d2
-        else:
-            d = d1
+def _update_code_digest(digest: 'hashlib._Hash', value: typing.Any):
+    if isinstance(value, types.FunctionType):
+        digest.update(marshal.dumps(_normalized_code(value.__code__)))
+        for cell in value.__closure__ or ():
+            _update_code_digest(digest, cell.cell_contents)
+    elif isinstance(value, (tuple, list)):
+        for entry in value:
+            _update_code_digest(digest, entry)
+    else:
+        digest.update(repr(value).encode('utf-8'))
+
+
+def filtered_dictionary_fingerprint(
+        dictionary_path: Path | PathLike | str,
+        filters: tuple[SINGLE_FILTER, SINGLE_FILTER] | None,
+        identity: FilterIdentity
+) -> str:
+    """
+    The fingerprint of the dictionary file, the filter identity and the code of the filters.
+    """
+    with Path(dictionary_path).open('rb') as f:
+        digest = hashlib.file_digest(f, 'sha256')
+    digest.update(json.dumps(
+        {"version": FILTERED_DICTIONARY_VERSION, "name": identity.name, "parameters": identity.parameters},
+        sort_keys=True, default=str
+    ).encode('utf-8'))
+    _update_code_digest(digest, filters)
+    _update_code_digest(digest, _filter_iate_and_msterms_wrapper)
+    return digest.hexdigest()
+
+
+def _cached_dictionary_paths(directory: Path) -> tuple[Path, Path, Path]:
+    return directory / "primary.dat.zst", directory / "limited.dat.zst", directory / "info.json"
+
+
+def _is_cached(directory: Path, fingerprint: str) -> bool:
+    primary, limited, info = _cached_dictionary_paths(directory)
+    try:
+        return json.loads(info.read_text(encoding='utf-8'))["fingerprint"] == fingerprint \
+            and primary.exists() and limited.exists()
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def _save_cached_dictionaries(
+        directory: Path,
+        fingerprint: str,
+        identity: FilterIdentity,
+        dictionaries: tuple[PyDictionary, PyDictionary]
+):
+    """
+    The info is written last and marks a complete entry.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    *targets, info = _cached_dictionary_paths(directory)
+    info.unlink(missing_ok=True)
+    for d, target in zip(dictionaries, targets):
+        tmp = target.with_name(f"{target.name.split('.')[0]}.{os.getpid()}.tmp.dat.zst")
+        d.save(tmp)
+        os.replace(tmp, target)
+    info.write_text(json.dumps(
+        {"fingerprint": fingerprint, "name": identity.name, "parameters": identity.parameters},
+        indent=2, default=str
+    ), encoding='utf-8')
+
+
+def _load_cached_dictionaries(directory: Path) -> tuple[PyDictionary, PyDictionary]:
+    primary, limited, _ = _cached_dictionary_paths(directory)
+    return PyDictionary.load(primary), PyDictionary.load(limited)
+
+
+def _prepare_dictionary_cache(
+        out_dir: DataDirectory,
+        dictionary: PyDictionary | Path | PathLike | str,
+        dictionary_path: Path | PathLike | str | None,
+        filters: tuple[SINGLE_FILTER, SINGLE_FILTER] | None,
+        filter_identity: FilterIdentity | None
+) -> Path | None:
+    """
+    Returns the cache directory of the filtered dictionaries and fills it if necessary.
+    None if the dictionary has no file or the filters have no identity.
+    """
+    if dictionary_path is None and not isinstance(dictionary, PyDictionary):
+        dictionary_path = dictionary
+    if dictionary_path is None:
+        return None
+    if filter_identity is None:
+        if filters is not None:
+            return None
+        filter_identity = FilterIdentity("default")
+    fingerprint = filtered_dictionary_fingerprint(dictionary_path, filters, filter_identity)
+    directory = out_dir.filtered_dictionary_path(fingerprint)
+    if _is_cached(directory, fingerprint):
+        print(f"Use the cached filtered dictionaries of {filter_identity.name}.")
+    else:
+        print(f"Filter the dictionaries of {filter_identity.name} for the cache.")
+        _save_cached_dictionaries(directory, fingerprint, filter_identity, _load_dictionaries(dictionary, filters))
+    return directory
+
+
+def _init_translation_worker(
+        lang_a: str,
+        lang_b: str,
+        out_dir: DataDirectory,
+        configs: list[TranslationConfig],
+        dictionary: PyDictionary | Path | PathLike | str,
+        filters: tuple[SINGLE_FILTER, SINGLE_FILTER] | None,
+        test_data: Path | PathLike | str,
+        limit: int | None,
+        ngram_statistics: PyNGramStatistics | None,
+        config_modifier: Callable[[TranslationConfig, ldatranslate.PyTopicModel, PyDictionary], ldatranslate.PyTranslationConfig] | None,
+        min_not_nan: int | float | None
+):
+    """
+    Loads everything a translation needs once per worker. The arguments are inherited by fork and not pickled.
+    """
+    global _worker_state
+    original_model, topic_model = out_dir.load_original_models()
+    _, b_data = load_test_data(lang_a, lang_b, test_data, limit)
+    _worker_state = _TranslationWorkerState(
+        out_dir=out_dir,
+        configs=configs,
+        original_model=original_model,
+        topic_model=topic_model,
+        dictionary=dictionary,
+        filters=filters,
+        b_data=b_data,
+        ngram_statistics=ngram_statistics,
+        config_modifier=config_modifier,
+        min_not_nan=min_not_nan
+    )
 
-        if config_modifier is not None:
-            cfg = config_modifier(config, topic_model, d)
+
+def _release_translation_worker():
+    global _worker_state
+    _worker_state = None
+
+
+def _translate_single(index: int, dictionary_cache: Path | None) -> tuple[str, str | None, bool]:
+    """
+    Translates and rates configs[index] in a staging directory and moves it to the translations when it is complete.
+    Returns the config id, the traceback of a failure and if the failure was a DefectModelError.
+    """
+    state = _worker_state
+    assert state is not None, "The worker was not initialized!"
+    config = state.configs[index]
+    staging = state.out_dir.translation_staging_path() / f"{config.config_id}.{os.getpid()}"
+    try:
+        if staging.exists():
+            shutil.rmtree(staging)
+        targ = LazyLoadingEntry(staging)
+
+        config.alpha = state.original_model.alpha
+        dictionaries = state.get_dictionaries(dictionary_cache)
+        d = dictionaries[1] if config.limited_dictionary else dictionaries[0]
+        if state.config_modifier is not None:
+            cfg = state.config_modifier(config, state.topic_model, d)
         else:
             cfg = config.to_translation_config()
 
-        translated = translate_topic_model(topic_model, d, config.voting, cfg, None, None, ngram_statistics)
-
-        print("Save config json.")
-        config_pickle = jsonpickle.dumps(config)
-        cfg_json = targ.config_path
-        cfg_json.write_text(config_pickle)
-        print("Save translation.")
+        translated = translate_topic_model(state.topic_model, d, config.voting, cfg, None, None, state.ngram_statistics)
+        _check_nans(translated, state.min_not_nan)
+        targ.config_path.write_text(jsonpickle.dumps(config))
         translated.save_binary(targ.model_path)
-        _check_nans(translated, min_not_nan)
-        # translated.show_top(10)
-        print("Create ratings.")
-        b_ratings = create_ratings(translated, original_model.alpha, 0.01, b_data)
-        assert len(b_ratings) == len(b_data)
-        print("Save ratings json.")
-        ldatranslate.save_ratings(targ.rating_path, b_ratings)
+        b_ratings = create_ratings_batched(translated, state.original_model.alpha, 0.01, state.b_data)
+        assert len(b_ratings) == len(state.b_data)
+        b_ratings.save(targ.rating_array_path)
         del b_ratings
         del translated
-        del cfg_json
-        del config_pickle
-        print("Translate next after cleanup.")
-    print("Finished translating!")
 
+        final = state.out_dir.translations_path() / config.config_id
+        if final.exists():
+            # Only unfinished translations are translated again.
+            shutil.rmtree(final)
+        os.replace(staging, final)
+    except Exception as e:
+        shutil.rmtree(staging, ignore_errors=True)
+        return config.config_id, traceback.format_exc(), isinstance(e, DefectModelError)
+    return config.config_id, None, False
+
+
+def translate_models(
+        lang_a: str,
+        lang_b: str,
+        out_dir: DataDirectory,
+        dictionary: PyDictionary | Path | PathLike | str,
+        ngram_statistics: PyNGramStatistics | None,
+        test_data: Path | PathLike | str,
+        limit: int | None,
+        filters: tuple[SINGLE_FILTER, SINGLE_FILTER] | None,
+        configs: typing.Collection[TranslationConfig] | Callable[[], typing.Collection[TranslationConfig]],
+        config_modifier: Callable[[TranslationConfig, ldatranslate.PyTopicModel, PyDictionary], ldatranslate.PyTranslationConfig] | None,
+        min_not_nan: int | float | None = None,
+        workers: int | None = 1,
+        dictionary_path: Path | PathLike | str | None = None,
+        filter_identity: FilterIdentity | None = None,
+) -> dict[str, str]:
+    """
+    Translates and rates every config that is not translated yet, with workers processes (None uses all cores).
+    A translation is written to the staging directory and moved to its directory when it is complete.
+    A failing config does not stop the others, the failures are returned as config id -> traceback.
+    If a config produced a defect model a DefectModelError is raised after all configs are finished.
+    The worker processes are forked before this process uses ldatranslate for the ratings and the filtering,
+    threads of ldatranslate do not survive a fork.
+    The filtered dictionaries are cached in the shareable paths of out_dir if the dictionary has a file
+    (dictionary_path or dictionary itself) and the filters are the default or have a filter_identity.
+    """
+    if callable(configs):
+        my_configs = configs()
+    else:
+        my_configs = configs
+
+    pending = [config for config in my_configs if not out_dir.is_translated(config.config_id)]
+    if not pending:
+        print(f"Everything is already translated!")
+        return {}
+    print(f"{len(my_configs) - len(pending)} of {len(my_configs)} configs are already translated.")
+    # Leftovers of workers that died in a previous run.
+    shutil.rmtree(out_dir.translation_staging_path(), ignore_errors=True)
+    # The workers move the finished translations into it.
+    out_dir.translations_path().mkdir(parents=True, exist_ok=True)
+
+    initargs = (
+        lang_a, lang_b, out_dir, pending, dictionary, filters, test_data, limit,
+        ngram_statistics, config_modifier, min_not_nan
+    )
+    workers = min(workers if workers is not None else (os.cpu_count() or 1), len(pending))
+    pool: ProcessPoolExecutor | None = None
+    if workers > 1:
+        print(f"Translate {len(pending)} configs with {workers} processes.")
+        # The workers would create the columnar cache of the test data at the same time.
+        ColumnarTestData.load_or_create(test_data)
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_translation_worker,
+            initargs=initargs
+        )
+        # With fork all workers are started by the first submit.
+        pool.submit(os.getpid)
+    try:
+        return _translate_pending(
+            lang_a, lang_b, out_dir, dictionary, test_data, limit, filters, dictionary_path, filter_identity,
+            pending, initargs, pool
+        )
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def _translate_pending(
+        lang_a: str,
+        lang_b: str,
+        out_dir: DataDirectory,
+        dictionary: PyDictionary | Path | PathLike | str,
+        test_data: Path | PathLike | str,
+        limit: int | None,
+        filters: tuple[SINGLE_FILTER, SINGLE_FILTER] | None,
+        dictionary_path: Path | PathLike | str | None,
+        filter_identity: FilterIdentity | None,
+        pending: list[TranslationConfig],
+        initargs: tuple,
+        pool: ProcessPoolExecutor | None
+) -> dict[str, str]:
+    original_model, topic_model = out_dir.load_original_models()
+
+    a_data, _ = load_test_data(lang_a, lang_b, test_data, limit)
+
+    a_ratings = create_ratings_batched(topic_model, original_model.alpha, 0.01, a_data)
+    a_ratings.save(out_dir.translation_rating_array_path())
+    del a_ratings
+    del a_data
+
+    dictionary_cache = _prepare_dictionary_cache(out_dir, dictionary, dictionary_path, filters, filter_identity)
+
+    failures: dict[str, str] = {}
+    defects: list[str] = []
+
+    def _collect(done: int, result: tuple[str, str | None, bool]):
+        config_id, error, defect = result
+        if error is None:
+            print(f"({done}/{len(pending)}) Translated {config_id}.")
+            return
+        failures[config_id] = error
+        if defect:
+            defects.append(config_id)
+        print(f"({done}/{len(pending)}) Failed to translate {config_id}:\n{error}")
+
+    if pool is None:
+        _init_translation_worker(*initargs)
+        try:
+            for index, config in enumerate(pending):
+                print(f"Translate: {config.config_id}")
+                _collect(index + 1, _translate_single(index, dictionary_cache))
+        finally:
+            _release_translation_worker()
+    else:
+        futures = {
+            pool.submit(_translate_single, index, dictionary_cache): pending[index].config_id
+            for index in range(len(pending))
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                result = future.result()
+            except Exception:
+                # The worker died, e.g. by a panic of the translation.
+                result = futures[future], traceback.format_exc(), False
+            _collect(done, result)
+
+    print(f"Finished translating! {len(pending) - len(failures)} of {len(pending)} configs were translated.")
+    if defects:
+        raise DefectModelError(f"Defect models: {', '.join(defects)}")
+    return failures
@@ -0,0 +1,118 @@
+# Copyright 2024 Felix Engl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import math
+import time
+import typing
+from os import PathLike
+from pathlib import Path
+from typing import TypedDict
+
+from ptmt.lda.inference import DEFAULT_CHUNK_SIZE, DEFAULT_MAX_CHUNK_ELEMENTS
+from ptmt.lda.topic_model import SimpleTopicModel
+from ptmt.research.dirs import DataDirectory
+from ptmt.research.tmt1.toolkit.model_translation import load_test_data
+
+"""
+The held-out perplexity of the original model on the test documents of lang_a and of every
+translated model on the test documents of lang_b. The results are stored next to the NDCG files:
+
+root_dir/translation
+ ├ perplexity_original.json
+ └ translations/<config_id>/perplexity.json
+
+{"log_perplexity": float, "perplexity": float, "documents": int, "words": int, "oov": int, "wall_time": float}
+"""
+
+
+class PerplexityKwArgs(TypedDict, total=False):
+    iterations: int
+    workers: int | None
+    chunk_size: int
+    max_chunk_elements: int
+    ignore_existing_file: bool
+
+
+def evaluate_perplexity(
+        model: SimpleTopicModel,
+        docs: typing.Sequence[tuple[int, list[str]]],
+        iterations: int = 1000,
+        workers: int | None = 1,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_chunk_elements: int = DEFAULT_MAX_CHUNK_ELEMENTS
+) -> dict[str, typing.Any]:
+    start = time.perf_counter()
+    csr, oov = model.docs2csr(tokens for _, tokens in docs)
+    bound = model.log_perplexity(
+        csr, iterations=iterations, workers=workers, chunk_size=chunk_size, max_chunk_elements=max_chunk_elements
+    )
+    return {
+        "log_perplexity": bound,
+        "perplexity": math.pow(2.0, -bound) if math.isfinite(bound) else None,
+        "documents": csr.shape[0],
+        "words": int(csr.data.sum()),
+        "oov": int(oov.sum()),
+        "wall_time": time.perf_counter() - start
+    }
+
+
+def _save(path: Path, result: dict[str, typing.Any]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(result, indent=2), encoding='utf-8')
+    tmp.replace(path)
+
+
+def calculate_perplexities(
+        lang_a: str,
+        lang_b: str,
+        data_dir: DataDirectory,
+        test_data: Path | PathLike | str,
+        limit: int | None,
+        iterations: int = 1000,
+        workers: int | None = 1,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_chunk_elements: int = DEFAULT_MAX_CHUNK_ELEMENTS,
+        ignore_existing_file: bool = False
+):
+    """
+    Uses the same test documents as the ratings, see translate_models.
+    The translated models are inferred with the alpha of the original model.
+    Existing files are skipped unless ignore_existing_file is set.
+    """
+    kwargs = dict(iterations=iterations, workers=workers, chunk_size=chunk_size, max_chunk_elements=max_chunk_elements)
+    original_path = data_dir.translation_perplexity_path()
+    pending = [
+        entry for entry in data_dir.iter_all_translations()
+        if entry.model_path.exists() and (ignore_existing_file or not entry.perplexity_path.exists())
+    ]
+    if original_path.exists() and not ignore_existing_file and not pending:
+        print("All perplexities are already calculated!")
+        return
+
+    a_data, b_data = load_test_data(lang_a, lang_b, test_data, limit)
+    original_model, _ = data_dir.load_original_models()
+
+    if ignore_existing_file or not original_path.exists():
+        result = evaluate_perplexity(SimpleTopicModel.topics_of_tomotopy(original_model), a_data, **kwargs)
+        _save(original_path, result)
+        print(f"Perplexity original: {result['perplexity']} ({result['wall_time']:.1f}s)")
+
+    for i, entry in enumerate(pending, start=1):
+        model = SimpleTopicModel.from_py_topic_model(entry.model_uncached, original_model.alpha)
+        result = evaluate_perplexity(model, b_data, **kwargs)
+        del model
+        _save(entry.perplexity_path, result)
+        print(f"({i}/{len(pending)}) Perplexity {entry.name}: {result['perplexity']} ({result['wall_time']:.1f}s)")
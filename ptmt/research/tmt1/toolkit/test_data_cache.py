@@ -0,0 +1,266 @@
+# Copyright 2024 Felix Engl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import enum
+import hashlib
+import json
+import sys
+import typing
+from os import PathLike
+from pathlib import Path
+
+import jsonpickle
+import numpy as np
+import numpy.typing as npt
+import scipy.sparse
+
+# noinspection PyProtectedMember
+from ptmt.lda.topic_model import SimpleTopicModel, _pack_vocabulary, _unpack_vocabulary
+from ptmt.research.tmt1.toolkit.data_creator import TokenizedValue
+
+"""
+A columnar copy of a test .bulkjson, stored next to it in <name>.columns:
+
+test.bulkjson.columns
+ ├ ids.npy                          the article ids in the order of the file
+ ├ <lang>.tokens.npy                the token ids of all articles (int32)
+ ├ <lang>.offsets.npy               the tokens of article i are tokens[offsets[i]:offsets[i+1]]
+ ├ <lang>.vocabulary.utf8.npy       the packed token vocabulary
+ ├ <lang>.vocabulary.offsets.npy
+ └ data.info                        written last, size, mtime and sha256 of the .bulkjson
+
+The cache is valid if the size of the .bulkjson is unchanged and either the mtime or the hash matches.
+"""
+
+
+class ColumnarTestData:
+    VERSION = 1
+
+    class Target(enum.StrEnum):
+        IDS = "ids.npy"
+        INFO = "data.info"
+
+    @staticmethod
+    def _language_target(language: str, name: str) -> str:
+        return f"{language}.{name}.npy"
+
+    def __init__(self, path: Path, languages: typing.Iterable[str]):
+        self.path = path
+        self.languages = tuple(languages)
+        self.ids: npt.NDArray[np.int64] = np.load(path / ColumnarTestData.Target.IDS)
+        self._vocabularies: dict[str, tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def cache_path(test_data: Path | PathLike | str) -> Path:
+        test_data = Path(test_data)
+        return test_data.with_name(test_data.name + ".columns")
+
+    @staticmethod
+    def _digest(path: Path) -> str:
+        with path.open('rb') as f:
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+
+    @classmethod
+    def create(cls, test_data: Path | PathLike | str) -> 'ColumnarTestData':
+        """
+        Decodes the .bulkjson once and writes the columns, all languages of the articles are stored.
+        Raises a ValueError if the articles do not have the same languages.
+        """
+        test_data = Path(test_data)
+        path = cls.cache_path(test_data)
+        path.mkdir(parents=True, exist_ok=True)
+        info_path = path / ColumnarTestData.Target.INFO
+        info_path.unlink(missing_ok=True)
+        stat = test_data.stat()
+
+        ids: list[int] = []
+        token2id: dict[str, dict[str, int]] = {}
+        tokens: dict[str, list[int]] = {}
+        lengths: dict[str, list[int]] = {}
+        with test_data.open("r", encoding="UTF-8") as inp:
+            for value in inp:
+                if not value.strip():
+                    continue
+                dat: TokenizedValue = jsonpickle.loads(value)
+                if not ids:
+                    for language in dat.entries:
+                        token2id[language], tokens[language], lengths[language] = {}, [], []
+                if dat.entries.keys() != token2id.keys():
+                    raise ValueError(f"The article {dat.id} has other languages than the first article!")
+                ids.append(dat.id)
+                for language, collection in dat.entries.items():
+                    vocabulary = token2id[language]
+                    tokens[language].extend(vocabulary.setdefault(word, len(vocabulary)) for word in collection.tokenized)
+                    lengths[language].append(len(collection.tokenized))
+
+        np.save(path / ColumnarTestData.Target.IDS, np.asarray(ids, dtype=np.int64))
+        for language, vocabulary in token2id.items():
+            offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+            np.cumsum(np.asarray(lengths[language], dtype=np.int64), out=offsets[1:])
+            np.save(path / cls._language_target(language, "tokens"), np.asarray(tokens[language], dtype=np.int32))
+            np.save(path / cls._language_target(language, "offsets"), offsets)
+            blob, word_offsets = _pack_vocabulary(vocabulary)
+            np.save(path / cls._language_target(language, "vocabulary.utf8"), blob)
+            np.save(path / cls._language_target(language, "vocabulary.offsets"), word_offsets)
+
+        info_path.write_text(json.dumps({
+            "version": ColumnarTestData.VERSION,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": cls._digest(test_data),
+            "languages": list(token2id.keys()),
+        }), encoding='utf-8')
+        return cls(path, token2id.keys())
+
+    @classmethod
+    def load(cls, test_data: Path | PathLike | str) -> 'ColumnarTestData | None':
+        """
+        Returns None if there is no complete cache or if the .bulkjson changed.
+        """
+        test_data = Path(test_data)
+        path = cls.cache_path(test_data)
+        info_path = path / ColumnarTestData.Target.INFO
+        if not info_path.exists() or not test_data.exists():
+            return None
+        info = json.loads(info_path.read_text(encoding='utf-8'))
+        if info["version"] != ColumnarTestData.VERSION:
+            return None
+        stat = test_data.stat()
+        if stat.st_size != info["size"]:
+            return None
+        if stat.st_mtime_ns != info["mtime_ns"]:
+            # Only touched, e.g. by a copy.
+            if cls._digest(test_data) != info["sha256"]:
+                return None
+            info["mtime_ns"] = stat.st_mtime_ns
+            info_path.write_text(json.dumps(info), encoding='utf-8')
+        return cls(path, info["languages"])
+
+    @classmethod
+    def load_or_create(cls, test_data: Path | PathLike | str) -> 'ColumnarTestData | None':
+        """
+        Returns None if the cache can not be written or the articles do not have the same languages,
+        the caller should read the .bulkjson instead.
+        """
+        if (loaded := cls.load(test_data)) is not None:
+            return loaded
+        try:
+            print(f"Create the columnar cache of {test_data}")
+            return cls.create(test_data)
+        except (OSError, ValueError) as e:
+            print(f"Failed to create the columnar cache of {test_data}: {e}", file=sys.stderr)
+            return None
+
+    def select(self, limit: int | None = None) -> npt.NDArray[np.intp]:
+        """
+        The indices of the articles in the order of the file, with a limit the limit articles with the smallest ids.
+        """
+        if limit is None:
+            return np.arange(len(self.ids))
+        return np.argsort(self.ids, kind='stable')[:limit]
+
+    def vocabulary(self, language: str) -> tuple[str, ...]:
+        if language not in self._vocabularies:
+            self._vocabularies[language] = _unpack_vocabulary(
+                np.load(self.path / self._language_target(language, "vocabulary.utf8")),
+                np.load(self.path / self._language_target(language, "vocabulary.offsets"))
+            )
+        return self._vocabularies[language]
+
+    def _columns(self, language: str) -> tuple[npt.NDArray[np.int32], npt.NDArray[np.int64]]:
+        assert language in self.languages, f"There is no language {language} in the test data!"
+        return (
+            np.load(self.path / self._language_target(language, "tokens"), mmap_mode='r'),
+            np.load(self.path / self._language_target(language, "offsets"))
+        )
+
+    @staticmethod
+    def _gather(
+            tokens: npt.NDArray[np.int32],
+            offsets: npt.NDArray[np.int64],
+            indices: npt.NDArray[np.intp]
+    ) -> tuple[npt.NDArray[np.int32], npt.NDArray[np.int64]]:
+        """
+        The tokens of the articles indices and the lengths of the articles.
+        """
+        starts = offsets[indices]
+        lengths = offsets[indices + 1] - starts
+        ends = np.cumsum(lengths)
+        positions = np.arange(int(ends[-1]) if len(ends) else 0) + np.repeat(starts - (ends - lengths), lengths)
+        return tokens[positions], lengths
+
+    def documents(self, language: str, indices: npt.NDArray[np.intp] | None = None) -> list[tuple[int, list[str]]]:
+        """
+        The articles as (id, tokens) like the .bulkjson loaders.
+        """
+        if indices is None:
+            indices = self.select()
+        tokens, offsets = self._columns(language)
+        words = np.array(self.vocabulary(language), dtype=object)
+        selected, lengths = self._gather(tokens, offsets, indices)
+        selected = words[selected].tolist()
+        bounds = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=bounds[1:])
+        bounds = bounds.tolist()
+        return [(i, selected[a:b]) for i, a, b in zip(self.ids[indices].tolist(), bounds, bounds[1:])]
+
+    def iter_csr(
+            self,
+            language: str,
+            model: SimpleTopicModel,
+            indices: npt.NDArray[np.intp] | None = None,
+            batch_size: int = 65536
+    ) -> typing.Iterator[tuple[npt.NDArray[np.int64], scipy.sparse.csr_matrix, npt.NDArray[np.int64]]]:
+        """
+        Yields (article ids, csr, oov) for batches of batch_size articles, csr and oov like model.docs2csr.
+        The vocabulary is mapped to the model once, the batches are built without python lists.
+        """
+        if indices is None:
+            indices = self.select()
+        tokens, offsets = self._columns(language)
+        id_map = np.fromiter(
+            (model.word2id.get(word, -1) for word in self.vocabulary(language)),
+            dtype=np.int64, count=len(self.vocabulary(language))
+        )
+        size = len(model.vocabulary)
+        for start in range(0, len(indices), batch_size):
+            batch = indices[start:start + batch_size]
+            selected, lengths = self._gather(tokens, offsets, batch)
+            word_ids = id_map[selected]
+            rows = np.repeat(np.arange(len(batch)), lengths)
+            known = word_ids >= 0
+            oov = np.bincount(rows[~known], minlength=len(batch)).astype(np.int64)
+            csr = scipy.sparse.csr_matrix(
+                (np.ones(int(known.sum()), dtype=model.dtype), (rows[known], word_ids[known])),
+                shape=(len(batch), size)
+            )
+            csr.sum_duplicates()
+            yield self.ids[batch], csr, oov
+
+    def csr(
+            self,
+            language: str,
+            model: SimpleTopicModel,
+            indices: npt.NDArray[np.intp] | None = None
+    ) -> tuple[npt.NDArray[np.int64], scipy.sparse.csr_matrix, npt.NDArray[np.int64]]:
+        """
+        All articles as one batch, see iter_csr.
+        """
+        if indices is None:
+            indices = self.select()
+        assert len(indices) > 0, "There are no articles!"
+        return next(self.iter_csr(language, model, indices, len(indices)))
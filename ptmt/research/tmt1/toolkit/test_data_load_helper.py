@@ -20,6 +20,7 @@ import jsonpickle
 from ldatranslate import LanguageHint
 
 from ptmt.research.tmt1.toolkit.data_creator import TokenizedValue
+from ptmt.research.tmt1.toolkit.test_data_cache import ColumnarTestData
 
 
 def load_test_data(
@@ -29,6 +30,12 @@ def load_test_data(
 ) -> dict[str, list[tuple[int, list[str]]]]:
     test_data = Path(test_data)
     languages = tuple(str(x if not isinstance(x, str) else LanguageHint(x)) for x in languages)
+    if (columns := ColumnarTestData.load_or_create(test_data)) is not None:
+        indices = columns.select(limit)
+        if limit is not None:
+            print(f'Limited to {len(indices)}')
+        return {language: columns.documents(language, indices) for language in languages}
+
     loaded_data = []
     with test_data.open("r", encoding="UTF-8") as inp:
 
@@ -44,20 +44,18 @@ class TM_Output_FileSystem(TM_Output):
         return (self._p / path).open('w', encoding='utf-8')
 
 
-class _TextIO(io.StringIO):
-    _z: zipfile.ZipFile
+class _TextIO(io.TextIOWrapper):
+    """
+    Streams the text into the zip member, it is encoded and written in blocks of BLOCK_SIZE bytes.
+    """
+    BLOCK_SIZE = 1024 * 1024
 
     def __init__(self, z: zipfile.ZipFile, path: str):
-        self._z: zipfile.ZipFile = z
-        self._p = path
-        super().__init__()
-
-    def __enter__(self):
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self._z.writestr(self._p, self.getvalue().encode(encoding='UTF-8'))
-        super().__exit__(exc_type, exc_val, exc_tb)
+        super().__init__(
+            io.BufferedWriter(z.open(path, mode='w', force_zip64=True), buffer_size=_TextIO.BLOCK_SIZE),
+            encoding='UTF-8',
+            newline='\n'
+        )
 
 
 class TM_Output_Zip(TM_Output):
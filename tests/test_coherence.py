@@ -0,0 +1,54 @@
+# Copyright 2024 Felix Engl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gensim
+import numpy as np
+import pytest
+
+from ptmt.lda.coherence import CoherenceEngine, Approximation
+
+
+def _engine(num_docs: int = 300, vocabulary: int = 400, seed: int = 3) -> CoherenceEngine:
+    rng = np.random.default_rng(seed)
+    p = 1 / np.arange(1, vocabulary + 1)
+    p /= p.sum()
+    texts = [[f"w{i}" for i in rng.choice(vocabulary, size=rng.integers(20, 60), p=p)] for _ in range(num_docs)]
+    dictionary = gensim.corpora.Dictionary(texts)
+    words = sorted(dictionary.token2id, key=lambda word: int(word[1:]))
+    # Every 15th word, the topics contain rare words that are missing in small samples.
+    return CoherenceEngine(texts, dictionary, {"model": [words[i::15][:10] for i in range(5)]}, topn=10)
+
+
+def test_interval_of_whole_corpus_brackets_exact_value():
+    engine = _engine()
+    exact = engine.calculate()["model"]
+    estimated = engine.estimate(Approximation(sample_size=300, block_size=10))["model"]
+    for measure, value in estimated.items():
+        assert np.isfinite([value, value.low, value.high]).all(), measure
+        assert value.low - 1e-9 <= exact[measure] <= value.high + 1e-9, measure
+        assert float(value) == pytest.approx(exact[measure], abs=1e-9)
+
+
+def test_small_sample_is_finite():
+    engine = _engine()
+    estimated = engine.estimate(Approximation(sample_size=100, block_size=10))["model"]
+    for measure, value in estimated.items():
+        assert np.isfinite([value, value.low, value.high]).all(), measure
+        assert value.low <= value.high
+
+
+def test_adaptive_sampling_stops_at_target_width():
+    engine = _engine()
+    estimated = engine.estimate(Approximation(sample_size=50, block_size=10, target_width=1e9))["model"]
+    assert all(value.sample_size == 50 for value in estimated.values())
@@ -0,0 +1,60 @@
+# Copyright 2024 Felix Engl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+import tomotopy as tp
+
+pytest.importorskip("ldatranslate")
+
+from ldatranslate.convert_tomotopy_lda import tomotopy_to_topic_model
+
+from ptmt.research.lda_model import create_ratings, create_ratings_batched
+
+
+def _dense(topics: list[tuple[int, float]], k: int) -> np.ndarray:
+    values = np.zeros(k)
+    for topic, probability in topics:
+        values[topic] = probability
+    return values
+
+
+def test_batched_ratings_match_create_ratings_of_translated_model():
+    rng = np.random.default_rng(7)
+    mdl = tp.LDAModel(k=4, seed=7)
+    # Every document is mostly from one of four blocks of words, the inference has a single optimum.
+    for _ in range(200):
+        block = rng.integers(0, 4)
+        mdl.add_doc(
+            [f"w{block * 15 + i}" for i in rng.integers(0, 15, size=40)] + [f"w{i}" for i in rng.integers(0, 60, size=5)]
+        )
+    mdl.train(200)
+    topic_model = tomotopy_to_topic_model(mdl, 'en')
+    # Two english words share one german word, the topics of the translated model are not normalized.
+    translated = topic_model.translate_by_provided_word_lists(
+        'de', [f"d{int(str(word)[1:]) // 2}" for word in topic_model.vocabulary()]
+    )
+    blocks = rng.integers(0, 4, size=20)
+    documents = [
+        (doc_id, [f"d{(block * 15 + i) // 2}" for i in rng.integers(0, 15, size=50)])
+        for doc_id, block in enumerate(blocks.tolist())
+    ]
+
+    expected = create_ratings(translated, mdl.alpha, 1E-8, documents)
+    batched = create_ratings_batched(translated, mdl.alpha, 1E-8, documents)
+
+    assert len(batched) == len(expected)
+    for (doc_id, topics), (batched_id, batched_topics) in zip(expected, batched.to_rating()):
+        assert batched_id == doc_id
+        assert _dense(batched_topics, translated.k) == pytest.approx(_dense(topics, translated.k), abs=1E-4)